@@ -0,0 +1,80 @@
+"""
+Benchmark of memory archive search latency and recall as an agent's history grows
+
+    python -m benchmarks.bench_archive --sizes 1000,10000,100000 --segment 64 --probe 4
+
+Turns are synthetic embeddings drawn around a few topic centres, one topic per segment,
+mimicking how neighbouring turns of a conversation share a subject. For each history
+size it seals the turns into a local object store and reports:
+  cold    first search from a fresh archive (lists metas, opens segments from disk)
+  warm    searches once metas and segments are cached
+  recall  overlap of the top-k with an exhaustive search over every archived turn
+
+Recall falls once a topic spans many more segments than are probed; raise --probe
+(ARCHIVE_PROBE_SEGMENTS) to trade latency for it.
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+
+from server.core.archive import LocalObjectStore, MemoryArchive
+
+
+def run(sizes: List[int], dim: int, segment: int, probe: int, topics: int, k: int, queries: int, seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((topics, dim)).astype(np.float32)
+    print(f"{'turns':>8} {'segments':>9} {'seal s':>8} {'cold ms':>8} {'warm p50':>9} {'warm p95':>9} {'recall':>7}")
+    for size in sizes:
+        store = LocalObjectStore(tempfile.mkdtemp(prefix="bench-archive-"))
+        writer = MemoryArchive(store, hot_turns=0, segment_turns=segment)
+        vectors = np.empty((size, dim), dtype=np.float32)
+        start = time.perf_counter()
+        for first in range(0, size, segment):
+            rows = slice(first, min(size, first + segment))
+            count = rows.stop - rows.start
+            vectors[rows] = centres[rng.integers(topics)] + 0.6 * rng.standard_normal((count, dim))
+            writer.seal("bench-agent", [f"turn {i}" for i in range(rows.start, rows.stop)], vectors[rows])
+        sealed = time.perf_counter() - start
+
+        unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        probes = [centres[rng.integers(topics)] + 0.6 * rng.standard_normal(dim) for _ in range(queries)]
+
+        reader = MemoryArchive(store, hot_turns=0, segment_turns=segment, probe_segments=probe)
+        start = time.perf_counter()
+        reader.search("bench-agent", probes[0], k)
+        cold = (time.perf_counter() - start) * 1000
+
+        warm, found = [], 0
+        for query in probes:
+            reader.search("bench-agent", query, k)  # Open the probed segments outside the timing
+            start = time.perf_counter()
+            hits = reader.search("bench-agent", query, k)
+            warm.append((time.perf_counter() - start) * 1000)
+            exact = np.argsort(-(unit @ (query / np.linalg.norm(query))))[:k]
+            found += len({f"turn {i}" for i in exact} & {text for _, text in hits})
+        warm.sort()
+        print(f"{size:>8} {-(-size // segment):>9} {sealed:>8.2f} {cold:>8.2f} {statistics.median(warm):>9.3f} "
+              f"{warm[int(len(warm) * 0.95) - 1]:>9.3f} {found / (k * queries):>7.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--segment", type=int, default=64)
+    parser.add_argument("--probe", type=int, default=4)
+    parser.add_argument("--topics", type=int, default=50)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run([int(s) for s in args.sizes.split(",")], args.dim, args.segment, args.probe, args.topics, args.k,
+        args.queries, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Offline benchmark of the embedding cache against the deterministic local embedder
+
+    python -m benchmarks.bench_embedding_cache --requests 2000 --vocab 300 --latency 0.05
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from server.core.embeddings import CachedEmbeddings, HashEmbeddings
+
+
+def run(requests: int, vocab: int, batch: int, latency: float, memory_size: int, seed: int) -> None:
+    rng = random.Random(seed)
+    corpus = [f"User: question {i} about token {i % 17}\nAI: answer number {i}" for i in range(vocab)]
+    # Zipf-like popularity: a few turns are re-embedded far more often than the rest
+    weights = [1.0 / (rank + 1) for rank in range(vocab)]
+    workload = [rng.choices(corpus, weights, k=batch) for _ in range(requests)]
+
+    uncached = HashEmbeddings(latency=latency)
+    start = time.perf_counter()
+    base_latencies = []
+    for texts in workload[: max(1, requests // 10)]:
+        t0 = time.perf_counter()
+        for text in texts:
+            uncached.embed_documents([text])
+        base_latencies.append(time.perf_counter() - t0)
+    base_elapsed = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = HashEmbeddings(latency=latency)
+        cache = CachedEmbeddings(model, memory_size=memory_size, path=os.path.join(tmp, "cache.sqlite3"))
+        latencies = []
+        start = time.perf_counter()
+        for texts in workload:
+            t0 = time.perf_counter()
+            cache.embed_documents(texts)
+            latencies.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - start
+
+    def pct(values, q):
+        return statistics.quantiles(values, n=100)[q - 1] * 1000 if len(values) > 1 else values[0] * 1000
+
+    print(f"uncached, one call per text ({len(base_latencies)} requests): "
+          f"p50={pct(base_latencies, 50):.2f}ms p99={pct(base_latencies, 99):.2f}ms "
+          f"model_calls={uncached.calls} total={base_elapsed:.2f}s")
+    print(f"cached, batched misses ({requests} requests): "
+          f"p50={pct(latencies, 50):.2f}ms p99={pct(latencies, 99):.2f}ms "
+          f"model_calls={model.calls} total={elapsed:.2f}s")
+    print(f"hit_rate={cache.hit_rate():.3f} stats={cache.stats}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--vocab", type=int, default=500, help="number of distinct texts")
+    parser.add_argument("--batch", type=int, default=20, help="texts per request (history window)")
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated seconds per model call")
+    parser.add_argument("--memory-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(args.requests, args.vocab, args.batch, args.latency, args.memory_size, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Sequential vs concurrent backend fan-out against the stub backends
+
+    python -m benchmarks.bench_fanout --eliza-latency 0.2 --tools-latency 0.3 --requests 20
+"""
+import argparse
+import statistics
+import time
+
+import requests
+
+from server.utils.fanout import fan_out
+from .stub_backends import StubBackends
+
+
+def run(eliza_latency: float, tools_latency: float, requests_count: int, tools_timeout: float) -> None:
+    stubs = StubBackends(eliza_latency=eliza_latency, tools_latency=tools_latency).start()
+    env = stubs.env()
+    eliza_url, tools_url = env["ELIZA_QUERY"] + "agent/message", env["TOOLS_QUERY"]
+    payload = {"text": "hello", "user": "user"}
+    payload2 = {"unique_id": "x", "query": "hello"}
+
+    try:
+        sequential = []
+        for _ in range(requests_count):
+            t0 = time.perf_counter()
+            requests.post(eliza_url, json=payload).json()
+            requests.post(tools_url, json=payload2).json()
+            sequential.append(time.perf_counter() - t0)
+
+        concurrent, partial = [], 0
+        for _ in range(requests_count):
+            t0 = time.perf_counter()
+            calls = fan_out({
+                "eliza": lambda: requests.post(eliza_url, json=payload),
+                "tools": lambda: requests.post(tools_url, json=payload2),
+            }, timeouts={"tools": tools_timeout})
+            concurrent.append(time.perf_counter() - t0)
+            partial += not all(call.ok for call in calls.values())
+    finally:
+        stubs.stop()
+
+    print(f"sequential: mean={statistics.mean(sequential) * 1000:.1f}ms max={max(sequential) * 1000:.1f}ms")
+    print(f"concurrent: mean={statistics.mean(concurrent) * 1000:.1f}ms max={max(concurrent) * 1000:.1f}ms "
+          f"partial={partial}/{requests_count}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eliza-latency", type=float, default=0.2)
+    parser.add_argument("--tools-latency", type=float, default=0.3)
+    parser.add_argument("--tools-timeout", type=float, default=30.0,
+                        help="lower than --tools-latency to exercise partial results")
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+    run(args.eliza_latency, args.tools_latency, args.requests, args.tools_timeout)
+
+
+if __name__ == "__main__":
+    main()
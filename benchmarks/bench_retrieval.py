@@ -0,0 +1,107 @@
+"""
+Microbenchmark of top-k retrieval engines across history sizes
+
+    python -m benchmarks.bench_retrieval --sizes 20,1000,100000 --dim 256
+
+For each size compares, per query:
+  langchain   the old path: build a langchain FAISS store from the history, then search
+  numpy       RetrievalEngine's in-place cosine top-k (state kept between queries)
+  numpy+bm25  the same with the BM25 prefilter
+  numpy+mmr   the same with MMR re-ranking
+  faiss       RetrievalEngine forced onto its FAISS index (built once, not timed per query)
+
+and reports how often numpy agrees with the langchain top-k.
+"""
+import argparse
+import random
+import statistics
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from server.core.embeddings import HashEmbeddings
+from server.core.retrieval import RetrievalEngine
+
+WORDS = ("price status order refund account agent deploy token wallet balance error login "
+         "update invoice schedule meeting ticket shipping delay password report").split()
+
+
+def corpus(size: int, rng: random.Random) -> List[str]:
+    return [f"User: {' '.join(rng.choices(WORDS, k=6))} #{i}\nAI: {' '.join(rng.choices(WORDS, k=12))}"
+            for i in range(size)]
+
+
+def timed(fn: Callable[[], object], repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def run(sizes: List[int], dim: int, k: int, queries: int, langchain_max: int, seed: int) -> None:
+    rng = random.Random(seed)
+    model = HashEmbeddings(dim=dim)
+    print(f"{'size':>8} {'engine':<12} {'ms/query':>10}")
+    for size in sizes:
+        texts = corpus(size, rng)
+        vectors = np.asarray(model.embed_documents(texts), dtype=np.float32)
+        probes = [" ".join(rng.choices(WORDS, k=4)) for _ in range(queries)]
+        probe_vectors = [model.embed_query(q) for q in probes]
+        repeats = max(3, min(50, 200000 // size))
+
+        engines: Dict[str, RetrievalEngine] = {
+            "numpy": RetrievalEngine(faiss_threshold=size + 1, prefilter_min=0),
+            "numpy+bm25": RetrievalEngine(faiss_threshold=size + 1, prefilter_min=1),
+            "numpy+mmr": RetrievalEngine(faiss_threshold=size + 1, prefilter_min=0, mmr_lambda=0.7),
+            "faiss": RetrievalEngine(faiss_threshold=1, prefilter_min=0),
+        }
+        for engine in engines.values():
+            engine.sync(texts, vectors)
+            engine.search(probe_vectors[0], k, probes[0])  # Build lazy state outside the timing
+
+        results = {}
+        if size <= langchain_max:
+            from langchain.vectorstores import FAISS
+
+            def langchain_search(i: int) -> List[int]:
+                store = FAISS.from_embeddings(list(zip(texts, vectors.tolist())), model)
+                row = {text: r for r, text in enumerate(texts)}
+                return [row[d.page_content] for d in store.similarity_search_by_vector(probe_vectors[i], k=k)]
+            results["langchain"] = timed(lambda: [langchain_search(i) for i in range(queries)], max(1, repeats // 5)) / queries
+            # Equal-scored turns may come back in either order, so compare the scores, not the rows
+            unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+            def top_scores(rows: List[int], i: int) -> List[float]:
+                return np.round(unit[rows] @ np.asarray(probe_vectors[i], dtype=np.float32), 5).tolist()
+            agree = sum(
+                top_scores(langchain_search(i), i) == top_scores(engines["numpy"].search(probe_vectors[i], k), i)
+                for i in range(queries)
+            )
+        for name, engine in engines.items():
+            results[name] = timed(lambda: [engine.search(probe_vectors[i], k, probes[i]) for i in range(queries)],
+                                  repeats) / queries
+
+        for name, ms in results.items():
+            print(f"{size:>8} {name:<12} {ms:>10.3f}")
+        if size <= langchain_max:
+            print(f"{size:>8} numpy matches langchain top-{k} on {agree}/{queries} queries")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="20,100,1000,10000,100000")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--langchain-max", type=int, default=10000,
+                        help="largest size to run the per-request langchain FAISS path on")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run([int(s) for s in args.sizes.split(",")], args.dim, args.k, args.queries, args.langchain_max, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Import-time budget for the server app
+
+    python -m benchmarks.import_time --budget-ms 250
+
+Imports ``server.core.session_app`` in a fresh interpreter under ``python -X importtime``
+and exits non-zero if the cumulative import time exceeds the budget, or if any
+dependency that must be deferred to first use was imported.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+TARGET = "server.core.session_app"
+DEFERRED = ("boto3", "botocore", "langchain", "langchain_core", "faiss", "openai", "numpy", "requests")
+
+
+def measure(target: str = TARGET) -> Tuple[int, Dict[str, int]]:
+    """
+    Import ``target`` in a subprocess
+
+    Returns:
+        Tuple[int, Dict[str, int]]: Cumulative microseconds for ``target`` and the
+        cumulative microseconds of every top-level package imported along the way
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=root, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"importing {target} failed:\n{result.stderr}")
+
+    total, packages = 0, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            cumulative = int(cumulative)
+        except ValueError:
+            continue  # header row
+        name = name.strip()
+        if name == target:
+            total = cumulative
+        top = name.split(".")[0]
+        packages[top] = max(packages.get(top, 0), cumulative)
+    return total, packages
+
+
+def check(budget_ms: float, runs: int) -> List[str]:
+    samples, packages = [], {}
+    for _ in range(runs):
+        total, packages = measure()
+        samples.append(total)
+    best = min(samples) / 1000
+
+    problems = []
+    if best > budget_ms:
+        problems.append(f"{TARGET} took {best:.0f}ms to import, budget is {budget_ms:.0f}ms")
+    for name in DEFERRED:
+        if name in packages:
+            problems.append(f"{name} is imported at startup ({packages[name] / 1000:.0f}ms); defer it to first use")
+
+    print(f"{TARGET}: best of {runs} = {best:.0f}ms (budget {budget_ms:.0f}ms)")
+    for name, micros in sorted(packages.items(), key=lambda kv: -kv[1])[:10]:
+        print(f"  {name:<24}{micros / 1000:8.1f}ms")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "250")))
+    parser.add_argument("--runs", type=int, default=3, help="report the fastest of this many imports")
+    args = parser.parse_args()
+
+    problems = check(args.budget_ms, args.runs)
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+End-to-end load test for the session server
+
+    python -m benchmarks.loadtest --duration 30 --concurrency 16
+    python -m benchmarks.loadtest --target http://127.0.0.1:5000 --duration 60
+
+Without ``--target`` the app is served in-process against the in-memory DynamoDB
+stand-in (STORAGE_BACKEND=memory), the local embedder and the stub backends, so
+a run needs neither AWS nor the real Eliza/tools services. A setup phase creates
+API keys and sessions, then worker threads drive a weighted mix of
+/create_api_key, /create_session, /query and /agent_info for ``--duration``
+seconds. Reports per-endpoint p50/p95/p99 latency, RPS and errors.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from .stub_backends import StubBackends
+
+DEFAULT_MIX = "query=70,agent_info=20,create_session=5,create_api_key=5"
+QUERIES = (
+    "What did we talk about last time?",
+    "Summarise the plan for tomorrow.",
+    "Which tools can you use for this task?",
+    "Remind me of the open issues.",
+)
+
+
+def serve_in_process(stubs: StubBackends) -> Tuple[str, object]:
+    """Serve the app on a free port in this process; returns its base URL and the server"""
+    os.environ.update(stubs.env())
+    for name, value in {
+        "STORAGE_BACKEND": "memory",
+        "EMBEDDING_BACKEND": "local",
+        "EMBEDDING_CACHE_PATH": "",
+        "VECTOR_INDEX_DIR": tempfile.mkdtemp(prefix="loadtest-index-"),
+        "ARCHIVE_DIR": tempfile.mkdtemp(prefix="loadtest-archive-"),
+        "API_TABLE": "api_keys",
+        "AGENT_TABLE": "agents",
+        # A few simulated tenants drive all the load; measure capacity, not their quotas
+        "RATE_LIMIT_ENABLED": "0",
+    }.items():
+        os.environ.setdefault(name, value)
+
+    from werkzeug.serving import make_server
+    from server.core.session_app import app
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return "http://127.0.0.1:%d" % server.server_port, server
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted samples"""
+    if not samples:
+        return 0.0
+    rank = max(0, min(len(samples) - 1, int(round(pct / 100 * len(samples) + 0.5)) - 1))
+    return samples[rank]
+
+
+class LoadTest:
+    def __init__(self, base_url: str, mix: Dict[str, int], users: int, agents_per_user: int, seed: Optional[int] = None):
+        """
+        Args:
+            base_url (str): Server to drive, e.g. http://127.0.0.1:5000
+            mix (Dict[str, int]): Operation name -> relative weight
+            users (int): API keys created during setup
+            agents_per_user (int): Sessions created per API key during setup
+            seed (Optional[int]): Seed for the operation mix
+        """
+        self.base_url = base_url.rstrip("/")
+        self.ops = list(mix)
+        self.weights = [mix[op] for op in self.ops]
+        self.users = users
+        self.agents_per_user = agents_per_user
+        self.random = random.Random(seed)
+        self.run_id = uuid.uuid4().hex[:8]
+        self.keys: List[Tuple[int, str]] = []
+        self.agents: List[str] = []
+        self.owners: List[Tuple[int, str]] = []
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, Dict[str, int]] = {}
+        self._next_user = int(time.time() * 1000) % 10 ** 9
+        self._lock = threading.Lock()
+
+    def _record(self, op: str, elapsed: float, outcome: Optional[str]) -> None:
+        with self._lock:
+            self.samples.setdefault(op, []).append(elapsed)
+            if outcome is not None:
+                counts = self.errors.setdefault(op, {})
+                counts[outcome] = counts.get(outcome, 0) + 1
+
+    def _call(self, session: requests.Session, op: str, path: str, payload: dict, ok=(200, 201)):
+        t0 = time.perf_counter()
+        try:
+            response = session.post(self.base_url + path, json=payload, timeout=60)
+        except requests.RequestException as e:
+            self._record(op, time.perf_counter() - t0, type(e).__name__)
+            return None
+        self._record(op, time.perf_counter() - t0, None if response.status_code in ok else str(response.status_code))
+        return response if response.status_code in ok else None
+
+    def _user_id(self) -> int:
+        with self._lock:
+            self._next_user += 1
+            return self._next_user
+
+    # -- operations -------------------------------------------------------
+
+    def create_api_key(self, session: requests.Session) -> None:
+        user_id = self._user_id()
+        response = self._call(session, "create_api_key", "/create_api_key", {"user_id": user_id})
+        if response is not None:
+            with self._lock:
+                self.keys.append((user_id, response.json()["api_key"]))
+
+    def create_session(self, session: requests.Session, key: Optional[Tuple[int, str]] = None) -> None:
+        key = key or self.random.choice(self.keys)
+        api_key = key[1]
+        name = f"lt-{self.run_id}-{uuid.uuid4().hex[:8]}"
+        response = self._call(session, "create_session", "/create_session", {
+            "character_file": {"name": name, "bio": ["load test agent"]},
+            "api_key": api_key,
+            "env_json": {},
+            "multi_agent_main_name": name,
+            "multiple_agents_name": [name],
+        })
+        if response is not None:
+            with self._lock:
+                self.agents.append(name)
+                self.owners.append(key)
+
+    def query(self, session: requests.Session) -> None:
+        self._call(session, "query", "/query", {
+            "query": self.random.choice(QUERIES),
+            "agent_name": self.random.choice(self.agents),
+        })
+
+    def agent_info(self, session: requests.Session) -> None:
+        # Only users with sessions, so a 404 is a real failure
+        user_id, api_key = self.random.choice(self.owners)
+        self._call(session, "agent_info", "/agent_info", {"api_key": api_key, "user_id": user_id})
+
+    # -- phases -----------------------------------------------------------
+
+    def setup(self) -> None:
+        session = requests.Session()
+        for _ in range(self.users):
+            self.create_api_key(session)
+        if not self.keys:
+            raise SystemExit(f"setup failed, no API keys created: {self.errors}")
+        for key in list(self.keys):
+            for _ in range(self.agents_per_user):
+                self.create_session(session, key)
+        if not self.agents:
+            raise SystemExit(f"setup failed, no sessions created: {self.errors}")
+        self.samples.clear()
+        self.errors.clear()
+
+    def _worker(self, deadline: float) -> None:
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            op = self.random.choices(self.ops, self.weights)[0]
+            getattr(self, op)(session)
+
+    def run(self, duration: float, concurrency: int) -> float:
+        deadline = time.perf_counter() + duration
+        t0 = time.perf_counter()
+        workers = [threading.Thread(target=self._worker, args=(deadline,), daemon=True) for _ in range(concurrency)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return time.perf_counter() - t0
+
+    def report(self, wall: float) -> Dict[str, Dict[str, float]]:
+        results = {}
+        groups = {op: sorted(self.samples.get(op, [])) for op in self.ops}
+        groups["total"] = sorted(t for samples in groups.values() for t in samples)
+        for op, samples in groups.items():
+            failed = self.errors.values() if op == "total" else [self.errors.get(op, {})]
+            results[op] = {
+                "requests": len(samples),
+                "rps": len(samples) / wall if wall else 0.0,
+                "p50_ms": percentile(samples, 50) * 1000,
+                "p95_ms": percentile(samples, 95) * 1000,
+                "p99_ms": percentile(samples, 99) * 1000,
+                "max_ms": (samples[-1] * 1000) if samples else 0.0,
+                "errors": sum(sum(counts.values()) for counts in failed),
+            }
+        return results
+
+
+def print_report(results: Dict[str, Dict[str, float]], wall: float, errors: Dict[str, Dict[str, int]]) -> None:
+    print(f"{'endpoint':<16}{'reqs':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}")
+    for op, r in results.items():
+        print(f"{op:<16}{r['requests']:>8}{r['rps']:>9.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+              f"{r['p99_ms']:>9.1f}{r['max_ms']:>9.1f}{r['errors']:>8}")
+    print(f"wall time {wall:.1f}s")
+    for op, counts in errors.items():
+        print(f"  {op} errors: {counts}")
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    mix = {}
+    for part in text.split(","):
+        op, weight = part.split("=")
+        if op.strip() not in ("query", "agent_info", "create_session", "create_api_key"):
+            raise argparse.ArgumentTypeError(f"unknown operation {op!r}")
+        mix[op.strip()] = int(weight)
+    return mix
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", help="base URL of a running server; default serves the app in-process")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of mixed load after setup")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads")
+    parser.add_argument("--users", type=int, default=10, help="API keys created during setup")
+    parser.add_argument("--agents-per-user", type=int, default=2)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"weighted operation mix (default {DEFAULT_MIX})")
+    parser.add_argument("--eliza-latency", type=float, default=0.05)
+    parser.add_argument("--tools-latency", type=float, default=0.08)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    args = parser.parse_args()
+
+    stubs, server = None, None
+    base_url = args.target
+    if base_url is None:
+        stubs = StubBackends(eliza_latency=args.eliza_latency, tools_latency=args.tools_latency,
+                             jitter=args.jitter).start()
+        base_url, server = serve_in_process(stubs)
+
+    try:
+        test = LoadTest(base_url, args.mix, args.users, args.agents_per_user, args.seed)
+        test.setup()
+        wall = test.run(args.duration, args.concurrency)
+        results = test.report(wall)
+        print_report(results, wall, test.errors)
+        if args.json_path:
+            with open(args.json_path, "w") as f:
+                json.dump({"config": {k: v for k, v in vars(args).items() if k != "json_path"},
+                           "wall_s": wall, "results": results, "errors": test.errors}, f, indent=2)
+    finally:
+        if server is not None:
+            server.shutdown()
+        if stubs is not None:
+            stubs.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Stub Eliza and tools backends with configurable latency
+
+    python -m benchmarks.stub_backends --eliza-latency 0.2 --tools-latency 0.5
+
+Prints the environment variables pointing the server at the stubs.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+        status, payload = server.respond(self.path, body)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _eliza_respond(path: str, body: dict) -> Tuple[int, object]:
+    if path.rstrip("/").endswith("/message"):
+        return 200, [{"text": f"eliza reply to: {body.get('text', '')[:80]}"}]
+    return 200, {"id": str(uuid.uuid4())}
+
+
+def _tools_respond(path: str, body: dict) -> Tuple[int, object]:
+    if path.rstrip("/").endswith("/set"):
+        return 200, {"unique_id": str(uuid.uuid4())}
+    return 200, {"result": f"tools result for: {body.get('query', '')[:80]}"}
+
+
+class StubBackends:
+    def __init__(self, host: str = "127.0.0.1", eliza_port: int = 0, tools_port: int = 0,
+                 eliza_latency: float = 0.0, tools_latency: float = 0.0, jitter: float = 0.0):
+        """
+        Eliza and tools stand-ins, each on its own threaded HTTP server
+
+        Args:
+            host (str): Interface to bind
+            eliza_port (int): Port for the Eliza stub, 0 picks a free port
+            tools_port (int): Port for the tools stub, 0 picks a free port
+            eliza_latency (float): Seconds every Eliza response is delayed
+            tools_latency (float): Seconds every tools response is delayed
+            jitter (float): Extra uniformly random delay, in seconds, added to each response
+        """
+        self.eliza = self._server(host, eliza_port, eliza_latency, jitter, _eliza_respond)
+        self.tools = self._server(host, tools_port, tools_latency, jitter, _tools_respond)
+        self._threads = []
+
+    @staticmethod
+    def _server(host, port, latency, jitter, respond):
+        server = ThreadingHTTPServer((host, port), _StubHandler)
+        server.daemon_threads = True
+        server.latency = latency
+        server.jitter = jitter
+        server.respond = respond
+        return server
+
+    def start(self) -> "StubBackends":
+        for server in (self.eliza, self.tools):
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self) -> None:
+        for server in (self.eliza, self.tools):
+            server.shutdown()
+            server.server_close()
+
+    def env(self) -> Dict[str, str]:
+        """Environment variables that point the server at these stubs"""
+        eliza = "http://%s:%d" % self.eliza.server_address[:2]
+        tools = "http://%s:%d" % self.tools.server_address[:2]
+        return {
+            "ELIZA_CREATE": f"{eliza}/agents",
+            "ELIZA_QUERY": f"{eliza}/",
+            "TOOLS_SET": f"{tools}/set",
+            "TOOLS_QUERY": f"{tools}/query",
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--eliza-port", type=int, default=4001)
+    parser.add_argument("--tools-port", type=int, default=4002)
+    parser.add_argument("--eliza-latency", type=float, default=0.2)
+    parser.add_argument("--tools-latency", type=float, default=0.3)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stubs = StubBackends(args.host, args.eliza_port, args.tools_port,
+                         args.eliza_latency, args.tools_latency, args.jitter).start()
+    for name, value in stubs.env().items():
+        print(f"{name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stubs.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import sys
+
+
+def main() -> None:
+    commands = {"serve", "setup-tables"}
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        print(f"usage: python -m server {{{','.join(sorted(commands))}}} [options]")
+        raise SystemExit(2)
+
+    command, argv = sys.argv[1], sys.argv[2:]
+    if command == "serve":
+        from .serve import main as serve
+        serve(argv)
+    elif command == "setup-tables":
+        from .setup_tables import main as setup_tables
+        setup_tables(argv)
+
+
+if __name__ == "__main__":
+    main()
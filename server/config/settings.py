@@ -0,0 +1,17 @@
+import threading
+
+
+_loaded = False
+_lock = threading.Lock()
+
+
+def load_config() -> None:
+    """Load the .env file into the environment, once per process"""
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if not _loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _loaded = True
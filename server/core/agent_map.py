@@ -1,26 +1,64 @@
+from .routing import AgentRouter
+from ..utils.logs import get_logger
+from ..utils.records import AgentToolMapping
+
+log = get_logger(__name__)
+
 class AgentToolMapper:
     def __init__(self, dynamo, table_name):
         self.dynamo = dynamo
         self.table_name = table_name
 
-    def save_agent_tool_mapping(self, multi_agent_main_name, eliza_response, tools_response, api_key):
-        try:
-            eliza_agent_id = eliza_response.json().get('id')
-            tools_agent_id = tools_response.json().get('unique_id')
+    @staticmethod
+    def mapping_item(multi_agent_main_name, eliza_response, tools_response):
+        """
+        Build the mapping item from the Eliza and tools creation responses
 
-            if not eliza_agent_id or not tools_agent_id:
-                raise ValueError("Invalid response: Missing agent IDs")
+        Raises:
+            ValueError: If either response lacks its agent ID
+        """
+        eliza_agent_id = eliza_response.json().get('id')
+        tools_agent_id = tools_response.json().get('unique_id')
 
-            item = {
-                "multi_agent_main_name" : {"S": str(multi_agent_main_name)},
-                "agent_id": {"S": str(eliza_agent_id)},
-                "tools_agent_id": {"S": str(tools_agent_id)}
-            }
+        if not eliza_agent_id or not tools_agent_id:
+            raise ValueError("Invalid response: Missing agent IDs")
+
+        return AgentToolMapping(
+            multi_agent_main_name=str(multi_agent_main_name),
+            agent_id=str(eliza_agent_id),
+            tools_agent_id=str(tools_agent_id)
+        ).to_item()
+
+    def save_agent_tool_mapping(self, multi_agent_main_name, eliza_response, tools_response, api_key):
+        try:
+            item = self.mapping_item(multi_agent_main_name, eliza_response, tools_response)
 
             self.dynamo.add_item(self.table_name, item)
-            print(f"--- Agent and tools ID for api_key {api_key} written to DB ---")
+            AgentRouter.invalidate(multi_agent_main_name, self.table_name)
+            log.info("agent_tool_mapping_saved", agent=multi_agent_main_name, api_key=api_key)
 
             return {"status": "success", "message": "Agent and tools mapping saved"}
 
         except Exception as e:
             return {"status": "error", "message": f"Failed to save mapping: {str(e)}"}
+
+    def save_agent_and_mapping(self, agent_table, agent_item, multi_agent_main_name, eliza_response, tools_response, api_key):
+        """
+        Save a new agent row and its mapping in one TransactWriteItems, so either both
+        are stored or neither is
+        """
+        try:
+            mapping = self.mapping_item(multi_agent_main_name, eliza_response, tools_response)
+
+            self.dynamo.transact_write([
+                {"Put": {"TableName": agent_table, "Item": agent_item,
+                         "ConditionExpression": "attribute_not_exists(id)"}},
+                {"Put": {"TableName": self.table_name, "Item": mapping}},
+            ])
+            AgentRouter.invalidate(multi_agent_main_name, self.table_name)
+            log.info("agent_saved", agent=multi_agent_main_name, id=agent_item["id"]["N"], api_key=api_key)
+
+            return {"status": "success", "message": "Agent and tools mapping saved"}
+
+        except Exception as e:
+            return {"status": "error", "message": f"Failed to save agent and mapping: {str(e)}"}
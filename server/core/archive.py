@@ -0,0 +1,287 @@
+"""
+Cold tier of conversation memory: compressed, indexed segments of old turns
+
+The hot tier is the agent's recent turns (the history window in DynamoDB and the
+in-memory vector index). Once the vector index holds ``segment_turns`` turns beyond
+``hot_turns``, the oldest ``segment_turns`` are sealed into a segment and dropped
+from it. A segment is two objects in an object store:
+
+    <agent sha1>/<segment id>.seg    zlib-compressed turn texts and float16 unit vectors
+    <agent sha1>/<segment id>.meta   JSON with the turn count and the segment centroid
+
+A search ranks an agent's segments by centroid similarity and only opens the best
+``probe_segments`` of them, so its cost stays flat however many segments an agent
+has. Segment ids are derived from their turns, so two workers sealing the same turns
+write the same objects. Metas and decoded segments are cached; the meta listing is
+refreshed every ``refresh`` seconds to pick up segments sealed by other workers.
+
+The archive is opt-in. Every worker serving an agent must see the same store: "local"
+is only shared by the workers of one host (or hosts mounting one ARCHIVE_DIR), and
+"memory" by nothing beyond its process.
+
+Environment:
+    ARCHIVE_BACKEND         "none" (default) to keep only the hot tier, "local" or "memory"
+    ARCHIVE_DIR             Directory of the local object store, default memory_archive
+    ARCHIVE_SEGMENT_TURNS   Turns per segment, default 64
+    ARCHIVE_PROBE_SEGMENTS  Segments opened per search, default 4
+    ARCHIVE_SEGMENT_CACHE   Decoded segments kept in memory, default 256
+    ARCHIVE_MAX_AGENTS      Agents whose segment index is kept in memory, default 1024
+    ARCHIVE_REFRESH         Seconds between re-listing an agent's segments, default 30
+"""
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..utils.logs import get_logger
+from ..utils.tracing import metrics, span
+
+log = get_logger(__name__)
+
+
+class LocalObjectStore:
+    def __init__(self, directory: str):
+        """Object store on the local filesystem; ``a/b`` keys map to files under ``directory``"""
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def put(self, key: str, data: bytes) -> None:
+        path = os.path.join(self.directory, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key: str) -> bytes:
+        with open(os.path.join(self.directory, key), "rb") as f:
+            return f.read()
+
+    def list(self, prefix: str) -> List[str]:
+        folder, start = os.path.split(prefix)
+        try:
+            names = os.listdir(os.path.join(self.directory, folder))
+        except FileNotFoundError:
+            return []
+        return [f"{folder}/{n}" if folder else n for n in names if n.startswith(start) and not n.endswith(".tmp")]
+
+
+class MemoryObjectStore:
+    def __init__(self):
+        """In-process object store for tests and load runs"""
+        self._objects: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def put(self, key: str, data: bytes) -> None:
+        with self._lock:
+            self._objects[key] = bytes(data)
+
+    def get(self, key: str) -> bytes:
+        try:
+            return self._objects[key]
+        except KeyError:
+            raise FileNotFoundError(key) from None
+
+    def list(self, prefix: str) -> List[str]:
+        with self._lock:
+            return [k for k in self._objects if k.startswith(prefix)]
+
+
+OBJECT_STORES = {
+    "local": lambda: LocalObjectStore(os.getenv("ARCHIVE_DIR", "memory_archive")),
+    "memory": MemoryObjectStore,
+}
+
+
+def encode_segment(texts: Sequence[str], unit: np.ndarray) -> bytes:
+    header = json.dumps({"texts": list(texts), "dim": int(unit.shape[1])}).encode()
+    return zlib.compress(struct.pack("<I", len(header)) + header + unit.astype(np.float16).tobytes())
+
+
+def decode_segment(data: bytes) -> Tuple[List[str], np.ndarray]:
+    raw = zlib.decompress(data)
+    (length,) = struct.unpack_from("<I", raw)
+    header = json.loads(raw[4:4 + length])
+    unit = np.frombuffer(raw, dtype=np.float16, offset=4 + length).astype(np.float32)
+    return header["texts"], unit.reshape(len(header["texts"]), header["dim"])
+
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class _AgentSegments:
+    __slots__ = ("ids", "centroids", "listed_at", "lock")
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.centroids: Optional[np.ndarray] = None
+        self.listed_at = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, segment_id: str, centroid: np.ndarray) -> None:
+        if segment_id in self.ids:
+            return
+        row = np.asarray(centroid, dtype=np.float32)[None, :]
+        if self.centroids is not None and self.centroids.shape[1] != row.shape[1]:
+            return  # Sealed under a different embedding model; unreachable by this one's queries
+        self.ids.append(segment_id)
+        self.centroids = row if self.centroids is None else np.vstack([self.centroids, row])
+
+
+class MemoryArchive:
+    def __init__(self, store, hot_turns: int, segment_turns: int = 64, probe_segments: int = 4,
+                 segment_cache: int = 256, max_agents: int = 1024, refresh: float = 30.0):
+        """
+        Args:
+            store: Object store with ``put``, ``get`` and ``list``
+            hot_turns (int): Turns kept in the hot vector index before older ones are archived
+            segment_turns (int): Turns per sealed segment
+            probe_segments (int): Segments opened per search
+            segment_cache (int): Decoded segments kept in memory
+            max_agents (int): Agents whose segment index is kept in memory
+            refresh (float): Seconds between re-listing an agent's segments
+        """
+        self.store = store
+        self.hot_turns = hot_turns
+        self.segment_turns = segment_turns
+        self.probe_segments = probe_segments
+        self.segment_cache = segment_cache
+        self.max_agents = max_agents
+        self.refresh = refresh
+        self._agents: "OrderedDict[str, _AgentSegments]" = OrderedDict()
+        self._segments: "OrderedDict[str, Tuple[List[str], np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prefix(agent_name: str) -> str:
+        return hashlib.sha1(agent_name.encode()).hexdigest() + "/"
+
+    def _agent(self, agent_name: str) -> _AgentSegments:
+        with self._lock:
+            segments = self._agents.get(agent_name)
+            if segments is None:
+                segments = self._agents[agent_name] = _AgentSegments()
+                while len(self._agents) > self.max_agents:
+                    self._agents.popitem(last=False)
+            self._agents.move_to_end(agent_name)
+            return segments
+
+    def _listed(self, agent_name: str) -> _AgentSegments:
+        """The agent's segment index, re-listed from the store when stale"""
+        segments = self._agent(agent_name)
+        with segments.lock:
+            if time.monotonic() - segments.listed_at < self.refresh:
+                return segments
+            prefix = self._prefix(agent_name)
+            with span("archive", "list"):
+                for key in sorted(self.store.list(prefix)):
+                    segment_id = key[len(prefix):-len(".meta")]
+                    if not key.endswith(".meta") or segment_id in segments.ids:
+                        continue
+                    try:
+                        segments.add(segment_id, json.loads(self.store.get(key))["centroid"])
+                    except (OSError, ValueError, KeyError) as e:
+                        log.warning("archive_meta_unreadable", agent=agent_name, key=key, error=str(e))
+            segments.listed_at = time.monotonic()
+        return segments
+
+    def seal(self, agent_name: str, texts: Sequence[str], vectors: np.ndarray) -> str:
+        """Write turns (oldest first) and their embeddings as one segment. Returns its id."""
+        unit = _unit_rows(vectors)
+        centroid = unit.mean(axis=0)
+        norm = float(np.linalg.norm(centroid))
+        centroid = centroid / norm if norm else centroid
+        segment_id = hashlib.sha1("\0".join(texts).encode()).hexdigest()[:20]
+        key = self._prefix(agent_name) + segment_id
+        with span("archive", "seal"):
+            # Data before meta: a listed segment can always be opened
+            self.store.put(key + ".seg", encode_segment(texts, unit))
+            self.store.put(key + ".meta", json.dumps({
+                "turns": len(texts), "dim": int(unit.shape[1]), "sealed_at": time.time(),
+                "centroid": np.round(centroid, 6).tolist(),
+            }).encode())
+        segments = self._agent(agent_name)
+        with segments.lock:
+            segments.add(segment_id, centroid)
+        metrics.inc("agent_server_archive_segments_total", op="sealed")
+        log.debug("archive_sealed", agent=agent_name, segment=segment_id, turns=len(texts))
+        return segment_id
+
+    def _open(self, agent_name: str, segment_id: str) -> Optional[Tuple[List[str], np.ndarray]]:
+        key = self._prefix(agent_name) + segment_id
+        with self._lock:
+            segment = self._segments.get(key)
+            if segment is not None:
+                self._segments.move_to_end(key)
+                return segment
+        try:
+            with span("archive", "load_segment"):
+                segment = decode_segment(self.store.get(key + ".seg"))
+        except (OSError, ValueError, zlib.error, struct.error) as e:
+            log.warning("archive_segment_unreadable", agent=agent_name, segment=segment_id, error=str(e))
+            return None
+        metrics.inc("agent_server_archive_segments_total", op="loaded")
+        with self._lock:
+            self._segments[key] = segment
+            while len(self._segments) > self.segment_cache:
+                self._segments.popitem(last=False)
+        return segment
+
+    def search(self, agent_name: str, query_vector: Sequence[float], k: int) -> List[Tuple[float, str]]:
+        """
+        Up to ``k`` archived turns most similar to the query, as (cosine similarity, text)
+
+        Only the ``probe_segments`` segments whose centroids are closest to the query are opened.
+        """
+        segments = self._listed(agent_name)
+        with segments.lock:
+            ids, centroids = list(segments.ids), segments.centroids
+        if not ids or k <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        if centroids.shape[1] != query.shape[0]:
+            return []
+        q_norm = float(np.linalg.norm(query))
+        query = query / q_norm if q_norm else query
+
+        probe = np.argsort(-(centroids @ query), kind="stable")[:self.probe_segments]
+        hits: List[Tuple[float, str]] = []
+        with span("archive", "search"):
+            for i in probe:
+                segment = self._open(agent_name, ids[i])
+                if segment is None:
+                    continue
+                texts, unit = segment
+                scores = unit @ query
+                for row in np.argsort(-scores, kind="stable")[:k]:
+                    hits.append((float(scores[row]), texts[row]))
+        hits.sort(key=lambda hit: -hit[0])
+        return hits[:k]
+
+
+def create_archive(hot_turns: int) -> Optional[MemoryArchive]:
+    """Build the cold tier configured by ARCHIVE_*, or None when ARCHIVE_BACKEND is none"""
+    backend = os.getenv("ARCHIVE_BACKEND", "none").lower()
+    if backend == "none":
+        return None
+    if backend not in OBJECT_STORES:
+        raise ValueError(f"Unknown ARCHIVE_BACKEND {backend!r}; expected one of {sorted(OBJECT_STORES)} or none")
+    return MemoryArchive(
+        OBJECT_STORES[backend](),
+        hot_turns=hot_turns,
+        segment_turns=int(os.getenv("ARCHIVE_SEGMENT_TURNS", "64")),
+        probe_segments=int(os.getenv("ARCHIVE_PROBE_SEGMENTS", "4")),
+        segment_cache=int(os.getenv("ARCHIVE_SEGMENT_CACHE", "256")),
+        max_agents=int(os.getenv("ARCHIVE_MAX_AGENTS", "1024")),
+        refresh=float(os.getenv("ARCHIVE_REFRESH", "30")),
+    )
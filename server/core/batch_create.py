@@ -0,0 +1,158 @@
+import os
+from typing import Any, Dict, List
+
+from .agent_map import AgentToolMapper
+from .routing import AgentRouter
+from .verify import AGENT_ID_COUNTER, AgentVerify
+from ..utils.fanout import bounded, failure_detail
+from ..utils.logs import get_logger
+from ..utils.records import AgentRecord
+
+log = get_logger(__name__)
+
+BATCH_CREATE_MAX_ITEMS = int(os.getenv("BATCH_CREATE_MAX_ITEMS", "500"))
+BATCH_CREATE_CONCURRENCY = int(os.getenv("BATCH_CREATE_CONCURRENCY", "8"))
+
+
+class BatchProvisioner:
+    def __init__(self, dynamo, downstream, agent_table: str, mapping_table: str = "agent_tool_id",
+                 concurrency: int = BATCH_CREATE_CONCURRENCY, timeout: float = 30.0, response_cache=None):
+        """
+        Provision many multi-agents for one user in a single pass
+
+        Existing names are found with one query on the user_id index, Eliza and tools
+        agents are created with at most ``concurrency`` agents in flight, IDs are reserved
+        as one block and agent rows and mappings are written with BatchWriteItem.
+
+        Args:
+            dynamo (DynamoDBClient): Storage client
+            downstream (DownstreamClient): Pooled client for the Eliza and tools backends
+            agent_table (str): Table of agent rows
+            mapping_table (str): Table of agent -> Eliza/tools ID mappings
+            concurrency (int): Agents provisioned at once; each makes two backend calls
+            timeout (float): Seconds each backend call is allowed
+            response_cache (Optional[ResponseCache]): Cleared for every agent saved, as /create_session does
+        """
+        self.dynamo = dynamo
+        self.downstream = downstream
+        self.agent_table = agent_table
+        self.mapping_table = mapping_table
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.response_cache = response_cache
+
+    def existing_names(self, user_id: int) -> set:
+        names = set()
+        for items, _ in self.dynamo.find_item_pages(self.agent_table, "user_id", {"N": str(user_id)},
+                                                    attributes=["id", "agent_main_name"]):
+            names.update(agent.agent_main_name for agent in AgentRecord.iter_items(items))
+        return names
+
+    def run(self, api_key: str, user_id: int, sessions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Returns:
+            List[Dict[str, Any]]: One result per requested session, in request order, with
+            ``status`` one of created, partial (agent row saved, tools agent or mapping
+            missing), exists, duplicate, invalid or failed (nothing saved)
+        """
+        results = [{"multi_agent_name": s.get("multi_agent_main_name") if isinstance(s, dict) else None}
+                   for s in sessions]
+        existing = self.existing_names(user_id)
+        seen = set()
+        todo = []
+        for i, session in enumerate(sessions):
+            name = results[i]["multi_agent_name"]
+            if not isinstance(session, dict) or not name or not session.get("character_file"):
+                results[i].update(status="invalid", error="character_file and multi_agent_main_name are required")
+            elif name in existing:
+                results[i].update(status="exists", error=f"Multi-agent with name {name} already exists")
+            elif name in seen:
+                results[i].update(status="duplicate", error=f"{name} appears more than once in this batch")
+            else:
+                seen.add(name)
+                todo.append(i)
+
+        responses = self._provision(api_key, sessions, todo)
+        self._persist(user_id, sessions, todo, responses, results)
+        return results
+
+    def _provision(self, api_key: str, sessions: List[Dict[str, Any]], todo: List[int]) -> Dict[tuple, Any]:
+        """Create the Eliza and tools agents; returns (index, backend) -> CallResult"""
+        eliza_url, tools_url = os.getenv("ELIZA_CREATE"), os.getenv("TOOLS_SET")
+        tools_payload = {"api_keys": api_key}
+        calls = {}
+        for i in todo:
+            payload = {"characterJson": sessions[i]["character_file"]}
+            calls[(i, "eliza")] = lambda payload=payload: self.downstream.post("ELIZA_CREATE", eliza_url, json=payload)
+            calls[(i, "tools")] = lambda: self.downstream.post("TOOLS_SET", tools_url, json=tools_payload)
+        return {call.name: call for call in bounded(calls, 2 * self.concurrency, self.timeout)}
+
+    def _persist(self, user_id: int, sessions: List[Dict[str, Any]], todo: List[int],
+                 responses: Dict[tuple, Any], results: List[Dict[str, Any]]) -> None:
+        ok = {}
+        for i in todo:
+            for backend in ("eliza", "tools"):
+                call = responses[(i, backend)]
+                ok[(i, backend)] = call.ok and call.value.status_code == 200
+                if not ok[(i, backend)]:
+                    results[i][f"{backend}_details"] = failure_detail(call)
+
+        # As in /create_session: the agent row needs Eliza, the mapping needs both
+        saved = [i for i in todo if ok[(i, "eliza")]]
+        ids = self.dynamo.id_allocator.reserve(AGENT_ID_COUNTER, len(saved)) if saved else []
+        date_created = self.dynamo.get_date()
+        agent_items = {}
+        for i, auto_id in zip(saved, ids):
+            agent_items[i] = AgentVerify.agent_item(auto_id, user_id, sessions[i]["multi_agent_main_name"],
+                                                    sessions[i].get("multiple_agents_name"), date_created)
+            results[i]["id"] = auto_id
+
+        # Mappings only for saved rows: a row that failed is reported as failed and may be retried
+        agent_unsaved = self._write(self.agent_table, agent_items)
+        mapping_items = {}
+        for i in saved:
+            if ok[(i, "tools")] and i not in agent_unsaved:
+                try:
+                    mapping_items[i] = AgentToolMapper.mapping_item(sessions[i]["multi_agent_main_name"],
+                                                                    responses[(i, "eliza")].value,
+                                                                    responses[(i, "tools")].value)
+                except ValueError as e:
+                    results[i]["error"] = str(e)
+
+        mapping_unsaved = self._write(self.mapping_table, mapping_items)
+        for i in mapping_items:
+            AgentRouter.invalidate(sessions[i]["multi_agent_main_name"], self.mapping_table)
+        if self.response_cache is not None:
+            # A re-created agent must not answer from its predecessor's responses
+            for i in agent_items:
+                if i not in agent_unsaved:
+                    self.response_cache.invalidate(sessions[i]["multi_agent_main_name"])
+
+        for i in todo:
+            result = results[i]
+            if i in agent_unsaved:
+                result.pop("id", None)
+                result.update(status="failed", error="Agent could not be saved")
+            elif i in mapping_unsaved:
+                result.update(status="partial", error="Tools mapping could not be saved")
+            elif i in mapping_items:
+                result.update(status="created",
+                              eliza_response=responses[(i, "eliza")].value.json(),
+                              tools_response=responses[(i, "tools")].value.json())
+            elif i in agent_items:
+                result.setdefault("error", "Tools agent could not be created")
+                result["status"] = "partial"
+            else:
+                result.update(status="failed", error="Eliza agent could not be created")
+        log.info("batch_provisioned", user_id=user_id, requested=len(sessions),
+                 created=sum(r.get("status") == "created" for r in results))
+
+    def _write(self, table_name: str, items: Dict[int, Dict[str, Any]]) -> set:
+        """BatchWriteItem the items; returns the indexes of any left unprocessed"""
+        if not items:
+            return set()
+        leftover = self.dynamo.batch_write_items(table_name, list(items.values()))
+        if leftover:
+            log.warning("batch_write_unprocessed", table=table_name, items=len(leftover))
+        return {i for i, item in items.items() if item in leftover}
+
@@ -0,0 +1,98 @@
+"""
+Per-process components, each built on first use
+
+Heavy dependencies (boto3, requests, numpy, langchain/OpenAI) are only imported
+inside the factories below, so importing the app stays cheap and a forked worker
+builds exactly one of each.
+"""
+import os
+
+from ..config.settings import load_config
+from ..utils.registry import components
+
+load_config()
+
+
+def _dynamo():
+    from ..utils.db_utils import DynamoDBClient
+    return DynamoDBClient()
+
+
+def _downstream():
+    from ..utils.downstream import DownstreamClient
+    return DownstreamClient()
+
+
+def _history():
+    from .history import HistoryStore
+    return HistoryStore(components.get("dynamo"))
+
+
+def _router():
+    from .routing import AgentRouter
+    return AgentRouter(components.get("dynamo"), "agent_tool_id")
+
+
+def _idempotency():
+    from ..utils.idempotency import IdempotencyStore
+    return IdempotencyStore(components.get("dynamo"))
+
+
+def _rate_limiter():
+    from ..utils.ratelimit import create_rate_limiter
+
+    def backend_latency(names):
+        # Only once the app has made downstream calls; never builds the client just to ask
+        client = components.peek("downstream")
+        return None if client is None else client.latency(names)
+    return create_rate_limiter(components.proxy("dynamo"), backend_latency)
+
+
+def _response_cache():
+    from .response_cache import create_response_cache
+    return create_response_cache(lambda text: components.get("embedding_model").embed_query(text))
+
+
+def _prompt_builder():
+    from .prompt import create_prompt_builder
+    return create_prompt_builder(components.proxy("dynamo"))
+
+
+def _embedding_model():
+    from .embeddings import create_embedding_model
+    return create_embedding_model()
+
+
+def _archive():
+    from .archive import create_archive
+    return create_archive(hot_turns=int(os.getenv("HISTORY_WINDOW", "20")))
+
+
+def _vector_indexes():
+    from .vector_index import VectorIndexStore
+    archive = components.get("archive")
+    if archive is None:
+        return VectorIndexStore()
+    # Turns past the hot tier stay in the index until a whole segment can be archived
+    return VectorIndexStore(max_entries=archive.hot_turns + archive.segment_turns)
+
+
+components.register("dynamo", _dynamo)
+components.register("downstream", _downstream)
+components.register("history", _history)
+components.register("router", _router)
+components.register("idempotency", _idempotency)
+components.register("rate_limiter", _rate_limiter)
+components.register("response_cache", _response_cache)
+components.register("prompt_builder", _prompt_builder)
+components.register("embedding_model", _embedding_model)
+components.register("archive", _archive)
+components.register("vector_indexes", _vector_indexes)
+
+dynamo = components.proxy("dynamo")
+downstream = components.proxy("downstream")
+history = components.proxy("history")
+router = components.proxy("router")
+idempotency = components.proxy("idempotency")
+embedding_model = components.proxy("embedding_model")
+vector_indexes = components.proxy("vector_indexes")
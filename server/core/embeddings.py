@@ -0,0 +1,204 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ..utils.logs import get_logger
+from ..utils.tracing import metrics, span
+
+log = get_logger(__name__)
+
+
+class HashEmbeddings:
+    def __init__(self, dim: int = 256, latency: float = 0.0):
+        """
+        Deterministic local embedder for offline runs and benchmarks
+
+        Tokens are feature-hashed into ``dim`` signed buckets and the result is L2-normalised,
+        so identical texts always embed identically and overlapping texts are close.
+
+        Args:
+            dim (int): Embedding dimension
+            latency (float): Seconds slept per ``embed_documents`` call, to mimic a remote API
+        """
+        self.dim = dim
+        self.latency = latency
+        self.model = f"local-hash-{dim}"
+        self.calls = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            h = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm else vec).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class CachedEmbeddings:
+    def __init__(self, model, model_name: Optional[str] = None, memory_size: int = 4096,
+                 path: Optional[str] = None, max_rows: int = 100000):
+        """
+        Content-addressed embedding cache in front of an embeddings model
+
+        Vectors are keyed by sha256 of (model name, text) and kept in an in-memory LRU
+        backed by a SQLite file. Misses within one call are embedded in a single batched
+        ``embed_documents`` request. The disk tier is best effort: SQLite errors (a locked,
+        read-only or full file) are logged and the call carries on from memory and the model,
+        and the oldest rows are pruned once the file holds more than ``max_rows`` vectors.
+
+        Args:
+            model: Object exposing ``embed_documents(texts)``
+            model_name (Optional[str]): Name mixed into the cache key; defaults to ``model.model``
+            memory_size (int): Number of vectors kept in memory
+            path (Optional[str]): SQLite file for the disk tier; None keeps the cache in memory only
+            max_rows (int): Vectors kept in the SQLite file before the oldest are deleted
+        """
+        self.model = model
+        self.model_name = model_name or getattr(model, "model", type(model).__name__)
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_rows = max_rows
+        self._db = None
+        self._rows = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "batches": 0, "disk_errors": 0}
+        if path:
+            try:
+                # Short busy timeout: a locked file costs a cache miss, not a stalled request
+                self._db = sqlite3.connect(path, timeout=0.5, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB)")
+                self._db.commit()
+                self._rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            except sqlite3.Error as e:
+                log.warning("embedding_cache_unavailable", path=path, error=str(e))
+                self._db = None
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode()).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+
+        with self._lock:
+            for key in keys:
+                vec = self._memory.get(key)
+                if vec is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vec
+            self.stats["memory_hits"] += len(found)
+
+            pending = [k for k in dict.fromkeys(keys) if k not in found]
+            if pending and self._db is not None:
+                for key, blob in self._read(pending):
+                    found[key] = self._remember(key, np.frombuffer(blob, dtype=np.float32))
+                    self.stats["disk_hits"] += 1
+
+        misses = {k: t for k, t in zip(keys, texts) if k not in found}
+        if misses:
+            with span("embedding", "embed", model=self.model_name) as s:
+                s.set("texts", len(misses))
+                vectors = self.model.embed_documents(list(misses.values()))
+            with self._lock:
+                self.stats["misses"] += len(misses)
+                self.stats["batches"] += 1
+                rows = []
+                for key, vec in zip(misses, vectors):
+                    found[key] = self._remember(key, np.asarray(vec, dtype=np.float32))
+                    rows.append((key, found[key].tobytes()))
+                if self._db is not None:
+                    self._write(rows)
+
+        return [found[k].tolist() for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def _read(self, keys: List[str]) -> List[tuple]:
+        """Rows for ``keys`` from the disk tier, or none if it cannot be read; caller holds the lock"""
+        placeholders = ",".join("?" * len(keys))
+        try:
+            return self._db.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({placeholders})", keys).fetchall()
+        except sqlite3.Error as e:
+            self._disk_error("read", e)
+            return []
+
+    def _write(self, rows: List[tuple]) -> None:
+        """Store ``rows`` and prune the oldest past ``max_rows``; caller holds the lock"""
+        try:
+            self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)", rows)
+            self._rows += len(rows)
+            if self._rows > self.max_rows:
+                # Recount first: other workers share the file and replaced keys were counted twice
+                self._rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if self._rows > self.max_rows:
+                # Rows are replaced rather than updated, so rowid order is insertion order
+                self._db.execute(
+                    "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)",
+                    (self._rows - self.max_rows,))
+                self._rows = self.max_rows
+            self._db.commit()
+        except sqlite3.Error as e:
+            self._disk_error("write", e)
+            try:
+                self._db.rollback()
+            except sqlite3.Error:
+                pass
+
+    def _disk_error(self, op: str, error: Exception) -> None:
+        self.stats["disk_errors"] += 1
+        metrics.inc("agent_server_embedding_cache_errors_total", op=op)
+        log.warning("embedding_cache_error", op=op, error=str(error))
+
+    def _remember(self, key: str, vec: np.ndarray) -> np.ndarray:
+        """Insert into the memory tier; caller holds the lock"""
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+        return vec
+
+    def hit_rate(self) -> float:
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+def create_embedding_model():
+    """
+    Build the embeddings model selected by EMBEDDING_BACKEND ("openai" or "local"),
+    wrapped in the embedding cache
+    """
+    backend = os.getenv("EMBEDDING_BACKEND", "openai")
+    if backend == "local":
+        model = HashEmbeddings(dim=int(os.getenv("LOCAL_EMBEDDING_DIM", "256")))
+        model_name = model.model
+    else:
+        from langchain.embeddings.openai import OpenAIEmbeddings
+        model = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
+        model_name = getattr(model, "model", "openai")
+
+    return CachedEmbeddings(
+        model,
+        model_name=model_name,
+        memory_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "4096")),
+        path=os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3") or None,
+        max_rows=int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "100000"))
+    )
@@ -1,6 +1,11 @@
 import uuid
 from datetime import datetime
 from datetime import datetime, timedelta
+from .verify import ApiVerify
+from ..utils.logs import get_logger
+from ..utils.records import ApiKeyRecord
+
+log = get_logger(__name__)
 
 class APIKeyManager:
     def __init__(self, dynamo_client, table_name):
@@ -12,13 +17,9 @@ class APIKeyManager:
         return str(uuid.uuid4())
 
     def get_existing_api_key(self, user_id):
-        result = self.dynamo.scan_table(self.table_name)
-    
-        if "Items" in result:
-            for item in result["Items"]:
-                if item.get("user_id", {}).get("N") == str(user_id):
-                    return True  # User ID found
-        return False  # User ID not found
+        # Keyed lookup on the user_id access path rather than scanning every key
+        items = self.dynamo.find_items(self.table_name, "user_id", {"N": str(user_id)}, limit=1)
+        return bool(items)  # True if the user already has a key
     
 
     def create_api_key(self, user_id):
@@ -28,24 +29,24 @@ class APIKeyManager:
             return f"You have an existing key for user id {user_id}"
 
         # Generate a new API key if none exists
-        print("...Generating API Key")
         new_api_key = self.generate_api_key()
         date_created = self.dynamo.get_date()
         auto_id = self.dynamo.get_auto_increment_id('test_api_key_table')
 
-        print("...Writing API key to DB")
-        item = {
-            "id": {"N": str(auto_id)},
-            "user_id": {"N": str(user_id)},
-            "api_key": {"S": new_api_key},
-            "date_created": {"S": date_created},
-            "expiration_date": {"S": (datetime.strptime(date_created, "%Y-%m-%d %H:%M:%S") + timedelta(days=90)).strftime("%Y-%m-%d %H:%M:%S")},
-            "is_active": {"BOOL": True}  # Set to True by default, can be modified as needed
-        }
+        item = ApiKeyRecord(
+            id=auto_id,
+            user_id=user_id,
+            api_key=new_api_key,
+            date_created=date_created,
+            expiration_date=(datetime.strptime(date_created, "%Y-%m-%d %H:%M:%S") + timedelta(days=90)).strftime("%Y-%m-%d %H:%M:%S"),
+            is_active=True  # Set to True by default, can be modified as needed
+        ).to_item()
 
         # Add the new API key to the DynamoDB table
         response = self.dynamo.add_item(self.table_name, item)   
-        print(f"...New API Key added successfully {item}")
+        # A negative verification may have been cached for this key; drop it now that it exists
+        ApiVerify.invalidate(self.table_name, new_api_key)
+        log.info("api_key_created", user_id=user_id, id=auto_id, api_key=new_api_key)
 
         return new_api_key
         
@@ -1,15 +1,56 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Tuple, Union
+from ..utils.records import AgentRecord
 
 class AgentResponseParser:
-    def __init__(self, dynamo_response: Dict[str, Any]):
+    def __init__(self, dynamo_response: Union[Dict[str, Any], Iterable[Dict[str, Any]]]):
         """
         Initialize parser with DynamoDB response
         
         Args:
-            dynamo_response (Dict[str, Any]): Raw DynamoDB response containing Items
+            dynamo_response (Union[Dict[str, Any], Iterable[Dict[str, Any]]]): Raw DynamoDB response
+                containing Items, or any iterable of items (e.g. a generator over pages), which is
+                consumed lazily by the ``iter_*`` methods
         """
         self.response = dynamo_response
 
+    def iter_items(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the raw items without copying them into a list
+        
+        Returns:
+            Iterator[Dict[str, Any]]: Items in DynamoDB format
+        """
+        if isinstance(self.response, dict):
+            yield from self.response.get('Items', [])
+        else:
+            yield from self.response
+
+    def iter_records(self) -> Iterator[AgentRecord]:
+        """
+        Yield each item as an AgentRecord
+        
+        Raises:
+            KeyError: If an item lacks its id or agent_main_name
+        """
+        try:
+            yield from AgentRecord.iter_items(self.iter_items())
+        except KeyError as e:
+            raise KeyError(f"Invalid response structure: {str(e)}")
+
+    def iter_id_agent_pairs(self) -> Iterator[Tuple[int, str]]:
+        """
+        Yield (agent ID, agent main name) for each item
+        
+        Raises:
+            KeyError: If response structure is invalid
+            ValueError: If an ID is not an integer
+        """
+        try:
+            for agent in self.iter_records():
+                yield agent.id, agent.agent_main_name
+        except ValueError as e:
+            raise ValueError(f"Error converting ID to integer: {str(e)}")
+
     def extract_agent_names(self) -> List[str]:
         """
         Extract all agent main names from the response
@@ -22,13 +63,10 @@ class AgentResponseParser:
             Exception: For any other unexpected errors
         """
         try:
-            if 'Items' not in self.response:
-                return []
-                
-            return [item['agent_main_name']['S'] for item in self.response['Items']]
+            return [agent.agent_main_name for agent in self.iter_records()]
             
-        except KeyError as e:
-            raise KeyError(f"Invalid response structure: {str(e)}")
+        except KeyError:
+            raise
         except Exception as e:
             raise Exception(f"Error extracting agent names: {str(e)}")
         
@@ -40,13 +78,10 @@ class AgentResponseParser:
         Returns:
             List[Dict[str, str]]: List of dictionaries containing agent details
         """
-        if 'Items' not in self.response:
-            return []
-            
         return [{
-            'main_name': item['agent_main_name']['S'],
-            'agent_list': item['agent_list']['S']
-        } for item in self.response['Items']]
+            'main_name': agent.agent_main_name,
+            'agent_list': agent.agent_list
+        } for agent in self.iter_records()]
     
     def get_active_agents(self) -> List[str]:
         """
@@ -55,14 +90,7 @@ class AgentResponseParser:
         Returns:
             List[str]: List of active agent names
         """
-        if 'Items' not in self.response:
-            return []
-            
-        return [
-            item['agent_main_name']['S'] 
-            for item in self.response['Items'] 
-            if item.get('is_active', {}).get('BOOL', False)
-        ]
+        return [agent.agent_main_name for agent in self.iter_records() if agent.is_active]
     
     @property
     def agent_count(self) -> int:
@@ -72,7 +100,9 @@ class AgentResponseParser:
         Returns:
             int: Number of agents
         """
-        return len(self.response.get('Items', []))
+        if isinstance(self.response, dict):
+            return len(self.response.get('Items', []))
+        return sum(1 for _ in self.iter_items())
     
     
     def get_id_agent_mapping(self) -> Dict[int, str]:
@@ -87,17 +117,9 @@ class AgentResponseParser:
             Exception: For any other unexpected errors
         """
         try:
-            if 'Items' not in self.response:
-                return {}
-                
-            return {
-                int(item['id']['N']): item['agent_main_name']['S']
-                for item in self.response['Items']
-            }
+            return dict(self.iter_id_agent_pairs())
             
-        except KeyError as e:
-            raise KeyError(f"Invalid response structure: {str(e)}")
-        except ValueError as e:
-            raise ValueError(f"Error converting ID to integer: {str(e)}")
+        except (KeyError, ValueError):
+            raise
         except Exception as e:
             raise Exception(f"Error creating ID-agent mapping: {str(e)}")
\ No newline at end of file
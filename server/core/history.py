@@ -0,0 +1,206 @@
+import atexit
+import os
+import queue
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from ..utils.logs import get_logger
+from ..utils.records import AgentToolMapping, HistoryTurn
+
+log = get_logger(__name__)
+
+
+class WriteBehindQueue:
+    def __init__(self, dynamo_client, table_name: str, batch_size: int = 25, linger: float = 0.05,
+                 on_written=None, max_attempts: Optional[int] = None, backoff_base: float = 0.05,
+                 backoff_cap: float = 2.0):
+        """
+        Background writer that batches queued items into BatchWriteItem requests
+
+        Items DynamoDB leaves unprocessed, or that fail with the whole batch, are queued
+        again after a jittered exponential backoff, up to ``max_attempts`` writes each.
+
+        Args:
+            dynamo_client (DynamoDBClient): Client used for the batch writes
+            table_name (str): Table the items are written to
+            batch_size (int): Maximum items per batch (DynamoDB allows 25)
+            linger (float): Seconds to wait for more items before writing a partial batch
+            on_written (Callable[[List[dict]], None]): Called with the items of each batch that were stored
+            max_attempts (Optional[int]): Writes tried per item, HISTORY_WRITE_ATTEMPTS (default 5)
+            backoff_base (float): Delay in seconds before the first retry, doubling after each
+            backoff_cap (float): Upper bound in seconds for one backoff delay
+        """
+        self.dynamo = dynamo_client
+        self.table_name = table_name
+        self.batch_size = min(batch_size, 25)
+        self.linger = linger
+        self.on_written = on_written
+        self.max_attempts = max(1, max_attempts or int(os.getenv("HISTORY_WRITE_ATTEMPTS", "5")))
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._queue: "queue.Queue[Tuple[dict, int]]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+
+    def put(self, item: dict, attempt: int = 0) -> None:
+        self._ensure_started()
+        self._queue.put((item, attempt))
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, batch: List[Tuple[dict, int]]) -> None:
+        items = [item for item, _ in batch]
+        try:
+            leftover = self.dynamo.batch_write_items(self.table_name, items)
+        except Exception as e:
+            log.error("history_batch_failed", table=self.table_name, turns=len(items), error=str(e))
+            leftover = items
+        written = [item for item in items if item not in leftover]
+        self.written += len(written)
+        if written and self.on_written:
+            self.on_written(written)
+        if not leftover:
+            return
+
+        retry = [(item, attempt + 1) for item, attempt in batch
+                 if item in leftover and attempt + 1 < self.max_attempts]
+        if len(retry) < len(leftover):
+            # Out of attempts: the items stay unwritten and the caller keeps whatever it holds for them
+            self.failed += len(leftover) - len(retry)
+            log.error("history_turns_unsaved", table=self.table_name, turns=len(leftover) - len(retry))
+        if retry:
+            attempt = max(a for _, a in retry)
+            # Backing off in the writer thread also slows the next batches, easing throttling
+            delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+            log.warning("history_batch_retry", table=self.table_name, turns=len(retry), attempt=attempt)
+            time.sleep(delay)
+            for item, a in retry:
+                self._queue.put((item, a))
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every queued item has been written. Returns False on timeout."""
+        if self._thread is None:
+            return True
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+
+class HistoryStore:
+    def __init__(self, dynamo_client, table_name: Optional[str] = None, window: Optional[int] = None,
+                 ttl_days: Optional[float] = None, legacy_table: str = "agent_tool_id"):
+        """
+        Conversation history stored as one append-only item per turn
+
+        Turns live in ``table_name`` under partition key ``multi_agent_main_name`` and numeric
+        sort key ``seq``. Each item carries an ``expires_at`` epoch for DynamoDB TTL, so old
+        turns are trimmed server-side. Writes go through a write-behind queue; turns still
+        queued are merged into reads so a worker always sees its own latest turns. A turn
+        the queue gives up on stays in memory, so this worker keeps serving it.
+
+        Args:
+            dynamo_client (DynamoDBClient): Client used for reads and writes
+            table_name (Optional[str]): Turn table, HISTORY_TABLE by default
+            window (Optional[int]): Number of most recent turns returned by ``recent``
+            ttl_days (Optional[float]): Lifetime of a turn; 0 disables expiry
+            legacy_table (str): Table whose ``history`` list attribute is read for agents
+                that have no turns yet
+        """
+        self.dynamo = dynamo_client
+        self.table_name = table_name or os.getenv("HISTORY_TABLE", "agent_history")
+        self.window = window or int(os.getenv("HISTORY_WINDOW", "20"))
+        self.ttl_days = float(os.getenv("HISTORY_TTL_DAYS", "90")) if ttl_days is None else ttl_days
+        self.legacy_table = legacy_table
+        self._pending: Dict[str, Dict[int, str]] = {}
+        self._pending_lock = threading.Lock()
+        self._last_seq = 0
+        self.writer = WriteBehindQueue(dynamo_client, self.table_name, on_written=self._written)
+        atexit.register(self.writer.flush)
+
+    def _next_seq(self) -> int:
+        with self._pending_lock:
+            self._last_seq = max(time.time_ns(), self._last_seq + 1)
+            return self._last_seq
+
+    def _item(self, agent_name: str, seq: int, text: str) -> dict:
+        expires_at = int(time.time() + self.ttl_days * 86400) if self.ttl_days else None
+        return HistoryTurn(agent_name, seq, text, expires_at).to_item()
+
+    def _enqueue(self, agent_name: str, seq: int, text: str) -> None:
+        with self._pending_lock:
+            self._pending.setdefault(agent_name, {})[seq] = text
+        self.writer.put(self._item(agent_name, seq, text))
+
+    def _written(self, batch: List[dict]) -> None:
+        with self._pending_lock:
+            for turn in HistoryTurn.iter_items(batch):
+                pending = self._pending.get(turn.multi_agent_main_name)
+                if pending is not None:
+                    pending.pop(turn.seq, None)
+                    if not pending:
+                        del self._pending[turn.multi_agent_main_name]
+
+    def append(self, agent_name: str, text: str) -> None:
+        """Queue a turn for writing; returns without waiting for DynamoDB"""
+        self._enqueue(agent_name, self._next_seq(), text)
+
+    def recent(self, agent_name: str, legacy: Optional[List[str]] = None) -> List[str]:
+        """
+        Return the agent's most recent turns, oldest first
+
+        Args:
+            agent_name (str): multi_agent_main_name of the agent
+            legacy (Optional[List[str]]): The agent's legacy inline history if the caller has
+                already read it; otherwise it is fetched when the agent has no turns
+        """
+        items = self.dynamo.query_partition(
+            self.table_name, "multi_agent_main_name", {"S": agent_name},
+            limit=self.window, newest_first=True
+        )
+        turns = {turn.seq: turn.turn for turn in HistoryTurn.iter_items(items)}
+        with self._pending_lock:
+            turns.update(self._pending.get(agent_name, {}))
+        if not turns:
+            return self._import_legacy(agent_name, legacy)
+        return [turns[seq] for seq in sorted(turns)[-self.window:]]
+
+    def _import_legacy(self, agent_name: str, legacy: Optional[List[str]] = None) -> List[str]:
+        """
+        Read the old inline ``history`` list and queue it as turns
+
+        Legacy turns get sequence numbers 1..n, below any time-based sequence, so
+        importing them more than once rewrites the same items.
+        """
+        if legacy is None:
+            item = self.dynamo.get_item(self.legacy_table, {"multi_agent_main_name": {"S": agent_name}},
+                                        attributes=["history"])
+            legacy = AgentToolMapping.from_item(item).history or []
+        for seq, text in enumerate(legacy, start=1):
+            self._enqueue(agent_name, seq, text)
+        return legacy[-self.window:]
@@ -1,26 +1,98 @@
-from langchain.embeddings.openai import OpenAIEmbeddings
-from langchain.vectorstores import FAISS
-from langchain.schema import Document
-from ..utils.db_utils import DynamoDBClient
-from dotenv import load_dotenv
-import os
-load_dotenv()
-dyno= DynamoDBClient()
-embedding_model = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
+import threading
+import weakref
+
+from .components import components, embedding_model, vector_indexes
+from ..utils.tracing import span
+from ..utils.singleflight import SingleFlight
 DYNAMO_TABLE_NAME = "agent_tool_id"
+RETRIEVAL_K = 4
+
+_retrievals = SingleFlight("retrieve")
+# Search state lives as long as the agent's index stays loaded
+_engines = weakref.WeakKeyDictionary()
+_engines_lock = threading.Lock()
+
+
+def _engine(index):
+    with _engines_lock:
+        engine = _engines.get(index)
+        if engine is None:
+            from .retrieval import RetrievalEngine
+            engine = _engines[index] = RetrievalEngine()
+        return engine
+
+
+def _spill(index, archive):
+    """Seal turns beyond the hot tier into archive segments; caller holds ``index.lock``"""
+    spilled = False
+    while len(index) >= archive.hot_turns + archive.segment_turns:
+        n = archive.segment_turns
+        archive.seal(index.agent_name, index.texts[:n], index.vectors[:n])
+        index.trim(len(index) - n)
+        spilled = True
+    return spilled
+
+
+def remember(agent_name, text):
+    """Embed a newly appended turn once and store it in the agent's vector index."""
+    index = vector_indexes.get(agent_name)
+    archive = components.get("archive")
+    with index.lock:
+        if not index.missing([text]):
+            return
+        index.add([text], embedding_model.embed_documents([text]))
+        if archive is not None:
+            _spill(index, archive)
+        vector_indexes.save(index)
 
 
 # Function to chat and fetch relevant past interactions
-def retrieve_relevant(user_input,dyno_list):
-    vectorstore = FAISS.from_documents([Document(page_content="hello")], embedding_model)
-    for dl in dyno_list:
-        vectorstore.add_documents([Document(page_content=dl)])
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 4})
-
-    retrieved_docs = retriever.get_relevant_documents(user_input)
-    retrieved_text = "\n\n\n".join([doc.page_content for doc in retrieved_docs])
-    
-    return retrieved_text
+def retrieve_relevant(user_input, dyno_list, agent_name):
+    return "\n\n\n".join(retrieve_turns(user_input, dyno_list, agent_name))
+
+
+def retrieve_turns(user_input, dyno_list, agent_name):
+    """The past turns most relevant to the query, most relevant first"""
+    history = list(dyno_list)
+    if not history:
+        return ()
+    # Identical concurrent queries over the same history share one retrieval
+    return _retrievals.do((agent_name, user_input, tuple(history)),
+                          lambda: _retrieve(user_input, history, agent_name))
+
+
+def _retrieve(user_input, history, agent_name):
+    index = vector_indexes.get(agent_name)
+    archive = components.get("archive")
+    with span("retrieve", "sync_index"), index.lock:
+        # Only turns written before the index existed (or by another worker) need embedding
+        missing = index.missing(history)
+        if missing:
+            index.add(missing, embedding_model.embed_documents(missing))
+        # Without a cold tier, turns that left the history window are forgotten
+        changed = _spill(index, archive) if archive is not None else index.retain(history)
+        if changed or missing:
+            vector_indexes.save(index)
+        # The index swaps in new lists and matrices on change, so these stay a consistent snapshot
+        texts, vectors = index.texts, index.vectors
+
+    with span("retrieve", "embed_query"):
+        query_vector = embedding_model.embed_query(user_input)
+    engine = _engine(index)
+    with span("retrieve", "search"), engine.lock:
+        engine.sync(texts, vectors)
+        rows = engine.search(query_vector, k=RETRIEVAL_K, query_text=user_input)
+        scores = engine.similarity(query_vector, rows) if archive is not None else ()
+    if archive is None:
+        return tuple(texts[row] for row in rows)
+
+    # Hot and archived turns compete on cosine similarity for the k slots
+    with span("retrieve", "archive"):
+        cold = archive.search(agent_name, query_vector, RETRIEVAL_K)
+    if not cold:
+        return tuple(texts[row] for row in rows)
+    hits = sorted([(score, texts[row]) for score, row in zip(scores, rows)] + cold, key=lambda hit: -hit[0])
+    return tuple(dict.fromkeys(text for _, text in hits))[:RETRIEVAL_K]
 
 
 if __name__=="__main__":
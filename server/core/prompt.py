@@ -0,0 +1,344 @@
+"""
+Token-budgeted prompt assembly for /query
+
+The prompt sent to both backends is the instruction and user query, a rolling summary
+of the agent's conversation, then the retrieved past turns, most relevant first. The
+query is always sent whole; the summary gets at most ``summary_tokens`` and each
+retrieved turn at most ``turn_tokens``, its answer cut first. Turns that no longer fit
+in what is left of ``budget`` are dropped.
+
+The summary is extractive: every turn is folded in once, as one line holding the
+question and the opening of the answer, and the oldest lines are dropped when it
+outgrows its share. Folding only appends, so keeping it current costs one line per
+turn. Summaries are kept in an LRU and stored one item per agent in DynamoDB, next to
+the history, so every worker folds into the same summary.
+
+Tokens are estimated at four characters each, close enough for English text against
+the budgets' margins and without a tokenizer dependency.
+
+Environment:
+    PROMPT_TOKEN_BUDGET     Tokens per prompt, e.g. 2000; default 0 sends the untrimmed legacy prompt
+    PROMPT_TURN_TOKENS      Tokens per retrieved turn, default 400
+    PROMPT_SUMMARY_TOKENS   Tokens of rolling summary, default 300; 0 disables the summary
+    PROMPT_SUMMARY_TABLE    Summary table keyed by ``multi_agent_main_name`` (S), default prompt_summaries
+    PROMPT_SUMMARY_CACHE_SIZE   Agent summaries kept in memory, default 1024
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+from typing import List, Optional, Sequence
+
+from ..utils.logs import get_logger
+from ..utils.records import PromptSummary
+from ..utils.tracing import metrics
+
+log = get_logger(__name__)
+
+INSTRUCTION = "please answer current user query and take help from past interaction if required."
+CHARS_PER_TOKEN = 4
+ELLIPSIS = " ..."
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def truncate(text: str, tokens: int) -> str:
+    """Cut ``text`` to about ``tokens`` tokens at a word boundary, marking the cut"""
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    if limit <= len(ELLIPSIS):
+        return ""
+    cut = text[:limit - len(ELLIPSIS)]
+    space = cut.rfind(" ")
+    if space > len(cut) // 2:
+        cut = cut[:space]
+    return cut.rstrip() + ELLIPSIS
+
+
+def split_turn(turn: str):
+    """(question, answer) of a stored ``User: ...\\nAI: ...`` turn; other text is all answer"""
+    if turn.startswith("User: "):
+        question, sep, answer = turn[len("User: "):].partition("\nAI: ")
+        if sep:
+            return question, answer
+    return "", turn
+
+
+def compress_turn(turn: str, tokens: int) -> str:
+    """Fit one turn into ``tokens``, keeping the question (up to half the share) and cutting the answer"""
+    if estimate_tokens(turn) <= tokens:
+        return turn
+    question, answer = split_turn(turn)
+    if not question:
+        return truncate(turn, tokens)
+    head = "User: " + truncate(question, max(1, tokens // 2)) + "\nAI: "
+    return head + truncate(answer, max(0, tokens - estimate_tokens(head)))
+
+
+def digest(turn: str) -> str:
+    return hashlib.sha1(turn.encode()).hexdigest()[:16]
+
+
+class RollingSummary:
+    def __init__(self, agent_name: str, lines: Optional[List[List[str]]] = None, seen: Sequence[str] = (),
+                 version: int = 0):
+        """
+        Args:
+            agent_name (str): multi_agent_main_name the summary belongs to
+            lines (Optional[List[List[str]]]): [turn digest, summary line] pairs, oldest first
+            seen (Sequence[str]): Digests of turns already folded in
+            version (int): Version of the stored item this was read from; 0 if none
+        """
+        self.agent_name = agent_name
+        self.lock = threading.Lock()
+        self.reset(lines, seen, version)
+
+    def reset(self, lines: Optional[List[List[str]]], seen: Sequence[str], version: int) -> None:
+        """Replace the contents, e.g. with a newer copy written by another worker"""
+        self.lines = lines or []
+        # History windows are far smaller than this, so a turn is never folded twice
+        self.seen = deque(seen, maxlen=512)
+        self._seen = set(self.seen)
+        self.version = version
+
+    def fold(self, turn: str, max_tokens: int) -> bool:
+        """Append a line for ``turn`` unless it was already folded in. Returns True on change."""
+        key = digest(turn)
+        if key in self._seen:
+            return False
+        if len(self.seen) == self.seen.maxlen:
+            self._seen.discard(self.seen[0])
+        self.seen.append(key)
+        self._seen.add(key)
+
+        question, answer = split_turn(turn)
+        answer = " ".join(answer.split())
+        first = _SENTENCE_END.split(answer, 1)[0]
+        line = "- " + (f"Q: {truncate(' '.join(question.split()), 16)} A: " if question else "") + truncate(first, 24)
+        self.lines.append([key, line])
+        while len(self.lines) > 1 and sum(estimate_tokens(l) + 1 for _, l in self.lines) > max_tokens:
+            self.lines.pop(0)
+        return True
+
+    def render(self, max_tokens: int, exclude: Sequence[str] = ()) -> str:
+        """Newest lines that fit in ``max_tokens``, oldest first, skipping turns in ``exclude``"""
+        skip = {digest(t) for t in exclude}
+        picked, used = [], 0
+        for key, line in reversed(self.lines):
+            if key in skip:
+                continue
+            cost = estimate_tokens(line) + 1
+            if used + cost > max_tokens:
+                break
+            picked.append(line)
+            used += cost
+        return "\n".join(reversed(picked))
+
+
+class SummaryStore:
+    def __init__(self, dynamo_client, table_name: Optional[str] = None, max_agents: Optional[int] = None,
+                 max_tokens: Optional[int] = None, retries: int = 3):
+        """
+        LRU of per-agent rolling summaries, stored as one DynamoDB item per agent
+
+        Writes are conditional on the version that was read, so workers folding turns into
+        the same summary never overwrite each other: the one that loses reloads the item,
+        folds its turns into it again and retries.
+
+        Args:
+            dynamo_client (DynamoDBClient): Client used for reads and writes
+            table_name (Optional[str]): Summary table, PROMPT_SUMMARY_TABLE by default
+            max_agents (Optional[int]): Summaries kept in memory
+            max_tokens (Optional[int]): Size a summary is trimmed to; keep more than is rendered,
+                since lines of turns sent in full are skipped when rendering
+            retries (int): Writes attempted per fold before giving up until the next one
+        """
+        self.dynamo = dynamo_client
+        self.table_name = table_name or os.getenv("PROMPT_SUMMARY_TABLE", "prompt_summaries")
+        self.max_agents = max_agents or int(os.getenv("PROMPT_SUMMARY_CACHE_SIZE", "1024"))
+        self.max_tokens = max_tokens if max_tokens is not None else 2 * int(os.getenv("PROMPT_SUMMARY_TOKENS", "300"))
+        self.retries = max(1, retries)
+        self._summaries: "OrderedDict[str, RollingSummary]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, agent_name: str) -> RollingSummary:
+        with self._lock:
+            summary = self._summaries.get(agent_name)
+            if summary is not None:
+                self._summaries.move_to_end(agent_name)
+                return summary
+        summary = self._load(agent_name)
+        with self._lock:
+            summary = self._summaries.setdefault(agent_name, summary)
+            self._summaries.move_to_end(agent_name)
+            while len(self._summaries) > self.max_agents:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def _key(self, agent_name: str):
+        return {"multi_agent_main_name": {"S": agent_name}}
+
+    def _read(self, agent_name: str) -> Optional[PromptSummary]:
+        # A read of its own: after a failed conditional write it must see the newer item
+        item = self.dynamo.get_item(self.table_name, self._key(agent_name), coalesce=False)
+        return PromptSummary.from_item(item) if item else None
+
+    def _load(self, agent_name: str) -> RollingSummary:
+        try:
+            stored = self._read(agent_name)
+            if stored is None:
+                return RollingSummary(agent_name)
+            return RollingSummary(agent_name, json.loads(stored.lines), stored.seen or (), stored.version)
+        except (ValueError, KeyError) as e:
+            log.warning("prompt_summary_discarded", agent=agent_name, error=str(e))
+        except Exception as e:
+            log.warning("prompt_summary_unavailable", agent=agent_name, error=str(e))
+        return RollingSummary(agent_name)
+
+    def _save(self, summary: RollingSummary) -> None:
+        """
+        Write a summary unless another worker has written a newer one; caller holds ``summary.lock``
+
+        Raises:
+            ValueError: The stored item is no longer the version this summary was read from
+        """
+        version = summary.version + 1
+        item = PromptSummary(multi_agent_main_name=summary.agent_name, lines=json.dumps(summary.lines),
+                             seen=list(summary.seen), version=version).to_item()
+        if summary.version:
+            self.dynamo.add_item(self.table_name, item, condition="version = :version",
+                                 values={":version": {"N": str(summary.version)}})
+        else:
+            self.dynamo.add_item(self.table_name, item, condition="attribute_not_exists(multi_agent_main_name)")
+        summary.version = version
+
+    def fold(self, agent_name: str, turns: Sequence[str]) -> RollingSummary:
+        """
+        Fold any of ``turns`` (oldest first) not yet in the agent's summary
+
+        Turns answered by this worker are folded as they are saved; passing the history
+        window on every query also picks up turns written by other workers.
+        """
+        summary = self.get(agent_name)
+        with summary.lock:
+            changed = False
+            for _ in range(self.retries):
+                for turn in turns:
+                    changed = summary.fold(turn, self.max_tokens) or changed
+                if not changed:
+                    break
+                try:
+                    self._save(summary)
+                    break
+                except ValueError:
+                    # Another worker wrote first: fold into its copy instead
+                    try:
+                        stored = self._read(agent_name)
+                    except Exception as e:
+                        log.warning("prompt_summary_unavailable", agent=agent_name, error=str(e))
+                        break
+                    if stored is None:
+                        summary.version = 0  # Deleted since; write ours afresh
+                    else:
+                        summary.reset(json.loads(stored.lines), stored.seen or (), stored.version)
+                        changed = False
+                except Exception as e:
+                    log.warning("prompt_summary_save_failed", agent=agent_name, error=str(e))
+                    break
+        return summary
+
+
+class PromptBuilder:
+    def __init__(self, summaries: Optional[SummaryStore], budget: int, turn_tokens: int, summary_tokens: int):
+        """
+        Args:
+            summaries (Optional[SummaryStore]): Rolling summaries; None leaves the summary out
+            budget (int): Tokens per prompt; the query itself is never cut
+            turn_tokens (int): Tokens per retrieved turn
+            summary_tokens (int): Tokens of summary
+        """
+        self.summaries = summaries
+        self.budget = budget
+        self.turn_tokens = turn_tokens
+        self.summary_tokens = summary_tokens
+
+    def build(self, agent_name: str, query: str, retrieved: Sequence[str]) -> str:
+        """
+        Assemble the prompt for one query
+
+        Only reads the agent's summary; turns are folded into it off the request path by
+        ``remember``, so a query never waits on a summary write.
+
+        Args:
+            agent_name (str): multi_agent_main_name of the agent
+            query (str): The user's query
+            retrieved (Sequence[str]): Turns retrieved for the query, most relevant first
+        """
+        head = f"{INSTRUCTION}\ncurrent query from user : {query}\n"
+        remaining = self.budget - estimate_tokens(head)
+
+        summary = ""
+        if self.summaries is not None:
+            rolling = self.summaries.get(agent_name)
+            with rolling.lock:
+                # Turns sent in full below need no summary line
+                summary = rolling.render(min(self.summary_tokens, max(0, remaining // 3)), exclude=retrieved)
+            if summary:
+                summary = f"CONVERSATION SUMMARY:\n{summary}\n"
+                remaining -= estimate_tokens(summary)
+
+        label = "PAST INTERACTIONS:\n"
+        remaining -= estimate_tokens(label)
+        turns, dropped = [], 0
+        for turn in retrieved:
+            separator = estimate_tokens("\n\n\n") if turns else 0
+            share = min(self.turn_tokens, remaining - separator)
+            text = compress_turn(turn, share) if share > 0 else ""
+            # A turn cut down to little more than its question is not worth sending
+            if not text or estimate_tokens(text) < min(estimate_tokens(turn), 16):
+                dropped += 1
+                continue
+            turns.append(text)
+            remaining -= estimate_tokens(text) + separator
+        past = "\n\n\n".join(turns)
+
+        metrics.inc("agent_server_prompt_tokens_total", estimate_tokens(head), section="query")
+        metrics.inc("agent_server_prompt_tokens_total", estimate_tokens(summary), section="summary")
+        metrics.inc("agent_server_prompt_tokens_total", estimate_tokens(past), section="history")
+        if dropped:
+            metrics.inc("agent_server_prompt_turns_dropped_total", dropped)
+        return head + summary + label + past
+
+    def remember(self, agent_name: str, turns: Sequence[str]) -> None:
+        """
+        Fold turns (oldest first) into the agent's summary; run in the background
+
+        Pass the history window the query was answered from along with the new turn, so
+        turns saved by other workers are picked up too.
+        """
+        if self.summaries is not None:
+            self.summaries.fold(agent_name, turns)
+
+
+def legacy_prompt(query: str, retrieved: Sequence[str]) -> str:
+    return f"{INSTRUCTION}\ncurrent query from user : {query}\nPAST INTERACTIONS:\n" + "\n\n\n".join(retrieved)
+
+
+def create_prompt_builder(dynamo_client) -> Optional[PromptBuilder]:
+    """Build the assembler configured by PROMPT_*, or None (the legacy prompt) unless PROMPT_TOKEN_BUDGET is set"""
+    budget = int(os.getenv("PROMPT_TOKEN_BUDGET", "0"))
+    if budget <= 0:
+        return None
+    summary_tokens = int(os.getenv("PROMPT_SUMMARY_TOKENS", "300"))
+    return PromptBuilder(
+        SummaryStore(dynamo_client, max_tokens=2 * summary_tokens) if summary_tokens > 0 else None,
+        budget=budget,
+        turn_tokens=int(os.getenv("PROMPT_TURN_TOKENS", "400")),
+        summary_tokens=summary_tokens,
+    )
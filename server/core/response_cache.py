@@ -0,0 +1,174 @@
+"""
+Per-agent cache of /query responses
+
+Two tiers per agent (and tools key): an exact tier keyed by a hash of the normalized
+query, and a semantic tier that serves the response of an earlier query whose
+embedding has cosine similarity of at least ``similarity`` with the new one. The query
+embedding is the one retrieval computes anyway, so the semantic tier adds no model call
+once the embedding cache is warm. Entries expire after ``ttl`` seconds; each agent keeps
+at most ``max_entries`` and at most ``max_agents`` agents are kept, least recently used
+evicted first.
+
+Environment:
+    RESPONSE_CACHE_AGENTS       Comma-separated agent names to cache, or * for all; unset disables
+    RESPONSE_CACHE_TTL          Seconds a response is served for, default 300
+    RESPONSE_CACHE_SIZE         Responses kept per agent, default 256
+    RESPONSE_CACHE_MAX_AGENTS   Agents kept, default 1000
+    RESPONSE_CACHE_SIMILARITY   Cosine similarity for a semantic hit, default 0.95; 0 disables the tier
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from ..utils.tracing import metrics, span
+
+
+def normalize_query(query: str) -> str:
+    """Case, surrounding whitespace, repeated spaces and trailing punctuation don't change the question"""
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
+
+class _AgentEntries:
+    __slots__ = ("responses", "matrix", "matrix_keys")
+
+    def __init__(self):
+        # query hash -> (response body, expires_at, unit query vector or None)
+        self.responses: "OrderedDict[str, Tuple[Any, float, Optional[np.ndarray]]]" = OrderedDict()
+        self.matrix: Optional[np.ndarray] = None  # Stacked vectors, rebuilt after a change
+        self.matrix_keys: List[str] = []
+
+
+class ResponseCache:
+    def __init__(self, embed_query: Callable[[str], List[float]], agents: Optional[set] = None,
+                 ttl: float = 300.0, max_entries: int = 256, max_agents: int = 1000, similarity: float = 0.95):
+        """
+        Args:
+            embed_query (Callable[[str], List[float]]): Embeds a query for the semantic tier
+            agents (Optional[set]): Agent names to cache; None caches every agent
+            ttl (float): Seconds a response is served for
+            max_entries (int): Responses kept per cache partition
+            max_agents (int): Partitions kept
+            similarity (float): Cosine similarity for a semantic hit; 0 disables the tier
+        """
+        self.embed_query = embed_query
+        self.agents = agents
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_agents = max_agents
+        self.similarity = similarity
+        self._partitions: "OrderedDict[Tuple[str, Hashable], _AgentEntries]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def enabled_for(self, agent_name: Optional[str]) -> bool:
+        return bool(agent_name) and (self.agents is None or agent_name in self.agents)
+
+    def _vector(self, query: str) -> Optional[np.ndarray]:
+        if self.similarity <= 0:
+            return None
+        vector = np.asarray(self.embed_query(query), dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else None
+
+    def get(self, partition: Tuple[str, Hashable], query: str) -> Tuple[Optional[Any], str]:
+        """
+        Look up a response for ``query`` in one partition, (agent name, anything else the
+        response depends on)
+
+        Returns:
+            Tuple[Optional[Any], str]: (response body, "exact" or "semantic"), or (None, "miss")
+        """
+        key = hashlib.sha256(normalize_query(query).encode()).hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            entries = self._partitions.get(partition)
+            if entries is not None:
+                self._partitions.move_to_end(partition)
+                self._expire(entries, now)
+                hit = entries.responses.get(key)
+                if hit is not None:
+                    entries.responses.move_to_end(key)
+                    metrics.inc("agent_server_response_cache_total", outcome="exact_hit")
+                    return hit[0], "exact"
+            if entries is None or not entries.responses:
+                metrics.inc("agent_server_response_cache_total", outcome="miss")
+                return None, "miss"
+
+        vector = self._vector(query)
+        if vector is not None:
+            with span("response_cache", "semantic_lookup"), self._lock:
+                best_key = self._nearest(entries, vector)
+                if best_key is not None and best_key in entries.responses:
+                    entries.responses.move_to_end(best_key)
+                    metrics.inc("agent_server_response_cache_total", outcome="semantic_hit")
+                    return entries.responses[best_key][0], "semantic"
+        metrics.inc("agent_server_response_cache_total", outcome="miss")
+        return None, "miss"
+
+    def _nearest(self, entries: _AgentEntries, vector: np.ndarray) -> Optional[str]:
+        """Key of the most similar stored query at or above the threshold; caller holds the lock"""
+        if entries.matrix is None:
+            keys = [k for k, (_, _, v) in entries.responses.items() if v is not None and v.shape == vector.shape]
+            if not keys:
+                return None
+            entries.matrix_keys = keys
+            entries.matrix = np.stack([entries.responses[k][2] for k in keys])
+        if entries.matrix.shape[1] != vector.shape[0]:
+            return None
+        scores = entries.matrix @ vector
+        best = int(np.argmax(scores))
+        return entries.matrix_keys[best] if scores[best] >= self.similarity else None
+
+    def put(self, partition: Tuple[str, Hashable], query: str, body: Any) -> None:
+        key = hashlib.sha256(normalize_query(query).encode()).hexdigest()
+        vector = self._vector(query)
+        with self._lock:
+            entries = self._partitions.get(partition)
+            if entries is None:
+                entries = self._partitions[partition] = _AgentEntries()
+                while len(self._partitions) > self.max_agents:
+                    self._partitions.popitem(last=False)
+            self._partitions.move_to_end(partition)
+            entries.responses[key] = (body, time.monotonic() + self.ttl, vector)
+            entries.responses.move_to_end(key)
+            while len(entries.responses) > self.max_entries:
+                entries.responses.popitem(last=False)
+            entries.matrix = None
+
+    @staticmethod
+    def _expire(entries: _AgentEntries, now: float) -> None:
+        expired = [k for k, (_, expires_at, _) in entries.responses.items() if expires_at <= now]
+        for k in expired:
+            del entries.responses[k]
+        if expired:
+            entries.matrix = None
+
+    def invalidate(self, agent_name: str) -> None:
+        """Drop every cached response of an agent"""
+        with self._lock:
+            for partition in [p for p in self._partitions if p[0] == agent_name]:
+                del self._partitions[partition]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"agents": len(self._partitions),
+                    "responses": sum(len(e.responses) for e in self._partitions.values())}
+
+
+def create_response_cache(embed_query: Callable[[str], List[float]]) -> Optional[ResponseCache]:
+    """Build the cache configured by RESPONSE_CACHE_*, or None when no agent opted in"""
+    agents = os.getenv("RESPONSE_CACHE_AGENTS", "").strip()
+    if not agents:
+        return None
+    return ResponseCache(
+        embed_query,
+        agents=None if agents == "*" else {a.strip() for a in agents.split(",") if a.strip()},
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", "300")),
+        max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "256")),
+        max_agents=int(os.getenv("RESPONSE_CACHE_MAX_AGENTS", "1000")),
+        similarity=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95")),
+    )
@@ -0,0 +1,214 @@
+"""
+Top-k retrieval over one agent's turn embeddings
+
+The engine searches the agent's embedding matrix in place: one matrix-vector
+product, scaled by cached inverse row norms, gives every turn's cosine similarity,
+and ``argpartition`` picks the top k. Optionally a BM25 keyword score first narrows
+large memories to a candidate set, and MMR re-ranking trades a little relevance for
+less redundant results. Past ``faiss_threshold`` turns the search runs on a FAISS
+inner-product index built once and extended as turns are appended.
+
+State is kept per index and updated incrementally when turns are only appended;
+any other change (turns dropped) rebuilds it.
+
+Environment:
+    RETRIEVAL_FAISS_THRESHOLD       Turns from which FAISS is used, default 50000
+    RETRIEVAL_PREFILTER_MIN         Turns from which the BM25 prefilter runs, default 0 (disabled)
+    RETRIEVAL_PREFILTER_CANDIDATES  Turns the prefilter keeps, default 256
+    RETRIEVAL_MMR_LAMBDA            Relevance weight for MMR re-ranking, e.g. 0.7; unset disables
+"""
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class LexicalIndex:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """Append-only BM25 index: term -> (doc rows, term frequencies)"""
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, tuple] = {}
+        self.lengths: List[int] = []
+        self._lengths_array: Optional[np.ndarray] = None
+
+    def extend(self, texts: Sequence[str]) -> None:
+        for text in texts:
+            row = len(self.lengths)
+            tokens = tokenize(text)
+            for term, count in Counter(tokens).items():
+                rows, tfs = self.postings.setdefault(term, ([], []))
+                rows.append(row)
+                tfs.append(count)
+            self.lengths.append(len(tokens))
+        self._lengths_array = None
+
+    def scores(self, query: str) -> np.ndarray:
+        n = len(self.lengths)
+        scores = np.zeros(n, dtype=np.float32)
+        if not n:
+            return scores
+        if self._lengths_array is None:
+            self._lengths_array = np.asarray(self.lengths, dtype=np.float32)
+        avgdl = float(self._lengths_array.mean()) or 1.0
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            rows = np.asarray(posting[0])
+            tf = np.asarray(posting[1], dtype=np.float32)
+            idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self._lengths_array[rows] / avgdl)
+            scores[rows] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the ``k`` highest scores, best first"""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+class RetrievalEngine:
+    def __init__(self, faiss_threshold: Optional[int] = None, prefilter_min: Optional[int] = None,
+                 prefilter_candidates: Optional[int] = None, mmr_lambda: Optional[float] = None):
+        """
+        Args:
+            faiss_threshold (Optional[int]): Turns from which a FAISS index answers searches
+            prefilter_min (Optional[int]): Turns from which BM25 narrows the candidates; 0 disables
+            prefilter_candidates (Optional[int]): Candidates the prefilter keeps
+            mmr_lambda (Optional[float]): MMR relevance weight in [0, 1]; None disables MMR
+        """
+        self.faiss_threshold = faiss_threshold or int(os.getenv("RETRIEVAL_FAISS_THRESHOLD", "50000"))
+        self.prefilter_min = prefilter_min if prefilter_min is not None else int(os.getenv("RETRIEVAL_PREFILTER_MIN", "0"))
+        self.prefilter_candidates = prefilter_candidates or int(os.getenv("RETRIEVAL_PREFILTER_CANDIDATES", "256"))
+        if mmr_lambda is None and os.getenv("RETRIEVAL_MMR_LAMBDA"):
+            mmr_lambda = float(os.getenv("RETRIEVAL_MMR_LAMBDA"))
+        self.mmr_lambda = mmr_lambda
+        self.texts: List[str] = []
+        self.vectors: Optional[np.ndarray] = None
+        self.inv_norms = np.zeros(0, dtype=np.float32)
+        self.lexical: Optional[LexicalIndex] = None
+        self.faiss = None
+        self.lock = threading.Lock()
+
+    def sync(self, texts: List[str], vectors: np.ndarray) -> None:
+        """
+        Point the engine at an index's current turns; caller holds ``lock``
+
+        ``AgentVectorIndex`` replaces its lists and matrix on every change, keeping the old
+        rows as a prefix when turns are only appended, which is detected here by identity.
+        """
+        if texts is self.texts and vectors is self.vectors:
+            return
+        old = len(self.texts)
+        appended = 0 < old <= len(texts) and texts[old - 1] is self.texts[-1]
+        start = old if appended else 0
+        if not appended:
+            self.lexical, self.faiss = None, None
+
+        new = np.asarray(vectors[start:], dtype=np.float32)
+        norms = np.linalg.norm(new, axis=1) if len(new) else np.zeros(0, dtype=np.float32)
+        inv = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0).astype(np.float32)
+        self.inv_norms = np.concatenate([self.inv_norms[:start], inv])
+        if self.lexical is not None:
+            self.lexical.extend(texts[start:])
+        if self.faiss is not None:
+            self.faiss.add(new * inv[:, None])
+        self.texts, self.vectors = texts, vectors
+
+    def _cosine(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        if rows is None:
+            return (self.vectors @ query) * self.inv_norms
+        return (self.vectors[rows] @ query) * self.inv_norms[rows]
+
+    def _faiss_search(self, query: np.ndarray, k: int) -> Optional[np.ndarray]:
+        if self.faiss is None:
+            try:
+                import faiss
+            except ImportError:
+                return None
+            self.faiss = faiss.IndexFlatIP(self.vectors.shape[1])
+            for start in range(0, len(self.texts), 65536):
+                chunk = np.asarray(self.vectors[start:start + 65536], dtype=np.float32)
+                self.faiss.add(chunk * self.inv_norms[start:start + 65536, None])
+        _, rows = self.faiss.search(query[None, :], k)
+        return rows[0][rows[0] >= 0]
+
+    def search(self, query_vector: Sequence[float], k: int = 4, query_text: Optional[str] = None) -> List[int]:
+        """
+        Rows of the ``k`` turns most similar to the query, best first; caller holds ``lock``
+
+        Args:
+            query_vector (Sequence[float]): Query embedding
+            k (int): Turns to return
+            query_text (Optional[str]): Query text for the BM25 prefilter
+        """
+        n = len(self.texts)
+        if not n or k <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        q_norm = float(np.linalg.norm(query))
+        if q_norm:
+            query = query / q_norm
+        fetch = min(n, max(k * 4, 20)) if self.mmr_lambda is not None else min(n, k)
+
+        candidates = None
+        if query_text and self.prefilter_min and n >= self.prefilter_min:
+            if self.lexical is None:
+                self.lexical = LexicalIndex()
+                self.lexical.extend(self.texts)
+            lexical = self.lexical.scores(query_text)
+            matched = np.flatnonzero(lexical > 0)
+            # No keyword overlap at all says nothing about meaning; search everything instead
+            if len(matched) >= fetch:
+                candidates = matched[_top(lexical[matched], min(len(matched), max(self.prefilter_candidates, fetch)))]
+
+        if candidates is not None:
+            scores = self._cosine(query, candidates)
+            rows = candidates[_top(scores, fetch)]
+        elif n >= self.faiss_threshold:
+            rows = self._faiss_search(query, fetch)
+            if rows is None:
+                rows = _top(self._cosine(query), fetch)
+        else:
+            rows = _top(self._cosine(query), fetch)
+
+        if self.mmr_lambda is not None and len(rows) > k:
+            rows = self._mmr(query, rows, k)
+        return [int(r) for r in rows[:k]]
+
+    def similarity(self, query_vector: Sequence[float], rows: Sequence[int]) -> List[float]:
+        """Cosine similarity of the query to the given rows; caller holds ``lock``"""
+        if not len(rows):
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        q_norm = float(np.linalg.norm(query))
+        return self._cosine(query / q_norm if q_norm else query, np.asarray(rows)).tolist()
+
+    def _mmr(self, query: np.ndarray, rows: np.ndarray, k: int) -> np.ndarray:
+        """Greedy maximal marginal relevance over the candidate rows"""
+        unit = np.asarray(self.vectors[rows], dtype=np.float32) * self.inv_norms[rows][:, None]
+        relevance = unit @ query
+        similarity = unit @ unit.T
+        selected = [int(np.argmax(relevance))]
+        redundancy = similarity[selected[0]].copy()
+        while len(selected) < k:
+            score = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * redundancy
+            score[selected] = -np.inf
+            best = int(np.argmax(score))
+            selected.append(best)
+            redundancy = np.maximum(redundancy, similarity[best])
+        return rows[selected]
@@ -0,0 +1,54 @@
+import os
+from typing import Optional
+
+from ..utils.cache import TTLCache
+from ..utils.records import AgentToolMapping
+
+
+_route_cache = TTLCache(
+    maxsize=int(os.getenv("ROUTE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("ROUTE_CACHE_TTL", "600")),
+    negative_ttl=float(os.getenv("ROUTE_CACHE_NEGATIVE_TTL", "5"))
+)
+
+
+class AgentRouter:
+    def __init__(self, dynamo_client, table_name="agent_tool_id"):
+        self.dynamo = dynamo_client
+        self.table_name = table_name
+
+    def resolve(self, agent_name) -> Optional[dict]:
+        """
+        Read-through lookup of an agent's routing record
+
+        One projected get_item fetches the Eliza and tools IDs together with the legacy
+        inline ``history`` list, so /query needs no second read of the same key.
+
+        Returns:
+            Optional[dict]: {"agent_id", "tools_agent_id", "legacy_history"}, or None if the
+            agent does not exist
+        """
+        route = _route_cache.get((self.table_name, agent_name), False)
+        if route is not False:
+            return route
+
+        item = self.dynamo.get_item(
+            self.table_name,
+            {"multi_agent_main_name": {"S": agent_name}},
+            attributes=["agent_id", "tools_agent_id", "history"]
+        )
+        mapping = AgentToolMapping.from_item(item)
+        route = None
+        if mapping.agent_id:
+            route = {
+                "agent_id": mapping.agent_id,
+                "tools_agent_id": mapping.tools_agent_id,
+                "legacy_history": mapping.history or []
+            }
+        _route_cache.set((self.table_name, agent_name), route)
+        return route
+
+    @staticmethod
+    def invalidate(agent_name, table_name="agent_tool_id"):
+        """Drop the cached route for an agent, e.g. after its mapping is written."""
+        _route_cache.invalidate((table_name, agent_name))
@@ -1,21 +1,219 @@
 # server.py
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response, stream_with_context
 from .agent_session import Session
 from .verify import ApiVerify, AgentVerify
-import requests
-from ..utils.db_utils import DynamoDBClient
 from .generate_api_key import APIKeyManager
-from dotenv import load_dotenv
 import os
+import json
 from .get_agents import AgentResponseParser
 from .agent_map import AgentToolMapper
-from .memory import retrieve_relevant
-load_dotenv()
+from .batch_create import BatchProvisioner, BATCH_CREATE_MAX_ITEMS, BATCH_CREATE_CONCURRENCY
+from .memory import retrieve_turns, remember
+from .prompt import legacy_prompt
+from .components import components, dynamo, downstream, history, router, idempotency
+from ..utils.request_memo import begin_request, end_request
+from ..utils.fanout import fan_out, as_completed, submit, failure_detail
+from ..utils.tracing import begin_trace, end_trace, current_spans, server_timing, metrics, span
+from ..utils.logs import get_logger, configure_logging, shutdown_logging
+from ..utils.cursor import encode_cursor, decode_cursor
+from ..utils.idempotency import fingerprint, REPLAY, IN_PROGRESS, MISMATCH
+from ..utils.ratelimit import retry_after_header
+import functools
+import hashlib
+import time
 
 
 app = Flask(__name__)
-
-dynamo = DynamoDBClient()
+log = get_logger(__name__)
+
+
+def init_worker():
+    """
+    Forget every per-process component. Called by the serving entry point in each worker
+    forked from a preloaded master, so connections, threads and SQLite handles are never
+    shared across processes; the worker rebuilds them on first use.
+    """
+    components.reset()
+    configure_logging(force=True)
+
+
+def shutdown_worker():
+    """Drain queued history writes and close pooled connections before the worker exits."""
+    if components.peek("history") is not None:
+        history.writer.flush()
+    if components.peek("downstream") is not None:
+        downstream.close()
+    shutdown_logging()
+
+ELIZA_TIMEOUT = float(os.getenv("ELIZA_TIMEOUT", "30"))
+AGENT_INFO_PAGE_SIZE = int(os.getenv("AGENT_INFO_PAGE_SIZE", "100"))
+AGENT_INFO_MAX_PAGE_SIZE = int(os.getenv("AGENT_INFO_MAX_PAGE_SIZE", "1000"))
+AGENT_INFO_ATTRIBUTES = ["id", "agent_main_name"]
+TOOLS_TIMEOUT = float(os.getenv("TOOLS_TIMEOUT", "30"))
+IDEMPOTENCY_RETRY_AFTER = os.getenv("IDEMPOTENCY_RETRY_AFTER", "2")
+
+# View -> admission policy (see ratelimit.DEFAULT_LIMITS); unlisted views are not limited
+ADMISSION_POLICIES = {
+    "create_api_key": "create_api_key",
+    "create_session": "create_session",
+    "create_sessions_batch": "create_sessions_batch",
+    "get_agents_info": "agent_info",
+    "process_query": "query",
+    "process_query_stream": "query",
+}
+
+
+def _json_or_none(call):
+    """Body of a successful backend call, or None if it failed, timed out or isn't JSON"""
+    if not call.ok or call.value.status_code != 200:
+        return None
+    try:
+        return call.value.json()
+    except ValueError:
+        return None
+
+
+
+def idempotent(endpoint):
+    """
+    Deduplicate retries of a view by the client's ``Idempotency-Key`` header (or an
+    ``idempotency_key`` body field), scoped to the endpoint and API key. The first
+    attempt runs; if it created something (the view calls ``_created``) its response is
+    replayed to retries until it expires, otherwise the key is released and a retry runs
+    again. Requests without a key run as before, as do all requests if the store is down.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            data = request.get_json(silent=True)
+            data = data if isinstance(data, dict) else {}
+            key = request.headers.get("Idempotency-Key") or data.get("idempotency_key")
+            if not key:
+                return view(*args, **kwargs)
+
+            record_key = idempotency.record_key(f"{endpoint}\0{data.get('api_key') or ''}", str(key))
+            request_fingerprint = fingerprint({k: v for k, v in data.items() if k != "idempotency_key"})
+            try:
+                claim = idempotency.claim(record_key, request_fingerprint)
+            except Exception as e:
+                log.warning("idempotency_unavailable", endpoint=endpoint, error=str(e))
+                return view(*args, **kwargs)
+            metrics.inc("agent_server_idempotency_total", endpoint=endpoint, outcome=claim.state)
+
+            if claim.state == REPLAY:
+                response = Response(claim.body, status=claim.status, mimetype="application/json")
+                response.headers["Idempotent-Replayed"] = "true"
+                return response
+            if claim.state == IN_PROGRESS:
+                return jsonify({"error": "A request with this Idempotency-Key is still in progress."}), 409, \
+                    {"Retry-After": IDEMPOTENCY_RETRY_AFTER}
+            if claim.state == MISMATCH:
+                return jsonify({"error": "This Idempotency-Key was used with a different request."}), 422
+
+            g.idempotent_created = False
+            try:
+                response = app.make_response(view(*args, **kwargs))
+            except Exception:
+                idempotency.release(record_key)
+                raise
+            try:
+                if g.pop("idempotent_created", False):
+                    idempotency.complete(record_key, request_fingerprint, response.status_code,
+                                         response.get_data(as_text=True))
+                else:
+                    idempotency.release(record_key)
+            except Exception as e:
+                log.warning("idempotency_store_failed", endpoint=endpoint, error=str(e))
+            return response
+        return wrapper
+    return decorator
+
+
+def _created():
+    """Mark that the view wrote something a retry must not write again (see ``idempotent``)"""
+    g.idempotent_created = True
+
+
+@app.before_request
+def open_request_memo():
+    g.request_memo_token = begin_request()
+    g.trace_token = begin_trace()
+    g.request_start = time.perf_counter()
+
+def _tenant(policy, data):
+    """
+    Who a request is charged to. Queries are charged to the agent they address, since
+    their api_key is never checked. Otherwise: the API key once ApiVerify accepts it, else
+    the user when no key is sent (/create_api_key), else the client address, so a made-up
+    key cannot pick whose budget a request spends.
+    """
+    if policy == "query":
+        return f"agent:{data['agent_name']}" if data.get("agent_name") else f"ip:{request.remote_addr}"
+    if data.get("api_key"):
+        if ApiVerify(dynamo, os.getenv("API_TABLE")).verify(data["api_key"]):
+            return "key:" + hashlib.sha256(str(data["api_key"]).encode()).hexdigest()[:32]
+    elif data.get("user_id") is not None:
+        return f"user:{data['user_id']}"
+    return f"ip:{request.remote_addr}"
+
+@app.before_request
+def admit_request():
+    policy = ADMISSION_POLICIES.get(request.endpoint)
+    limiter = components.get("rate_limiter") if policy else None
+    if limiter is None:
+        return None
+    data = request.get_json(silent=True)
+    data = data if isinstance(data, dict) else {}
+    if policy != "query" and data.get("api_key"):
+        # Charge the client address before the key is looked up, so made-up keys cannot
+        # make the server query the key index faster than one address's budget allows
+        address = f"ip:{request.remote_addr}"
+        decision = limiter.admit("api_key_check", address)
+        if not decision.allowed:
+            return _rejected("api_key_check", address, decision)
+        limiter.release("api_key_check", address)
+    identity = _tenant(policy, data)
+    decision = limiter.admit(policy, identity)
+    if not decision.allowed:
+        return _rejected(policy, identity, decision)
+    metrics.inc("agent_server_admission_total", policy=policy, outcome=decision.reason)
+    g.admission = (limiter, policy, identity)
+    return None
+
+def _rejected(policy, identity, decision):
+    metrics.inc("agent_server_admission_total", policy=policy, outcome=decision.reason)
+    log.debug("request_rejected", policy=policy, tenant=identity, reason=decision.reason)
+    status = 503 if decision.reason == "shed" else 429
+    message = "Backends are overloaded, retry later." if status == 503 else "Rate limit exceeded."
+    return jsonify({"error": message, "reason": decision.reason,
+                    "retry_after": round(decision.retry_after, 3)}), status, \
+        {"Retry-After": retry_after_header(decision.retry_after)}
+
+@app.after_request
+def add_server_timing(response):
+    elapsed = time.perf_counter() - g.get("request_start", time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.observe("agent_server_request_seconds", elapsed, endpoint=endpoint, status=str(response.status_code))
+    # Streamed bodies are produced after this runs, so their header only covers the setup
+    timing = server_timing(current_spans())
+    response.headers["Server-Timing"] = f"{timing}, total;dur={elapsed * 1000:.1f}" if timing else f"total;dur={elapsed * 1000:.1f}"
+    return response
+
+@app.teardown_request
+def release_admission(exc):
+    admission = g.pop("admission", None)
+    if admission is not None:
+        limiter, policy, identity = admission
+        limiter.release(policy, identity)
+
+@app.teardown_request
+def close_request_memo(exc):
+    token = g.pop("request_memo_token", None)
+    if token is not None:
+        end_request(token)
+    token = g.pop("trace_token", None)
+    if token is not None:
+        end_trace(token)
 
 @app.route("/create_api_key", methods=["POST"])
 def create_api_key():
@@ -33,19 +231,18 @@ def create_api_key():
         return jsonify({"api_key": new_api_key}), 201
 
     except Exception as e:
+        log.exception("create_api_key_failed")
         return jsonify({"error": str(e)}), 500
 
 @app.route("/create_session", methods=["POST"])
+@idempotent("create_session")
 def create_session():
     try:
         # Parse the incoming JSON data
         data = request.json
-        print(data.get("character_file"))
-        print(data.get("api_key"))
-        print(data.get("env_json"))
-        print(data.get("multi_agent_main_name"))
-        print(data.get("multiple_agents_name"))
-        
+        log.debug("create_session_request", character_file=data.get("character_file"), api_key=data.get("api_key"),
+                  env_json=data.get("env_json"), multi_agent_main_name=data.get("multi_agent_main_name"),
+                  multiple_agents_name=data.get("multiple_agents_name"))
 
         # Extract characterJson and api_key from the payload
         character_json = data.get("character_file")
@@ -68,7 +265,7 @@ def create_session():
         
         agent_verify_obj = AgentVerify(dynamo, os.getenv("AGENT_TABLE"))
         agent_exist = agent_verify_obj.verify_agent_name(multi_agent_main_name, api_key, multiple_agents_name)
-        print("### ", agent_exist)
+        log.debug("agent_name_checked", agent=multi_agent_main_name, exists=agent_exist)
         # if agent_exist:
         #     return jsonify({"error": f"Multi-agent with name {multi_agent_main_name} already exists. Please check your dashboard for the respective agent-id"}), 403
         
@@ -88,53 +285,120 @@ def create_session():
         if not eliza_start_url or not tools_url:
             return jsonify({"error": "Missing required environment variables"}), 500
 
-        # Make API requests
-        eliza_response = requests.post(eliza_start_url, json=payload)
-        print(f"eliza response: {eliza_response.json()}")
-        tools_response = requests.post(tools_url, json=tools_payload)
-        print(f"tools response: {tools_response.json()}")
+        # Make API requests concurrently; latency is the slower backend, not the sum
+        calls = fan_out({
+            "eliza": lambda: downstream.post("ELIZA_CREATE", eliza_start_url, json=payload),
+            "tools": lambda: downstream.post("TOOLS_SET", tools_url, json=tools_payload)
+        }, timeouts={"eliza": ELIZA_TIMEOUT, "tools": TOOLS_TIMEOUT})
+        eliza_response, tools_response = calls["eliza"].value, calls["tools"].value
+        eliza_ok = calls["eliza"].ok and eliza_response.status_code == 200
+        tools_ok = calls["tools"].ok and tools_response.status_code == 200
+        for name, ok in (("eliza", eliza_ok), ("tools", tools_ok)):
+            if not ok:
+                log.warning("backend_create_failed", backend=name, agent=multi_agent_main_name,
+                            detail=failure_detail(calls[name]))
         
         mapper = AgentToolMapper(dynamo, "agent_tool_id")
 
-        if eliza_response.status_code == 200:
-            agent_verify_obj.save_agent_to_db(multi_agent_main_name, api_key, multiple_agents_name)
-
-            
-        if tools_response.status_code == 200: 
-            #saving the agnet and other tools mapping in DB.
-            response = mapper.save_agent_tool_mapping(multi_agent_main_name, eliza_response, tools_response, api_key)
+        if eliza_ok and tools_ok: 
+            #saving the agent row and the tools mapping in DB, atomically.
+            agent_item = agent_verify_obj.new_agent_item(multi_agent_main_name, api_key, multiple_agents_name)
+            response = mapper.save_agent_and_mapping(agent_verify_obj.table_name, agent_item, multi_agent_main_name,
+                                                     eliza_response, tools_response, api_key)
+            if response["status"] != "success":
+                log.error("agent_save_failed", agent=multi_agent_main_name, error=response["message"])
+                return jsonify({"error": response["message"]}), 500
+            _created()
+            if components.peek("response_cache") is not None:
+                # A re-created agent must not answer from its predecessor's responses
+                components.peek("response_cache").invalidate(multi_agent_main_name)
+
+        elif eliza_ok:
+            saved, _ = agent_verify_obj.save_agent_to_db(multi_agent_main_name, api_key, multiple_agents_name)
+            if saved:
+                _created()
             
         
         # Check if both requests were successful
-        if eliza_response.status_code == 200 and tools_response.status_code == 200:
+        if eliza_ok and tools_ok:
             return jsonify({
                 "eliza_response": eliza_response.json(),
                 "tools_response": tools_response.json(),
                 "multi_agent_name": multi_agent_main_name
             }), 201
         
-        elif eliza_response.status_code != 200 or tools_response!= 200:
+        else:
             return jsonify({
                 "error": f"Either of agents failed to create among {multiple_agents_name}",
-                "eliza_details": eliza_response.text if eliza_response.status_code != 200 else None,
-                "tools_details": tools_response.text if tools_response.status_code != 200 else None
+                "eliza_details": failure_detail(calls["eliza"]),
+                "tools_details": failure_detail(calls["tools"])
             }), 400  # Changed to 400 (Bad Request) since it's an external failure
 
-            
-        else:
-            return jsonify({
-                "error": "Failed to create session on external server.",
-                "eliza_details": eliza_response.text if eliza_response.status_code != 200 else None,
-                "tools_details": tools_response.text if tools_response.status_code != 200 else None
-            }), 400  # Changed to 400 (Bad Request) since it's an external failure
 
+    except Exception as e:
+        log.exception("create_session_failed")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/create_sessions:batch", methods=["POST"])
+def create_sessions_batch():
+    """
+    Create many multi-agents for one API key
+
+    Body: api_key, ``sessions`` (a list of {character_file, multi_agent_main_name,
+    multiple_agents_name}) and optional ``concurrency``. The key is verified once, names are
+    checked against the user's agents with one query and rows are batch-written; every
+    session gets its own ``status`` in ``results``. 201 when all were created, else 207.
+    """
+    try:
+        data = request.json
+        api_key, sessions = data.get("api_key"), data.get("sessions")
+
+        if not api_key or not isinstance(sessions, list) or not sessions:
+            return jsonify({"error": "api_key and a non-empty sessions list are required."}), 400
+        if len(sessions) > BATCH_CREATE_MAX_ITEMS:
+            return jsonify({"error": f"At most {BATCH_CREATE_MAX_ITEMS} sessions per batch."}), 400
+        try:
+            concurrency = int(data.get("concurrency") or BATCH_CREATE_CONCURRENCY)
+        except (TypeError, ValueError):
+            return jsonify({"error": "concurrency must be an integer."}), 400
+
+        # One lookup both verifies the key and names its user
+        key_record = ApiVerify(dynamo, os.getenv("API_TABLE")).lookup(api_key)
+        if key_record is None:
+            return jsonify({"error": "Invalid API key."}), 403
+        user_id = key_record.user_id
+
+        if not os.getenv("ELIZA_CREATE") or not os.getenv("TOOLS_SET"):
+            return jsonify({"error": "Missing required environment variables"}), 500
+
+        provisioner = BatchProvisioner(dynamo, downstream, os.getenv("AGENT_TABLE"),
+                                       concurrency=min(concurrency, BATCH_CREATE_CONCURRENCY),
+                                       timeout=max(ELIZA_TIMEOUT, TOOLS_TIMEOUT),
+                                       response_cache=components.peek("response_cache"))
+        results = provisioner.run(api_key, user_id, sessions)
+
+        counts = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        status = 201 if counts.get("created") == len(results) else 207
+        return jsonify({"results": results, "counts": counts}), status
 
     except Exception as e:
+        log.exception("create_sessions_batch_failed")
         return jsonify({"error": str(e)}), 500
-    
+
     
 @app.route("/agent_info", methods=["POST"])
 def get_agents_info():
+    """
+    List a user's agents, one page at a time
+
+    Body: api_key, user_id, optional ``limit`` (default AGENT_INFO_PAGE_SIZE), ``cursor``
+    (the ``next_cursor`` of the previous page) and ``stream``. With ``stream`` the listing
+    is sent as NDJSON, one ``{"id", "agent_main_name"}`` line per agent across as many
+    pages as needed (up to ``limit`` if given), ending with a ``{"next_cursor"}`` line.
+    """
     try:
         data = request.json
         api_key, user_id = data.get("api_key"), data.get("user_id")
@@ -142,139 +406,277 @@ def get_agents_info():
         if not api_key or not user_id:
             return jsonify({"status": "error", "message": "api_key and user_id required"}), 400
 
+        stream = bool(data.get("stream"))
+        try:
+            limit = data.get("limit")
+            if limit is None:
+                limit = None if stream else AGENT_INFO_PAGE_SIZE
+            else:
+                limit = int(limit)
+            if limit is not None and not 0 < limit <= AGENT_INFO_MAX_PAGE_SIZE:
+                raise ValueError(f"limit must be between 1 and {AGENT_INFO_MAX_PAGE_SIZE}")
+            start_key = decode_cursor(data.get("cursor"))
+        except (TypeError, ValueError) as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        user_key = {"N": str(user_id)}
+        if start_key is not None and start_key.get("user_id", user_key) != user_key:
+            return jsonify({"status": "error", "message": "Cursor does not belong to this user"}), 400
+
         if not ApiVerify(dynamo, os.getenv("API_TABLE")).verify(api_key):
             return jsonify({"status": "error", "message": "Invalid API key"}), 403
-        else:
-            print("-----API Key Verified------")
-        
-        response = dynamo.get_item_by_column(os.getenv("AGENT_TABLE"), "user_id", {"user_id": {"N": str(user_id)}})
-        if not response:
+
+        # Keyed on the user_id index, only the attributes the listing needs, never more than one page in memory
+        pages = dynamo.find_item_pages(os.getenv("AGENT_TABLE"), "user_id", user_key,
+                                       page_size=min(limit or AGENT_INFO_PAGE_SIZE, AGENT_INFO_PAGE_SIZE),
+                                       start_key=start_key, attributes=AGENT_INFO_ATTRIBUTES, max_items=limit)
+        if stream:
+            return Response(stream_with_context(_agent_info_lines(pages)), mimetype="application/x-ndjson")
+
+        agents, next_key = {}, None
+        for items, next_key in pages:
+            agents.update(AgentResponseParser(items).iter_id_agent_pairs())
+        if not agents and start_key is None:
             return jsonify({"status": "error", "message": f"No agents found for user_id {user_id}"}), 404
         
-        return jsonify({"status": "success", "data": {"user_id": user_id, "agents": AgentResponseParser(response).get_id_agent_mapping()}}), 200
+        return jsonify({"status": "success", "data": {"user_id": user_id, "agents": agents,
+                                                      "next_cursor": encode_cursor(next_key)}}), 200
         
     except KeyError as e:
         return jsonify({"status": "error", "message": f"Data structure error: {str(e)}"}), 400
     except Exception as e:
+        log.exception("agent_info_failed")
         return jsonify({"status": "error", "message": f"Server error: {str(e)}"}), 500
     
     
-@app.route("/query", methods=["POST"])
-def process_query():
+def _agent_info_lines(pages):
+    """NDJSON body for a streamed /agent_info: one line per agent, then the resume cursor"""
+    next_key = None
     try:
-        # Get data from request
-        data = request.json
-        query = data.get("query")
-        agent_name = data.get("agent_name")
-        extra_tool_key=data.get("extra_tool_key")
-        
-        primary_key = {"multi_agent_main_name": {"S": agent_name}}
-        response = dynamo.get_item("agent_tool_id", primary_key)
-        # response = {'agent_id': {'S': '3fb55a72-6b74-0fbe-b3ae-5d6de38b3616'}, 'multi_agent_main_name': {'S': 'demo4'}, 'tools_agent_id': {'S': 'd5900b5b-8468-46ec-a226-40b6e5a51e71'}}
-        
-        agent_id = response['agent_id']['S']
-        print(f"agent name:{agent_name}, agent id : {agent_id}")
+        for items, next_key in pages:
+            for agent_id, name in AgentResponseParser(items).iter_id_agent_pairs():
+                yield json.dumps({"id": agent_id, "agent_main_name": name}) + "\n"
+    except Exception as e:
+        log.exception("agent_info_stream_failed")
+        yield json.dumps({"status": "error", "message": str(e)}) + "\n"
+        return
+    yield json.dumps({"next_cursor": encode_cursor(next_key)}) + "\n"
 
-        # Validate required fields
-        if not all([query, agent_id]):
-            return jsonify({
-                "status": "error",
-                "message": "query, api_key, user_id, and agent_id are required."
-            }), 400
 
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Span and request latency histograms of this worker, in the Prometheus text format"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
-        # Get both target API URLs from environment variables
-        target_api_url_1 = os.getenv("ELIZA_QUERY") #eliza
-        target_api_url_1 = target_api_url_1 + agent_id + '/message'    
-        print("target_api_url1", target_api_url_1)
-        tool_api_url = os.getenv("TOOLS_QUERY") #tools
-        if not all([target_api_url_1]):
-            return jsonify({
-                "status": "error",
-                "message": "Target API URLs not properly configured"
-            }), 500
-
-        # get history
-        his_lis=dynamo.get_history("agent_tool_id", primary_key)
-        print("History list", his_lis)
-        rel= retrieve_relevant(query,his_lis)
-        pro="please answer current user query and take help from past interaction if required.\ncurrent query from user : "+query+"\nPAST INTERACTIONS:\n"+rel
-
-        payload = {
-            "text": pro,
-            "user": "user"
-        }
-        payload2={
-            "unique_id":extra_tool_key,
-            "query":pro
-        }
-        headers = {
-            "Content-Type": "application/json"
-        }
-   
-        
 
-        # Try first API
-        try:
-            response1 = requests.post(
-                target_api_url_1,
-                json=payload,
-                headers=headers
-            )
-            response2=requests.post(
-                tool_api_url,
-                json=payload2,
-                headers=headers
-            )
-            
-            if response1.status_code == 200:
-                try:
-                    response_data = response1.json()
-                except:
-                    response_data = None
-            if response2.status_code == 200:
-                try:
-                    response_data2 = response2.json()
-                except:
-                    response_data2 = None
+@app.route("/downstream_stats", methods=["GET"])
+def downstream_stats():
+    return jsonify({"status": "success", "data": downstream.stats()}), 200
 
-            
-            sav=f"User: {query}\nAI: "+str(response_data[0]["text"])+"\n"+str(response_data2["result"])
-            his_lis.append(sav)
-            if len(his_lis)>20:
-                his_lis.pop(0)
 
-            dynamo.update_history("agent_tool_id", primary_key, his_lis)
+def _prepare_query(data):
+    """
+    Resolve the agent, retrieve relevant history and build both backend calls for a query
 
+    Returns:
+        (dict, None) with the query context, or (None, (response, status)) if the request is invalid
+    """
+    query = data.get("query")
+    agent_name = data.get("agent_name")
+    extra_tool_key=data.get("extra_tool_key")
+    
+    # Cached routing record, read together with any legacy history in one projected get_item
+    route = router.resolve(agent_name)
+    if route is None:
+        return None, (jsonify({
+            "status": "error",
+            "message": f"No agent found with name {agent_name}"
+        }), 404)
+    
+    agent_id = route['agent_id']
 
-            return jsonify({
-                "status": "success",
-                "data1": response_data,
-                "extra_tool_response":response_data2
-            }), 200
+    # Validate required fields
+    if not all([query, agent_id]):
+        return None, (jsonify({
+            "status": "error",
+            "message": "query, api_key, user_id, and agent_id are required."
+        }), 400)
 
 
-            # If both APIs return None or fail
-            # return jsonify({
-            #     "status": "error",
-            #     "message": "No response from either API"
-            # }), 404
+    # Get both target API URLs from environment variables
+    target_api_url_1 = os.getenv("ELIZA_QUERY") #eliza
+    target_api_url_1 = target_api_url_1 + agent_id + '/message'    
+    tool_api_url = os.getenv("TOOLS_QUERY") #tools
+    if not all([target_api_url_1]):
+        return None, (jsonify({
+            "status": "error",
+            "message": "Target API URLs not properly configured"
+        }), 500)
+
+    # get history
+    his_lis=history.recent(agent_name, legacy=route['legacy_history'])
+    log.debug("query_prepared", agent=agent_name, agent_id=agent_id, url=target_api_url_1, history_turns=len(his_lis))
+    retrieved = retrieve_turns(query, his_lis, agent_name)
+    builder = components.get("prompt_builder")
+    if builder is None:
+        pro = legacy_prompt(query, retrieved)
+    else:
+        with span("prompt", "assemble"):
+            pro = builder.build(agent_name, query, retrieved)
+
+    payload = {
+        "text": pro,
+        "user": "user"
+    }
+    payload2={
+        "unique_id":extra_tool_key,
+        "query":pro
+    }
+    headers = {
+        "Content-Type": "application/json"
+    }
+
+    return {
+        "query": query,
+        "agent_name": agent_name,
+        "history": his_lis,
+        "calls": {
+            "eliza": lambda: downstream.post("ELIZA_QUERY", target_api_url_1, json=payload, headers=headers),
+            "tools": lambda: downstream.post("TOOLS_QUERY", tool_api_url, json=payload2, headers=headers)
+        }
+    }, None
+
+
+def _response_cache(data):
+    """
+    The response cache if this query may use it: the agent opted in and the request
+    did not ask to bypass it with ``no_cache`` or ``Cache-Control: no-cache``
+    """
+    cache = components.get("response_cache")
+    if cache is None or not cache.enabled_for(data.get("agent_name")) or not isinstance(data.get("query"), str):
+        return None
+    if data.get("no_cache") or "no-cache" in request.headers.get("Cache-Control", ""):
+        metrics.inc("agent_server_response_cache_total", outcome="bypass")
+        return None
+    return cache
+
+
+def _save_turn(ctx, response_data, response_data2):
+    """Append the answered turn to the agent's history and vector index"""
+    eliza_text = str(response_data[0]["text"]) if response_data else ""
+    tools_text = str(response_data2["result"]) if response_data2 else ""
+    sav=f"User: {ctx['query']}\nAI: "+eliza_text+"\n"+tools_text
+    # Queued for a batched background write; the response does not wait on DynamoDB
+    history.append(ctx["agent_name"], sav)
+    submit(remember, ctx["agent_name"], sav)
+    builder = components.get("prompt_builder")
+    if builder is not None:
+        submit(builder.remember, ctx["agent_name"], list(ctx["history"]) + [sav])
+
 
-        except requests.RequestException as e:
+@app.route("/query", methods=["POST"])
+def process_query():
+    try:
+        data = request.json
+        # A cached answer skips retrieval and both backends; the repeat is not added to history
+        cache = _response_cache(data)
+        if cache is not None:
+            partition = (data["agent_name"], data.get("extra_tool_key"))
+            body, tier = cache.get(partition, data["query"])
+            if body is not None:
+                return jsonify(body), 200, {"X-Response-Cache": tier}
+
+        ctx, error = _prepare_query(data)
+        if error:
+            return error
+
+        # Query both backends concurrently
+        calls = fan_out(ctx["calls"], timeouts={"eliza": ELIZA_TIMEOUT, "tools": TOOLS_TIMEOUT})
+        response_data = _json_or_none(calls["eliza"])
+        response_data2 = _json_or_none(calls["tools"])
+
+        # If both APIs return None or fail
+        if response_data is None and response_data2 is None:
             return jsonify({
                 "status": "error",
-                "message": f"Failed to process query: {str(e)}"
-            }), 500
+                "message": "No response from either API",
+                "eliza_details": failure_detail(calls["eliza"]),
+                "tools_details": failure_detail(calls["tools"])
+            }), 502
+
+        _save_turn(ctx, response_data, response_data2)
+
+        body = {
+            "status": "success",
+            "data1": response_data,
+            "extra_tool_response":response_data2
+        }
+        # One backend was slow or failed: answer with what arrived instead of waiting
+        unavailable = [name for name, data in (("eliza", response_data), ("tools", response_data2)) if data is None]
+        if unavailable:
+            body["partial"] = True
+            body["unavailable"] = {name: failure_detail(calls[name]) for name in unavailable}
+        elif cache is not None:
+            cache.put(partition, ctx["query"], body)
+        return jsonify(body), 200, {"X-Response-Cache": "miss"} if cache is not None else {}
         
         
 
 
     except Exception as e:
+        log.exception("query_failed")
         return jsonify({
             "status": "error",
             "message": f"Server error: {str(e)}"
         }), 500
 
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+@app.route("/query/stream", methods=["POST"])
+def process_query_stream():
+    """
+    Server-Sent Events variant of /query
+
+    Emits an ``eliza`` and a ``tools`` event as each backend answers (or fails), then a
+    ``done`` event once the turn is persisted, or an ``error`` event if neither answered.
+    """
+    try:
+        ctx, error = _prepare_query(request.json)
+        if error:
+            return error
+    except Exception as e:
+        log.exception("query_stream_failed")
+        return jsonify({
+            "status": "error",
+            "message": f"Server error: {str(e)}"
+        }), 500
+
+    def events():
+        keys = {"eliza": "data1", "tools": "extra_tool_response"}
+        results, failures = {}, {}
+        for call in as_completed(ctx["calls"], timeouts={"eliza": ELIZA_TIMEOUT, "tools": TOOLS_TIMEOUT}):
+            results[call.name] = _json_or_none(call)
+            if results[call.name] is None:
+                failures[call.name] = failure_detail(call)
+                yield _sse(call.name, {"status": "error", "message": failures[call.name]})
+            else:
+                yield _sse(call.name, {"status": "success", keys[call.name]: results[call.name]})
+
+        if len(failures) == len(keys):
+            yield _sse("error", {"status": "error", "message": "No response from either API"})
+            return
+        try:
+            _save_turn(ctx, results.get("eliza"), results.get("tools"))
+        except Exception as e:
+            yield _sse("error", {"status": "error", "message": f"Failed to save history: {str(e)}"})
+            return
+        yield _sse("done", {"status": "success", "partial": bool(failures)})
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
     
 
 
@@ -301,7 +703,6 @@ def process_query():
 #         return jsonify({"error": str(e)}), 500
 
 if __name__ == "__main__":
-    # Ensure the sessions directory exists
-    if not os.path.exists("sessions"):
-        os.makedirs("sessions")
-    app.run(host='0.0.0.0', port=3001, debug=True)
+    # Development only; serve production traffic with `python -m server serve`
+    from ..serve import main
+    main(["--dev"])
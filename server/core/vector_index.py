@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from ..utils.logs import get_logger
+
+log = get_logger(__name__)
+
+
+class AgentVectorIndex:
+    def __init__(self, agent_name: str, texts: List[str], vectors: np.ndarray):
+        """
+        Embeddings of one agent's conversation turns, row ``i`` of ``vectors`` embedding ``texts[i]``
+
+        Args:
+            agent_name (str): multi_agent_main_name the index belongs to
+            texts (List[str]): Stored turns, oldest first
+            vectors (np.ndarray): float32 matrix of shape (len(texts), dim)
+        """
+        self.agent_name = agent_name
+        self.texts = texts
+        self.vectors = vectors
+        self.lock = threading.Lock()
+        # Vector files this process last wrote or loaded, newest first; older ones are deleted
+        self.files: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def missing(self, texts: Sequence[str]) -> List[str]:
+        """Return the texts (deduplicated, in order) that have no stored embedding"""
+        known = set(self.texts)
+        return [t for t in dict.fromkeys(texts) if t not in known]
+
+    def add(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        if not texts:
+            return
+        new = np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+        self.vectors = new if not len(self.texts) else np.vstack([self.vectors, new])
+        self.texts = self.texts + list(texts)
+
+    def retain(self, texts: Sequence[str]) -> bool:
+        """Drop stored turns that are not in ``texts``. Returns True if anything was dropped."""
+        keep = set(texts)
+        rows = [i for i, t in enumerate(self.texts) if t in keep]
+        if len(rows) == len(self.texts):
+            return False
+        self.texts = [self.texts[i] for i in rows]
+        self.vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+        return True
+
+    def trim(self, max_entries: int) -> bool:
+        """Keep only the newest ``max_entries`` turns. Returns True if anything was dropped."""
+        if len(self.texts) <= max_entries:
+            return False
+        self.texts = self.texts[-max_entries:]
+        self.vectors = np.asarray(self.vectors[-max_entries:], dtype=np.float32)
+        return True
+
+
+class VectorIndexStore:
+    def __init__(self, directory: Optional[str] = None, max_agents: Optional[int] = None,
+                 max_entries: Optional[int] = None):
+        """
+        LRU of per-agent vector indexes, persisted as one float32 file per agent
+
+        Each save writes the vectors to a new ``<sha1>.<version>.f32`` (raw row-major float32,
+        memory-mapped on load), then replaces the ``<sha1>.json`` sidecar, which names that
+        file and holds the agent name, dimension, row count and turn texts. A reader always
+        gets a sidecar and the exact vectors it was written with; vector files are never
+        rewritten, and the one before the current is kept for readers mid-load.
+
+        Args:
+            directory (Optional[str]): Where index files live
+            max_agents (Optional[int]): Number of agent indexes kept in memory
+            max_entries (Optional[int]): Turns kept per agent; older ones are dropped on write
+        """
+        self.directory = directory or os.getenv("VECTOR_INDEX_DIR", "vector_index")
+        self.max_agents = max_agents or int(os.getenv("VECTOR_INDEX_CACHE_SIZE", "256"))
+        self.max_entries = max_entries or int(os.getenv("VECTOR_INDEX_MAX_ENTRIES", "20"))
+        self._indexes: "OrderedDict[str, AgentVectorIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, agent_name: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(agent_name.encode()).hexdigest())
+
+    def get(self, agent_name: str) -> AgentVectorIndex:
+        """Return the index for an agent, loading it from disk on a miss"""
+        with self._lock:
+            index = self._indexes.get(agent_name)
+            if index is not None:
+                self._indexes.move_to_end(agent_name)
+                return index
+        index = self._load(agent_name)
+        with self._lock:
+            index = self._indexes.setdefault(agent_name, index)
+            self._indexes.move_to_end(agent_name)
+            while len(self._indexes) > self.max_agents:
+                self._indexes.popitem(last=False)
+        return index
+
+    def _load(self, agent_name: str, attempts: int = 3) -> AgentVectorIndex:
+        path = self._path(agent_name)
+        for attempt in range(attempts):
+            try:
+                with open(path + ".json") as f:
+                    meta = json.load(f)
+                # Sidecars from before versioned files name no file and pair with <sha1>.f32
+                vector_file = os.path.join(self.directory, meta.get("vectors", os.path.basename(path) + ".f32"))
+                rows, dim = meta.get("rows", len(meta["texts"])), meta["dim"]
+                if rows != len(meta["texts"]) or os.path.getsize(vector_file) != rows * dim * 4:
+                    raise ValueError("vector file does not match its sidecar")
+                vectors = np.memmap(vector_file, dtype=np.float32, mode="r").reshape(rows, dim)
+                index = AgentVectorIndex(agent_name, meta["texts"], vectors)
+                index.files = [vector_file]
+                return index
+            except FileNotFoundError as e:
+                # No index yet, or a newer save removed the file this sidecar named; read it again
+                if e.filename == path + ".json" or attempt == attempts - 1:
+                    break
+            except (OSError, ValueError, KeyError) as e:
+                log.warning("vector_index_discarded", agent=agent_name, error=str(e))
+                break
+        return AgentVectorIndex(agent_name, [], np.zeros((0, 0), dtype=np.float32))
+
+    def save(self, index: AgentVectorIndex) -> None:
+        """Write an index to disk atomically; caller holds ``index.lock``"""
+        index.trim(self.max_entries)
+        path = self._path(index.agent_name)
+        if not index.texts:
+            # Nothing worth loading back; drop the sidecar so stale turns are not either
+            try:
+                os.remove(path + ".json")
+            except FileNotFoundError:
+                pass
+            return
+        vectors = np.ascontiguousarray(index.vectors, dtype=np.float32)
+        vector_file = f"{path}.{time.time_ns():x}{os.getpid():x}{threading.get_ident():x}.f32"
+        meta = {"agent_name": index.agent_name, "dim": int(vectors.shape[1]), "rows": len(index.texts),
+                "vectors": os.path.basename(vector_file), "texts": index.texts}
+        with open(vector_file, "wb") as f:
+            f.write(vectors.tobytes())
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        # The sidecar goes last and names its own vector file, so the pair is always consistent
+        os.replace(tmp, path + ".json")
+
+        index.files.insert(0, vector_file)
+        for stale in index.files[2:]:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+        del index.files[2:]
@@ -1,34 +1,68 @@
-from dotenv import load_dotenv
+from ..config.settings import load_config
 import os
+from ..utils.cache import TTLCache
+from ..utils.logs import get_logger
+from ..utils.records import AgentRecord, ApiKeyRecord
+from ..utils.request_memo import memoized
+import json
 
-load_dotenv()
+load_config()
+log = get_logger(__name__)
+
+_api_key_cache = TTLCache(
+    maxsize=int(os.getenv("API_KEY_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("API_KEY_CACHE_TTL", "300")),
+    negative_ttl=float(os.getenv("API_KEY_CACHE_NEGATIVE_TTL", "0"))
+)
 
 class ApiVerify:
     def __init__(self, dynamo_client, table_name):
         self.dynamo = dynamo_client
         self.table_name = table_name
 
-    def verify(self, api_key):
+    def lookup(self, api_key):
+        """The record holding ``api_key``, or None if it does not exist or cannot be read"""
+        if not api_key:
+            return None
+        cache_key = (self.table_name, api_key)
+        cached = _api_key_cache.get(cache_key, False)
+        if cached is not False:
+            return cached
         try:
-            # Scan the table for the provided API key
-            result = self.dynamo.scan_table(self.table_name)
-            for item in result.get('Items', []):
-                if item.get('api_key', {}).get('S') == api_key:
-                    return True
+            # Keyed lookup on the api_key index instead of scanning the whole table; once per
+            # request, as misses are not cached across requests
+            item = memoized(("api_key_item", self.table_name, api_key),
+                            lambda: self.dynamo.get_api_key_item(self.table_name, api_key))
         except Exception as e:
-            print(f"Error verifying API key: {e}")
-        return False
+            log.error("api_key_verify_failed", table=self.table_name, error=str(e))
+            return None
+        found = ApiKeyRecord.from_item(item) if item else None
+        # The index is read eventually consistent, so a miss may be a key created a moment
+        # ago: misses are only cached when API_KEY_CACHE_NEGATIVE_TTL is set
+        if found is not None or _api_key_cache.negative_ttl > 0:
+            _api_key_cache.set(cache_key, found)
+        return found
+
+    def verify(self, api_key):
+        return self.lookup(api_key) is not None
+
+    @staticmethod
+    def invalidate(table_name, api_key):
+        """Drop any cached verification result for an API key, e.g. after it is written."""
+        _api_key_cache.invalidate((table_name, api_key))
     
 
+# Counter that numbers agent rows (see IdAllocator)
+AGENT_ID_COUNTER = 'test_agent_table'
+
+
 class AgentVerify:
     def __init__(self, dynamo_client, table_name):
         self.dynamo = dynamo_client
         self.table_name = table_name
         
     def check_agent_in_agent_list(self, multi_agent_main_name, agent_list):
-        multi_agent_list = self.dynamo.extract_field(agent_list, "agent_main_name")
-        print(multi_agent_list)
-        print(multi_agent_main_name)
+        multi_agent_list = {agent.agent_main_name for agent in AgentRecord.iter_items(agent_list.get("Items", []))}
         
         if multi_agent_main_name in multi_agent_list:
             return True 
@@ -41,11 +75,9 @@ class AgentVerify:
             # Scan the table for the provided API key
             key = {"user_id": {"N": str(user_id)}}
             result = self.dynamo.get_item_by_column(self.table_name, "user_id", key)
-            print('------')
-            print(result)
             
             if result is not None and self.check_agent_in_agent_list(multi_agent_main_name, result):
-                print(f"{multi_agent_main_name} already exist.")
+                log.debug("agent_name_exists", agent=multi_agent_main_name)
                 
                 return True   #improve here to give similarity search for already existing agents.
                     
@@ -53,30 +85,43 @@ class AgentVerify:
                 return False
             
         except Exception as e:
-            print(f"Error verifying agent name: {e}")
+            log.error("agent_name_verify_failed", agent=multi_agent_main_name, error=str(e))
         return False, None
             
             
+    @staticmethod
+    def agent_item(auto_id, user_id, multi_agent_main_name, multiple_agents_name, date_created):
+        """Build an agent row in DynamoDB format"""
+        if not isinstance(multiple_agents_name, str):
+            # Requests send a list; DynamoDB needs a string for this S attribute
+            multiple_agents_name = json.dumps(multiple_agents_name)
+        return AgentRecord(
+            id=auto_id,
+            user_id=user_id,
+            agent_main_name=multi_agent_main_name,
+            agent_list=multiple_agents_name,
+            date_created=date_created,
+            is_active=True  # Set to True by default, can be modified as needed
+        ).to_item()
+
+    def new_agent_item(self, multi_agent_main_name, api_key, multiple_agents_name):
+        """Build the row for a new agent of the API key's user, with a freshly allocated ID"""
+        user_id = self.dynamo.get_userId_from_APIkey(os.getenv("API_TABLE"), api_key)
+        date_created = self.dynamo.get_date()
+        auto_id = self.dynamo.get_auto_increment_id(AGENT_ID_COUNTER)
+        return self.agent_item(auto_id, user_id, multi_agent_main_name, multiple_agents_name, date_created)
+
     def save_agent_to_db(self, multi_agent_main_name, api_key, multiple_agents_name):
         try:
-            user_id = self.dynamo.get_userId_from_APIkey(os.getenv("API_TABLE"), api_key)
-            date_created = self.dynamo.get_date()
-            auto_id = self.dynamo.get_auto_increment_id('test_agent_table')
-            item = {
-                "id": {"N": str(auto_id)},
-                "user_id": {"N": str(user_id)},
-                "agent_main_name": {"S": multi_agent_main_name},
-                "agent_list": {"S": multiple_agents_name},
-                "date_created": {"S": date_created},
-                "is_active": {"BOOL": True}  # Set to True by default, can be modified as needed
-            }
+            item = self.new_agent_item(multi_agent_main_name, api_key, multiple_agents_name)
     
             # Add the new API key to the DynamoDB table
             self.dynamo.add_item(self.table_name, item)  #response can be negative handle that 
             # print(response.json())
-            print(f"...New agent added succesfully {item}")
+            log.info("agent_saved", agent=multi_agent_main_name, id=item["id"]["N"])
+            return True, int(item["id"]["N"])
             
     
         except Exception as e:
-            print(f"Error saving agent to the DB: {e}")
+            log.error("agent_save_failed", agent=multi_agent_main_name, error=str(e))
         return False, None
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""
+Serving entry point
+
+    python -m server serve --workers 4 --threads 8
+    python -m server serve --worker-class gevent --worker-connections 500
+    python -m server serve --dev
+
+Production mode runs the Flask app under gunicorn. ``--dev`` runs the Flask
+development server (single process, no reloader) for local work.
+"""
+import argparse
+import multiprocessing
+import os
+from typing import List, Optional
+
+
+def _default_workers() -> int:
+    return int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count() * 2 + 1)))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m server serve", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bind", default=os.getenv("BIND", "0.0.0.0:3001"))
+    parser.add_argument("--workers", type=int, default=_default_workers())
+    parser.add_argument("--threads", type=int, default=int(os.getenv("THREADS", "8")),
+                        help="threads per worker for the gthread worker class")
+    parser.add_argument("--worker-class", default=os.getenv("WORKER_CLASS", "gthread"),
+                        help="gunicorn worker class, e.g. gthread, gevent, eventlet")
+    parser.add_argument("--worker-connections", type=int, default=1000,
+                        help="concurrent connections per worker for async worker classes")
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("WORKER_TIMEOUT", "120")),
+                        help="seconds a silent worker is allowed before it is restarted")
+    parser.add_argument("--graceful-timeout", type=int, default=30,
+                        help="seconds workers get to finish in-flight requests on shutdown")
+    parser.add_argument("--keepalive", type=int, default=5)
+    parser.add_argument("--max-requests", type=int, default=0,
+                        help="restart a worker after this many requests (0 disables)")
+    parser.add_argument("--preload", action="store_true",
+                        help="import the app once in the master before forking workers")
+    parser.add_argument("--dev", action="store_true", help="run the Flask development server instead")
+    return parser
+
+
+def _post_fork(server, worker):
+    # With --preload the master already built clients; give this worker its own
+    from .core import session_app
+    session_app.init_worker()
+
+
+def _worker_exit(server, worker):
+    from .core import session_app
+    session_app.shutdown_worker()
+
+
+def run_gunicorn(args: argparse.Namespace) -> None:
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit("gunicorn is required for production serving: pip install gunicorn")
+
+    class ServerApplication(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": args.bind,
+                "workers": args.workers,
+                "threads": args.threads,
+                "worker_class": args.worker_class,
+                "worker_connections": args.worker_connections,
+                "timeout": args.timeout,
+                "graceful_timeout": args.graceful_timeout,
+                "keepalive": args.keepalive,
+                "max_requests": args.max_requests,
+                "max_requests_jitter": args.max_requests // 10,
+                "preload_app": args.preload,
+                "worker_exit": _worker_exit,
+            }
+            if args.preload:
+                options["post_fork"] = _post_fork
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from .core.session_app import app
+            return app
+
+    ServerApplication().run()
+
+
+def run_dev(args: argparse.Namespace) -> None:
+    from .core.session_app import app
+    host, _, port = args.bind.rpartition(":")
+    app.run(host=host or "0.0.0.0", port=int(port), debug=False, use_reloader=False, threaded=True)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    # Ensure the sessions directory exists
+    os.makedirs("sessions", exist_ok=True)
+    if args.dev:
+        run_dev(args)
+    else:
+        run_gunicorn(args)
@@ -0,0 +1,120 @@
+"""
+Create the DynamoDB tables and indexes the server needs
+
+    python -m server setup-tables --dry-run
+    python -m server setup-tables --region us-east-1
+
+Reads the same .env as the server, so API_TABLE, AGENT_TABLE and the other table names
+resolve as they do when serving. Key schemas come from ``local_dynamo.default_tables()``
+and GSIs from the declared access paths, so the in-memory stand-in and real tables stay
+in step. Existing tables are left alone except for missing GSIs, which are added. Tables
+whose items carry ``expires_at`` get it enabled as their TTL attribute. Tables are
+created on-demand (PAY_PER_REQUEST).
+"""
+import argparse
+import json
+import os
+from typing import Dict, List, Optional
+
+from .config.settings import load_config
+from .utils.local_dynamo import TableSpec, default_tables
+
+load_config()
+
+# Attribute types of every key and index attribute used by the tables
+KEY_TYPES = {
+    "id": "N",
+    "user_id": "N",
+    "api_key": "S",
+    "multi_agent_main_name": "S",
+    "seq": "N",
+    "counter_name": "S",
+    "idempotency_key": "S",
+    "bucket_key": "S",
+}
+
+TTL_TABLES = {
+    os.getenv("HISTORY_TABLE", "agent_history"),
+    os.getenv("IDEMPOTENCY_TABLE", "idempotency_keys"),
+    os.getenv("RATE_LIMIT_TABLE", "rate_limits"),
+}
+
+
+def _key_schema(hash_key: str, range_key: Optional[str]) -> List[Dict[str, str]]:
+    schema = [{"AttributeName": hash_key, "KeyType": "HASH"}]
+    if range_key:
+        schema.append({"AttributeName": range_key, "KeyType": "RANGE"})
+    return schema
+
+
+def _attributes(*names: Optional[str]) -> List[Dict[str, str]]:
+    return [{"AttributeName": n, "AttributeType": KEY_TYPES[n]} for n in dict.fromkeys(names) if n]
+
+
+def _gsi(index_name: str, hash_key: str, range_key: Optional[str]) -> Dict:
+    return {"IndexName": index_name, "KeySchema": _key_schema(hash_key, range_key),
+            "Projection": {"ProjectionType": "ALL"}}
+
+
+def create_table_request(name: str, spec: TableSpec) -> Dict:
+    indexes = spec.indexes or {}
+    request = {
+        "TableName": name,
+        "KeySchema": _key_schema(spec.hash_key, spec.range_key),
+        "AttributeDefinitions": _attributes(spec.hash_key, spec.range_key,
+                                            *[k for keys in indexes.values() for k in keys]),
+        "BillingMode": "PAY_PER_REQUEST",
+    }
+    if indexes:
+        request["GlobalSecondaryIndexes"] = [_gsi(n, *keys) for n, keys in indexes.items()]
+    return request
+
+
+def setup(client) -> None:
+    """Create missing tables, add missing GSIs and enable TTL; prints what it does"""
+    for name, spec in default_tables().items():
+        try:
+            existing = client.describe_table(TableName=name)["Table"]
+        except client.exceptions.ResourceNotFoundException:
+            existing = None
+
+        if existing is None:
+            print(f"create table {name}")
+            client.create_table(**create_table_request(name, spec))
+            client.get_waiter("table_exists").wait(TableName=name)
+        else:
+            present = {i["IndexName"] for i in existing.get("GlobalSecondaryIndexes", [])}
+            for index_name, keys in (spec.indexes or {}).items():
+                if index_name in present:
+                    continue
+                # DynamoDB adds one GSI per UpdateTable call
+                print(f"add index {index_name} to {name}")
+                client.update_table(TableName=name, AttributeDefinitions=_attributes(*keys),
+                                    GlobalSecondaryIndexUpdates=[{"Create": _gsi(index_name, *keys)}])
+                client.get_waiter("table_exists").wait(TableName=name)
+
+        if name in TTL_TABLES:
+            ttl = client.describe_time_to_live(TableName=name)["TimeToLiveDescription"]
+            if ttl.get("TimeToLiveStatus") not in ("ENABLED", "ENABLING"):
+                print(f"enable TTL on {name}.expires_at")
+                client.update_time_to_live(TableName=name, TimeToLiveSpecification={
+                    "Enabled": True, "AttributeName": "expires_at"})
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m server setup-tables", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--region", default=os.getenv("AWS_REGION", "us-east-1"))
+    parser.add_argument("--dry-run", action="store_true", help="print the CreateTable requests without calling AWS")
+    args = parser.parse_args(argv)
+
+    if args.dry_run:
+        for name, spec in default_tables().items():
+            print(json.dumps(create_table_request(name, spec)))
+        return
+    import boto3
+    setup(boto3.client("dynamodb", region_name=args.region))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+import threading
+from typing import NamedTuple, Optional, Set, Tuple
+
+
+class AccessPath(NamedTuple):
+    """A lookup on ``attribute`` of the table named by ``table_env``, served by a GSI"""
+    table_env: str
+    attribute: str
+    index_env: str
+    default_index: str
+
+    @property
+    def table_name(self) -> Optional[str]:
+        return os.getenv(self.table_env)
+
+    @property
+    def index_name(self) -> str:
+        return os.getenv(self.index_env, self.default_index)
+
+
+# Every non-key lookup the server performs must be declared here; anything else falls back to a scan
+ACCESS_PATHS = (
+    AccessPath("API_TABLE", "api_key", "API_KEY_INDEX", "api_key-index"),
+    AccessPath("API_TABLE", "user_id", "API_USER_ID_INDEX", "user_id-index"),
+    AccessPath("AGENT_TABLE", "user_id", "AGENT_USER_ID_INDEX", "user_id-index"),
+)
+
+
+# (table, index) pairs DynamoDB reported as nonexistent; their lookups scan until restart
+_missing: Set[Tuple[str, str]] = set()
+_missing_lock = threading.Lock()
+
+
+def resolve_index(table_name: str, attribute: str) -> Optional[str]:
+    """
+    Find the index declared for a lookup
+
+    Args:
+        table_name (str): Name of the DynamoDB table
+        attribute (str): Attribute being matched
+
+    Returns:
+        Optional[str]: Name of the GSI serving the lookup, or None if no access path is declared
+        or its index turned out not to exist
+    """
+    for path in ACCESS_PATHS:
+        if path.attribute == attribute and path.table_name == table_name:
+            index_name = path.index_name
+            return None if (table_name, index_name) in _missing else index_name
+    return None
+
+
+def mark_index_missing(table_name: str, index_name: str) -> bool:
+    """Route later lookups on this index to a scan. Returns True the first time it is reported."""
+    with _missing_lock:
+        if (table_name, index_name) in _missing:
+            return False
+        _missing.add((table_name, index_name))
+        return True
+
+
+def is_missing_index(error: Exception) -> bool:
+    """Whether a ClientError from a Query says the requested index does not exist"""
+    details = getattr(error, "response", {}).get("Error", {})
+    return details.get("Code") == "ValidationException" and "specified index" in details.get("Message", "")
@@ -1,15 +1,48 @@
 import boto3
-from typing import List, Optional, Dict, Any, Union
-from dotenv import load_dotenv
+from typing import List, Optional, Dict, Any, Union, Iterator, Tuple
+from ..config.settings import load_config
+import copy
+import json
 import os
+import time
 from datetime import datetime
 from botocore.exceptions import ClientError
+from .access_paths import resolve_index, mark_index_missing, is_missing_index
+from .request_memo import memoized
+from .id_allocator import IdAllocator
+from .traced_dynamo import TracedDynamoClient
+from .singleflight import SingleFlight
+from .logs import get_logger
+from .records import AgentToolMapping, decode_value
+
+load_config()
+log = get_logger(__name__)
+
+
+def _flight_key(*parts: Any) -> str:
+    return json.dumps(parts, sort_keys=True, separators=(',', ':'))
 
-load_dotenv()
 
 class DynamoDBClient:
-    def __init__(self, region: str = 'us-east-1'):
-        """Initialize DynamoDB client with AWS credentials"""
+    def __init__(self, region: str = 'us-east-1', client: Optional[Any] = None):
+        """
+        Initialize DynamoDB client with AWS credentials
+
+        STORAGE_BACKEND=memory (or passing ``client``) swaps in a stand-in with the
+        same low-level API, e.g. ``local_dynamo.InMemoryDynamoDB``, and skips AWS.
+
+        Concurrent identical reads (get_item, find_items, query_partition) share one
+        request to DynamoDB through ``self.flight``.
+        """
+        self.id_allocator = IdAllocator(self)
+        self.flight = SingleFlight("dynamo")
+        if client is None and os.getenv("STORAGE_BACKEND", "dynamodb").lower() == "memory":
+            from .local_dynamo import InMemoryDynamoDB
+            client = InMemoryDynamoDB()
+        if client is not None:
+            self.client = TracedDynamoClient(client)
+            return
+
         required_env_vars = ["AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"]
         missing_vars = [var for var in required_env_vars if not os.getenv(var)]
         if missing_vars:
@@ -21,7 +54,7 @@ class DynamoDBClient:
                 aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
                 region_name=region
             )
-            self.client = self.session.client('dynamodb')
+            self.client = TracedDynamoClient(self.session.client('dynamodb'))
         except Exception as e:
             raise ConnectionError(f"Failed to initialize DynamoDB client: {str(e)}")
 
@@ -37,7 +70,18 @@ class DynamoDBClient:
             raise Exception(f"Failed to describe table: {str(e)}")
     
     def get_item(self, table_name: str, primary_key: Dict[str, Dict[str, str]], 
-             attributes: Optional[List[str]] = None) -> Dict[str, Any]:
+             attributes: Optional[List[str]] = None, coalesce: bool = True) -> Dict[str, Any]:
+        """
+        Read one item; ``coalesce=False`` forces a read of its own, e.g. in a read-modify-write
+        loop that must not reuse a read started before its last conditional write failed
+        """
+        if not coalesce:
+            return self._get_item(table_name, primary_key, attributes)
+        return self.flight.do(_flight_key('get_item', table_name, primary_key, attributes),
+                              lambda: self._get_item(table_name, primary_key, attributes), clone=copy.deepcopy)
+
+    def _get_item(self, table_name: str, primary_key: Dict[str, Dict[str, str]],
+                  attributes: Optional[List[str]] = None) -> Dict[str, Any]:
         try:
             params = {
                 'TableName': table_name,
@@ -53,13 +97,18 @@ class DynamoDBClient:
 
 
     def add_item(self, table_name: str, item: Dict[str, Dict[str, str]], 
-                 condition: str = "attribute_not_exists(id)") -> Dict[str, Any]:
+                 condition: Optional[str] = "attribute_not_exists(id)",
+                 names: Optional[Dict[str, str]] = None,
+                 values: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        params = {'TableName': table_name, 'Item': item}
+        if condition:
+            params['ConditionExpression'] = condition
+        if names:
+            params['ExpressionAttributeNames'] = names
+        if values:
+            params['ExpressionAttributeValues'] = values
         try:
-            return self.client.put_item(
-                TableName=table_name,
-                Item=item,
-                ConditionExpression=condition
-            )
+            return self.client.put_item(**params)
         except ClientError as e:
             if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
                 raise ValueError("Item already exists")
@@ -79,6 +128,12 @@ class DynamoDBClient:
         except ClientError as e:
             raise Exception(f"Failed to update item: {str(e)}")
 
+    def delete_item(self, table_name: str, primary_key: Dict[str, Dict[str, str]]) -> Dict[str, Any]:
+        try:
+            return self.client.delete_item(TableName=table_name, Key=primary_key)
+        except ClientError as e:
+            raise Exception(f"Failed to delete item: {str(e)}")
+
     def describe_table(self, table_name: str) -> Dict[str, Any]:
         try:
             return self.client.describe_table(TableName=table_name)
@@ -103,65 +158,239 @@ class DynamoDBClient:
         return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     def get_auto_increment_id(self, table_name: str) -> int:
-        """Generates an auto-increment ID by scanning the table for the highest current ID"""
+        """Allocates the next ID for a table from its atomic counter (see IdAllocator)"""
+        return self.id_allocator.allocate(table_name)
+
+    def get_max_id(self, table_name: str) -> int:
+        """Scans every page of the table for the highest current ID. Used once to seed a counter."""
         try:
-            response = self.client.scan(
+            max_id = 0
+            paginator = self.client.get_paginator('scan')
+            for page in paginator.paginate(TableName=table_name, ProjectionExpression="id"):
+                for item in page.get('Items', []):
+                    max_id = max(max_id, int(item['id']['N']))
+            return max_id
+
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceNotFoundException':
+                return 0
+            raise Exception(f"Failed to get max ID: {str(e)}")
+
+    def increment_counter(self, table_name: str, primary_key: Dict[str, Dict[str, str]],
+                          attribute: str, amount: int = 1) -> int:
+        """Atomically add ``amount`` to a numeric attribute and return its new value"""
+        try:
+            response = self.client.update_item(
                 TableName=table_name,
-                ProjectionExpression="id"
+                Key=primary_key,
+                UpdateExpression="ADD #a :n",
+                ExpressionAttributeNames={"#a": attribute},
+                ExpressionAttributeValues={":n": {"N": str(amount)}},
+                ReturnValues="UPDATED_NEW"
             )
-            items = response.get('Items', [])
+            return int(response['Attributes'][attribute]['N'])
+        except ClientError as e:
+            raise Exception(f"Failed to increment counter: {str(e)}")
+
+    def scan_table(self, table_name: str) -> Dict[str, Any]:
+        """Scan the entire table, following pagination, and return all items"""
+        try:
+            items = []
+            for page in self.client.get_paginator('scan').paginate(TableName=table_name):
+                items.extend(page.get('Items', []))
+            return {'Items': items, 'Count': len(items)}
+        except ClientError as e:
+            raise Exception(f"Failed to scan table: {str(e)}")
 
-            if not items:
-                return 1  # Start from 1 if the table is empty
+    def query_index(self, table_name: str, index_name: str, column_name: str,
+                    value: Dict[str, str], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Query a GSI for items whose ``column_name`` equals ``value``, following pagination
 
-            max_id = max(int(item['id']['N']) for item in items)
-            return max_id + 1
+        Args:
+            table_name (str): Name of the DynamoDB table
+            index_name (str): Name of the GSI keyed on ``column_name``
+            column_name (str): Partition key attribute of the index
+            value (Dict[str, str]): Value in DynamoDB format, e.g. {"N": "123"}
+            limit (Optional[int]): Stop once this many items have been collected
 
+        Returns:
+            List[Dict[str, Any]]: Matching items
+        """
+        params = {
+            'TableName': table_name,
+            'IndexName': index_name,
+            'KeyConditionExpression': '#col = :val',
+            'ExpressionAttributeNames': {'#col': column_name},
+            'ExpressionAttributeValues': {':val': value}
+        }
+        if limit:
+            params['PaginationConfig'] = {'MaxItems': limit}
+        try:
+            items = []
+            for page in self.client.get_paginator('query').paginate(**params):
+                items.extend(page.get('Items', []))
+            return items[:limit] if limit else items
         except ClientError as e:
-            raise Exception(f"Failed to get auto-increment ID: {str(e)}")
-
-    def scan_table(self, table_name: str) -> Dict[str, Any]:
-        """Scan the entire table and return all items"""
+            if not is_missing_index(e):
+                raise Exception(f"Failed to query index {index_name}: {str(e)}")
+        # A missing GSI degrades to the old scan rather than failing every lookup, e.g. auth
+        self._index_missing(table_name, index_name)
+        items = self.scan_by_column(table_name, column_name, value)
+        return items[:limit] if limit else items
+
+    @staticmethod
+    def _index_missing(table_name: str, index_name: str) -> None:
+        if mark_index_missing(table_name, index_name):
+            log.error("index_missing", table=table_name, index=index_name,
+                      hint="create it with python -m server setup-tables; lookups scan until then")
+
+    def scan_by_column(self, table_name: str, column_name: str, value: Dict[str, str]) -> List[Dict[str, Any]]:
+        """Filtered scan over every page of the table. Only used when no access path is declared."""
+        log.warning("scan_fallback", table=table_name, column=column_name)
         try:
-            response = self.client.scan(TableName=table_name)
-            return response
+            items = []
+            paginator = self.client.get_paginator('scan')
+            for page in paginator.paginate(
+                TableName=table_name,
+                FilterExpression='#col = :val',
+                ExpressionAttributeNames={'#col': column_name},
+                ExpressionAttributeValues={':val': value}
+            ):
+                items.extend(page.get('Items', []))
+            return items
         except ClientError as e:
             raise Exception(f"Failed to scan table: {str(e)}")
-            
+
+    def find_items(self, table_name: str, column_name: str, value: Dict[str, str],
+                   limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Find items by a non-key attribute through its declared access path
+
+        Args:
+            table_name (str): Name of the DynamoDB table
+            column_name (str): Attribute to match
+            value (Dict[str, str]): Value in DynamoDB format, e.g. {"S": "abc"}
+            limit (Optional[int]): Maximum number of items to return
+
+        Returns:
+            List[Dict[str, Any]]: Matching items
+        """
+        return self.flight.do(_flight_key('find_items', table_name, column_name, value, limit),
+                              lambda: self._find_items(table_name, column_name, value, limit), clone=copy.deepcopy)
+
+    def _find_items(self, table_name: str, column_name: str, value: Dict[str, str],
+                    limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        index_name = resolve_index(table_name, column_name)
+        if index_name is None:
+            items = self.scan_by_column(table_name, column_name, value)
+            return items[:limit] if limit else items
+        return self.query_index(table_name, index_name, column_name, value, limit)
+
+    def find_item_pages(self, table_name: str, column_name: str, value: Dict[str, str],
+                        page_size: int = 100, start_key: Optional[Dict[str, Any]] = None,
+                        attributes: Optional[List[str]] = None,
+                        max_items: Optional[int] = None) -> Iterator[Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+        """
+        Find items by a non-key attribute one DynamoDB page at a time
+
+        Pages are requested with ``Limit`` no larger than the items still wanted, so the key
+        yielded with each page is always a valid point to resume from, even mid-listing.
+
+        Args:
+            table_name (str): Name of the DynamoDB table
+            column_name (str): Attribute to match
+            value (Dict[str, str]): Value in DynamoDB format, e.g. {"N": "123"}
+            page_size (int): Items requested per page
+            start_key (Optional[Dict[str, Any]]): LastEvaluatedKey to resume after
+            attributes (Optional[List[str]]): Only return these attributes
+            max_items (Optional[int]): Stop once this many items have been yielded
+
+        Yields:
+            Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]: Items of one page and the
+            key to resume after it, or None once the listing is exhausted
+        """
+        params = {
+            'TableName': table_name,
+            'ExpressionAttributeNames': {'#col': column_name},
+            'ExpressionAttributeValues': {':val': value}
+        }
+        if attributes:
+            params['ExpressionAttributeNames'].update({f'#p{i}': a for i, a in enumerate(attributes)})
+            params['ProjectionExpression'] = ', '.join(f'#p{i}' for i in range(len(attributes)))
+        index_name = resolve_index(table_name, column_name)
+
+        def use_scan():
+            log.warning("scan_fallback", table=table_name, column=column_name)
+            params.pop('IndexName', None)
+            params.pop('KeyConditionExpression', None)
+            params['FilterExpression'] = '#col = :val'
+            return self.client.scan
+
+        if index_name is None:
+            fetch = use_scan()
+        else:
+            params['IndexName'] = index_name
+            params['KeyConditionExpression'] = '#col = :val'
+            fetch = self.client.query
+
+        remaining = max_items
+        while True:
+            params['Limit'] = page_size if remaining is None else min(page_size, remaining)
+            if start_key:
+                params['ExclusiveStartKey'] = start_key
+            try:
+                response = fetch(**params)
+            except ClientError as e:
+                if 'IndexName' not in params or not is_missing_index(e):
+                    raise Exception(f"Failed to page through {table_name}: {str(e)}")
+                self._index_missing(table_name, index_name)
+                fetch = use_scan()
+                continue
+            items = response.get('Items', [])
+            start_key = response.get('LastEvaluatedKey')
+            if remaining is not None:
+                remaining -= len(items)
+            yield items, start_key
+            if not start_key or remaining == 0:
+                return
+
     def get_userId_from_APIkey(self, table_name: str, api_key: str) -> Optional[int]:
        """
        Retrieve user ID based on API key from the specified table
-       
+
+       The result is memoized for the duration of the current request.
+
        Args:
            table_name (str): Name of the DynamoDB table
            api_key (str): API key to search for
-       
+
        Returns:
            Optional[int]: User ID if API key is found, None otherwise
        """
-       try:
-           # Scan the table to find the item with matching API key
-           response = self.client.scan(
-               TableName=table_name,
-               FilterExpression='api_key = :key',
-               ExpressionAttributeValues={
-                   ':key': {'S': api_key}
-               }
-           )
-           
-           # Check if any items were found
-           items = response.get('Items', [])
-           
-           if not items:
+       def load() -> Optional[int]:
+           item = self.get_api_key_item(table_name, api_key)
+           if not item:
                return None
-           
-           # Extract and return the user_id 
            # Assuming user_id is stored as a Number (N) type in DynamoDB
-           return int(items[0].get('user_id', {}).get('N'))
-       
-       except ClientError as e:
-           raise Exception(f"Failed to retrieve user ID from API key: {str(e)}")
-           
+           return int(item.get('user_id', {}).get('N'))
+
+       return memoized(('user_id_from_api_key', table_name, api_key), load)
+
+    def get_api_key_item(self, table_name: str, api_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve the item holding an API key through the ``api_key`` access path
+
+        Args:
+            table_name (str): Name of the DynamoDB table
+            api_key (str): API key to look up
+
+        Returns:
+            Optional[Dict[str, Any]]: The matching item, or None if the key does not exist
+        """
+        items = self.find_items(table_name, 'api_key', {'S': api_key}, limit=1)
+        return items[0] if items else None
+
     def get_item_by_column(self, table_name: str, column_name: str, value: Dict[str, Dict[str, str]]) -> List[Dict[str, Any]]:
         """
         Retrieve items from the table based on a specific column value
@@ -173,32 +402,21 @@ class DynamoDBClient:
                 e.g., {"user_id": {"N": "123"}}
             
         Returns:
-            List[Dict[str, Any]]: List of items matching the search criteria
-            Returns empty list if no items found or if column doesn't exist
+            Dict[str, Any]: Response-shaped dict with every matching item under 'Items',
+            or None if no items match. Returns empty list if the column doesn't exist
         """
-        try:
-            # Check if the column exists in the value dict
-            if column_name not in value:
-                return []
-                
-            response = self.client.scan(
-                TableName=table_name,
-                FilterExpression=f'{column_name} = :val',
-                ExpressionAttributeValues={
-                    ':val': value[column_name]
-                }
-            )
-            
-            print(response)
-            
-            if len(response['Items']) == 0:
-                return None
-            
-            else:
-                return response
-            
-        except ClientError as e:
-            raise Exception(f"Failed to get items by column: {str(e)}")
+        # Check if the column exists in the value dict
+        if column_name not in value:
+            return []
+
+        items = self.find_items(table_name, column_name, value[column_name])
+        response = {'Items': items, 'Count': len(items)}
+
+        if len(response['Items']) == 0:
+            return None
+
+        else:
+            return response
             
     def extract_field(self, data: dict, field: str) -> list:
         """
@@ -210,23 +428,11 @@ class DynamoDBClient:
         """
         items = data.get("Items", [])
         
-        extracted_values = []
-        for item in items:
-            if field in item:
-                value_dict = item[field]
-                # Extract the actual value based on its type
-                if "S" in value_dict:
-                    extracted_values.append(value_dict["S"])
-                elif "N" in value_dict:
-                    extracted_values.append(int(value_dict["N"]))
-                elif "BOOL" in value_dict:
-                    extracted_values.append(value_dict["BOOL"])
-        
-        return extracted_values
+        return [decode_value(item[field]) for item in items if field in item]
  
     def get_history(self, table_name: str, primary_key: Dict[str, Dict[str, str]], 
                  attributes: Optional[List[str]] = None) -> List[str]:
-        """Retrieve 'history' column. If not found, create it and return an empty list."""
+        """Retrieve 'history' column as plain strings. If not found, create it and return an empty list."""
         try:
             params = {'TableName': table_name, 'Key': primary_key}
             if attributes:
@@ -240,7 +446,7 @@ class DynamoDBClient:
                 self.update_history(table_name, primary_key, [])
                 return []
             
-            return item['history'].get('L', [])  # 'L' is the DynamoDB List type
+            return AgentToolMapping.from_item(item).history
 
         except ClientError as e:
             raise Exception(f"Failed to get item: {str(e)}")
@@ -256,8 +462,91 @@ class DynamoDBClient:
             )
         except ClientError as e:
             raise Exception(f"Failed to update item: {str(e)}")
-    
-        
+
+    def query_partition(self, table_name: str, key_name: str, key_value: Dict[str, str],
+                        limit: Optional[int] = None, newest_first: bool = False) -> List[Dict[str, Any]]:
+        """
+        Read the items of one partition in sort-key order
+
+        Args:
+            table_name (str): Name of the DynamoDB table
+            key_name (str): Partition key attribute
+            key_value (Dict[str, str]): Partition key value in DynamoDB format
+            limit (Optional[int]): Return at most this many items
+            newest_first (bool): Read in descending sort-key order
+
+        Returns:
+            List[Dict[str, Any]]: Items in the order they were read
+        """
+        return self.flight.do(_flight_key('query_partition', table_name, key_name, key_value, limit, newest_first),
+                              lambda: self._query_partition(table_name, key_name, key_value, limit, newest_first),
+                              clone=copy.deepcopy)
+
+    def _query_partition(self, table_name: str, key_name: str, key_value: Dict[str, str],
+                         limit: Optional[int] = None, newest_first: bool = False) -> List[Dict[str, Any]]:
+        params = {
+            'TableName': table_name,
+            'KeyConditionExpression': '#pk = :pk',
+            'ExpressionAttributeNames': {'#pk': key_name},
+            'ExpressionAttributeValues': {':pk': key_value},
+            'ScanIndexForward': not newest_first
+        }
+        if limit:
+            params['PaginationConfig'] = {'MaxItems': limit, 'PageSize': limit}
+        try:
+            items = []
+            for page in self.client.get_paginator('query').paginate(**params):
+                items.extend(page.get('Items', []))
+            return items[:limit] if limit else items
+        except ClientError as e:
+            raise Exception(f"Failed to query partition: {str(e)}")
+
+    def batch_write_items(self, table_name: str, items: List[Dict[str, Any]],
+                          max_attempts: int = 5) -> List[Dict[str, Any]]:
+        """
+        Put items with BatchWriteItem, 25 per request, retrying unprocessed items with backoff
+
+        Returns:
+            List[Dict[str, Any]]: Items still unprocessed after ``max_attempts``
+        """
+        leftover = []
+        for start in range(0, len(items), 25):
+            pending = [{'PutRequest': {'Item': item}} for item in items[start:start + 25]]
+            attempt = 0
+            while pending:
+                try:
+                    response = self.client.batch_write_item(RequestItems={table_name: pending})
+                except ClientError as e:
+                    raise Exception(f"Failed to batch write items: {str(e)}")
+                pending = response.get('UnprocessedItems', {}).get(table_name, [])
+                attempt += 1
+                if pending and attempt >= max_attempts:
+                    leftover.extend(r['PutRequest']['Item'] for r in pending)
+                    break
+                if pending:
+                    time.sleep(min(1.0, 0.05 * 2 ** attempt))
+        return leftover
+
+    def transact_write(self, operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Apply up to 100 Put/Update/Delete/ConditionCheck operations atomically with TransactWriteItems
+
+        Args:
+            operations (List[Dict[str, Any]]): TransactItems entries, e.g. ``{'Put': {'TableName': ..., 'Item': ...}}``
+
+        Raises:
+            ValueError: If a condition failed; nothing was written
+        """
+        try:
+            return self.client.transact_write_items(TransactItems=operations)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'TransactionCanceledException':
+                reasons = [r.get('Code') for r in e.response.get('CancellationReasons', [])]
+                if 'ConditionalCheckFailed' in reasons:
+                    raise ValueError("Transaction condition failed")
+            raise Exception(f"Failed to write transaction: {str(e)}")
+
+
 
     
     
@@ -0,0 +1,263 @@
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from .tracing import span
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of calling a backend whose circuit breaker is open"""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Consecutive-failure circuit breaker
+
+        After ``failure_threshold`` consecutive failures the circuit opens and calls fail fast.
+        Once ``reset_timeout`` seconds have passed a single trial call is let through
+        (half-open); its outcome closes or re-opens the circuit.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.trips += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.failures, "trips": self.trips}
+
+
+class BackendSpec(NamedTuple):
+    timeout_env: str
+    pool_size: int
+    idempotent: bool  # Safe to retry after the request may have reached the backend
+
+
+# Outbound backends, named after the env var holding their URL. Every one of them creates
+# something or posts a chat message, so none is retried once the request may have been sent.
+BACKENDS = {
+    "ELIZA_CREATE": BackendSpec("ELIZA_TIMEOUT", 10, False),
+    "ELIZA_QUERY": BackendSpec("ELIZA_TIMEOUT", 50, False),
+    "TOOLS_SET": BackendSpec("TOOLS_TIMEOUT", 10, False),
+    "TOOLS_QUERY": BackendSpec("TOOLS_TIMEOUT", 50, False),
+}
+
+RETRY_STATUSES = {502, 503, 504}
+
+
+def never_sent(error: requests.RequestException) -> bool:
+    """Whether the request failed before any of it could reach the backend"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+# Weight of the newest attempt in each backend's moving-average latency
+LATENCY_ALPHA = float(os.getenv("DOWNSTREAM_LATENCY_ALPHA", "0.2"))
+
+
+class Backend:
+    def __init__(self, name: str, spec: BackendSpec):
+        self.name = name
+        self.idempotent = spec.idempotent
+        self.pool_size = int(os.getenv(f"{name}_POOL_SIZE", str(spec.pool_size)))
+        self.retries = int(os.getenv(f"{name}_RETRIES", "2"))
+        self.timeout = (
+            float(os.getenv("DOWNSTREAM_CONNECT_TIMEOUT", "3")),
+            float(os.getenv(spec.timeout_env, "30"))
+        )
+        # Total time across attempts: the deadline the fan-out gives the call, by default
+        self.budget = float(os.getenv(spec.timeout_env, "30"))
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv(f"{name}_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv(f"{name}_BREAKER_RESET", "30"))
+        )
+        # pool_block caps in-flight requests at pool_size, pushing back on callers instead
+        # of opening unbounded connections to a struggling backend
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self.requests = 0
+        self.retried = 0
+        self.failed = 0
+        self.rejected = 0
+        self.latency: Optional[float] = None
+
+    def observe_latency(self, seconds: float) -> None:
+        """Fold one attempt's duration into the moving average that load shedding watches"""
+        self.latency = seconds if self.latency is None else self.latency + LATENCY_ALPHA * (seconds - self.latency)
+
+    def pool_stats(self) -> Dict[str, int]:
+        open_connections = idle = 0
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            open_connections += pool.num_connections
+            if pool.pool is not None:
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        return {"maxsize": self.pool_size, "connections_opened": open_connections, "idle_connections": idle}
+
+
+def _capped(timeout, remaining: float):
+    """``timeout`` (seconds or a (connect, read) pair) cut down to what is left of the deadline"""
+    remaining = max(remaining, 0.001)
+    if isinstance(timeout, tuple):
+        return tuple(None if t is None else min(t, remaining) for t in timeout)
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+class DownstreamClient:
+    def __init__(self, backoff_base: float = 0.1, backoff_cap: float = 2.0):
+        """
+        Pooled keep-alive sessions, retries and circuit breakers for the agent backends
+
+        Args:
+            backoff_base (float): Base delay in seconds for exponential backoff between retries
+            backoff_cap (float): Upper bound in seconds for a single backoff delay
+        """
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.backends = {name: Backend(name, spec) for name, spec in BACKENDS.items()}
+
+    def post(self, backend: str, url: Optional[str] = None, deadline: Optional[float] = None,
+             **kwargs) -> requests.Response:
+        """
+        POST to a backend through its pooled session
+
+        Failures to connect, where nothing was sent, are always retried. Other connection
+        errors, timeouts and 502/503/504 responses are only retried for idempotent backends,
+        since the request may already have been acted on. No attempt, backoff or timeout
+        runs past ``deadline``.
+
+        Args:
+            backend (str): Backend name, e.g. "TOOLS_QUERY"
+            url (Optional[str]): Full URL; defaults to the backend's env var
+            deadline (Optional[float]): ``time.monotonic()`` by which the caller stops waiting;
+                defaults to the backend's timeout from now, matching the fan-out deadline
+            **kwargs: Passed to ``requests.Session.post``
+
+        Raises:
+            CircuitOpenError: The backend's circuit breaker is open
+            requests.RequestException: The final attempt failed
+        """
+        target = self.backends[backend]
+        url = url or os.getenv(backend)
+        timeout = kwargs.pop("timeout", target.timeout)
+        if deadline is None:
+            deadline = time.monotonic() + target.budget
+
+        attempt, error, response = 0, None, None
+        while True:
+            remaining = deadline - time.monotonic()
+            if attempt and remaining <= 0:
+                # Out of time between attempts: give up with the last outcome
+                target.failed += 1
+                if error is not None:
+                    raise error
+                return response
+            if not target.breaker.allow():
+                if attempt == 0:
+                    target.rejected += 1
+                    raise CircuitOpenError(f"Circuit open for {backend}")
+                # The breaker opened while we were retrying: give up with the last outcome
+                target.failed += 1
+                if error is not None:
+                    raise error
+                return response
+            target.requests += 1
+            started = time.monotonic()
+            try:
+                with span("http", backend) as s:
+                    s.set("attempt", attempt)
+                    response = target.session.post(url, timeout=_capped(timeout, remaining), **kwargs)
+                    s.set("status", response.status_code)
+            except requests.RequestException as e:
+                # Includes errors after the request went out, e.g. a body cut off mid-stream
+                retryable, error, response = target.idempotent or never_sent(e), e, None
+            except Exception:
+                # Never leave an attempt unsettled: a half-open trial would block the breaker for good
+                target.breaker.record_failure()
+                target.failed += 1
+                raise
+            else:
+                if response.status_code < 500:
+                    target.breaker.record_success()
+                    return response
+                retryable, error = target.idempotent and response.status_code in RETRY_STATUSES, None
+            finally:
+                target.observe_latency(time.monotonic() - started)
+
+            target.breaker.record_failure()
+            if not retryable or attempt >= target.retries:
+                target.failed += 1
+                if error is not None:
+                    raise error
+                return response
+            attempt += 1
+            target.retried += 1
+            # Full jitter keeps retries from a burst of failures from arriving in lockstep
+            delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+            time.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+
+    def latency(self, backends: Iterable[str]) -> Optional[float]:
+        """Highest moving-average latency in seconds among the named backends, None before any call"""
+        latencies = [self.backends[name].latency for name in backends
+                     if name in self.backends and self.backends[name].latency is not None]
+        return max(latencies, default=None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "requests": b.requests,
+                "retries": b.retried,
+                "failures": b.failed,
+                "rejected_by_breaker": b.rejected,
+                "latency_ewma_ms": None if b.latency is None else round(b.latency * 1000, 1),
+                "breaker": b.breaker.stats(),
+                "pool": b.pool_stats()
+            }
+            for name, b in self.backends.items()
+        }
+
+    def close(self) -> None:
+        for backend in self.backends.values():
+            backend.session.close()
@@ -0,0 +1,254 @@
+"""
+Concurrent execution for request handlers, kept on separate pools so one kind of work
+cannot starve another:
+
+    fan_out / as_completed   per-request backend calls       FANOUT_WORKERS, default 32
+    bounded                  batch provisioning              BATCH_WORKERS, default 16
+    submit                   background work after a reply   BACKGROUND_WORKERS, default 4,
+                                                             queue of BACKGROUND_QUEUE_SIZE, default 1000
+
+Deadlines run from when a call starts on a pool thread, not from when it was queued.
+A call still queued once its timeout has passed is cancelled without running.
+"""
+import contextvars
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .logs import get_logger
+from .tracing import metrics
+
+log = get_logger(__name__)
+
+_request_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("FANOUT_WORKERS", "32")),
+    thread_name_prefix="fanout"
+)
+_batch_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BATCH_WORKERS", "16")),
+    thread_name_prefix="batch"
+)
+
+
+class CallResult:
+    __slots__ = ("name", "value", "error", "timed_out", "elapsed")
+
+    def __init__(self, name: str, value: Any = None, error: Optional[BaseException] = None,
+                 timed_out: bool = False, elapsed: float = 0.0):
+        self.name = name
+        self.value = value
+        self.error = error
+        self.timed_out = timed_out
+        self.elapsed = elapsed
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.timed_out
+
+
+def failure_detail(call: CallResult) -> Optional[str]:
+    """Why a backend call did not succeed, or None if it did"""
+    if call.timed_out:
+        return f"timed out after {call.elapsed:.1f}s"
+    if call.error is not None:
+        return str(call.error)
+    if call.value.status_code != 200:
+        return call.value.text
+    return None
+
+
+def fan_out(calls: Dict[str, Callable[[], Any]], timeouts: Optional[Dict[str, float]] = None,
+            default_timeout: float = 30.0) -> Dict[str, CallResult]:
+    """
+    Run independent backend calls concurrently on the request pool
+
+    Each call gets its own deadline, measured from when it starts running. A call that
+    misses its deadline is reported with ``timed_out=True`` and left to finish in the
+    background, so the caller can answer with the results that did arrive.
+
+    Args:
+        calls (Dict[str, Callable[[], Any]]): Name -> zero-argument callable
+        timeouts (Optional[Dict[str, float]]): Name -> seconds to wait for that call
+        default_timeout (float): Deadline for calls without an entry in ``timeouts``
+
+    Returns:
+        Dict[str, CallResult]: One result per call name
+    """
+    return {result.name: result for result in as_completed(calls, timeouts, default_timeout)}
+
+
+def as_completed(calls: Dict[str, Callable[[], Any]], timeouts: Optional[Dict[str, float]] = None,
+                 default_timeout: float = 30.0) -> Iterator[CallResult]:
+    """
+    Like ``fan_out``, but yield each call's result as soon as it finishes or times out
+
+    Args:
+        calls (Dict[str, Callable[[], Any]]): Name -> zero-argument callable
+        timeouts (Optional[Dict[str, float]]): Name -> seconds to wait for that call
+        default_timeout (float): Deadline for calls without an entry in ``timeouts``
+
+    Yields:
+        CallResult: One result per call name, in completion order
+    """
+    timeouts = timeouts or {}
+    futures = {}
+    for name, fn in calls.items():
+        clock = _Clock(timeouts.get(name, default_timeout))
+        futures[_start(_request_pool, clock, fn)] = (name, clock)
+
+    pending = set(futures)
+    while pending:
+        next_deadline = min(futures[f][1].deadline() for f in pending)
+        done, pending = wait(pending, timeout=max(0.0, next_deadline - time.monotonic()),
+                             return_when=FIRST_COMPLETED)
+        for future in done:
+            name, clock = futures[future]
+            try:
+                value, elapsed = future.result()
+                yield CallResult(name, value=value, elapsed=elapsed)
+            except Exception as e:
+                yield CallResult(name, error=e, elapsed=clock.elapsed())
+
+        now = time.monotonic()
+        for future in [f for f in pending if futures[f][1].deadline() <= now]:
+            pending.discard(future)
+            name, clock = futures[future]
+            future.cancel()
+            yield CallResult(name, timed_out=True, elapsed=clock.elapsed())
+
+
+def bounded(calls: Dict[Any, Callable[[], Any]], limit: int, timeout: float = 30.0) -> Iterator[CallResult]:
+    """
+    Run many calls on the batch pool with at most ``limit`` in flight, yielding each
+    result as it finishes
+
+    Every call gets ``timeout`` seconds from the moment it starts. A call that misses it
+    is reported with ``timed_out=True`` and its slot is handed to the next call.
+
+    Args:
+        calls (Dict[Any, Callable[[], Any]]): Name -> zero-argument callable
+        limit (int): Maximum number of calls running at once
+        timeout (float): Seconds each call is allowed
+
+    Yields:
+        CallResult: One result per call name, in completion order
+    """
+    queued = iter(calls.items())
+    running: Dict[Any, Any] = {}  # future -> (name, clock)
+
+    def start_next() -> bool:
+        try:
+            name, fn = next(queued)
+        except StopIteration:
+            return False
+        clock = _Clock(timeout)
+        running[_start(_batch_pool, clock, fn)] = (name, clock)
+        return True
+
+    while len(running) < max(1, limit) and start_next():
+        pass
+    while running:
+        next_deadline = min(clock.deadline() for _, clock in running.values())
+        done, _ = wait(list(running), timeout=max(0.0, next_deadline - time.monotonic()),
+                       return_when=FIRST_COMPLETED)
+        now = time.monotonic()
+        for future in done:
+            name, clock = running.pop(future)
+            try:
+                value, elapsed = future.result()
+                yield CallResult(name, value=value, elapsed=elapsed)
+            except Exception as e:
+                yield CallResult(name, error=e, elapsed=clock.elapsed())
+            start_next()
+        for future in [f for f, (_, clock) in running.items() if clock.deadline() <= now]:
+            name, clock = running.pop(future)
+            future.cancel()
+            yield CallResult(name, timed_out=True, elapsed=clock.elapsed())
+            start_next()
+
+
+class _Clock:
+    __slots__ = ("timeout", "queued", "started")
+
+    def __init__(self, timeout: float):
+        """Deadline of one call: ``timeout`` after it starts, or after queueing if it never does"""
+        self.timeout = timeout
+        self.queued = time.monotonic()
+        self.started: Optional[float] = None
+
+    def deadline(self) -> float:
+        return (self.started if self.started is not None else self.queued) + self.timeout
+
+    def elapsed(self) -> float:
+        return time.monotonic() - (self.started if self.started is not None else self.queued)
+
+
+def _start(pool: ThreadPoolExecutor, clock: _Clock, fn: Callable[[], Any]) -> Future:
+    # Each call runs in a copy of the caller's context, so its spans and memo lookups join the request's
+    return pool.submit(contextvars.copy_context().run, _timed, fn, clock)
+
+
+def _timed(fn: Callable[[], Any], clock: _Clock):
+    clock.started = time.monotonic()
+    return fn(), time.monotonic() - clock.started
+
+
+class _BackgroundQueue:
+    def __init__(self, workers: int, size: int):
+        """
+        Fire-and-forget work on a few daemon threads behind a bounded queue
+
+        When the queue is full, new work is dropped (and counted) rather than queued
+        without limit. Everything submitted here must be safe to lose, e.g. work the
+        next request redoes if it finds it missing.
+        """
+        self.workers = workers
+        self._queue: "queue.Queue" = queue.Queue(maxsize=size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        future: Future = Future()
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((future, fn, args, kwargs))
+        except queue.Full:
+            metrics.inc("agent_server_background_dropped_total", task=getattr(fn, "__qualname__", "call"))
+            log.warning("background_task_dropped", task=getattr(fn, "__qualname__", repr(fn)))
+            future.set_exception(RuntimeError("background queue full"))
+        return future
+
+    def _ensure_started(self) -> None:
+        if len(self._threads) >= self.workers and all(t.is_alive() for t in self._threads):
+            return
+        with self._lock:
+            # Threads do not survive a fork; start them again in the child
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name="background", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self) -> None:
+        while True:
+            future, fn, args, kwargs = self._queue.get()
+            try:
+                if future.set_running_or_notify_cancel():
+                    future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                log.exception("background_task_failed", task=getattr(fn, "__qualname__", repr(fn)))
+                future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+
+_background = _BackgroundQueue(int(os.getenv("BACKGROUND_WORKERS", "4")),
+                               int(os.getenv("BACKGROUND_QUEUE_SIZE", "1000")))
+
+
+def submit(fn: Callable[..., Any], *args, **kwargs) -> Future:
+    """Queue a call to run in the background after the response; dropped when the queue is full"""
+    return _background.submit(fn, *args, **kwargs)
@@ -0,0 +1,100 @@
+import os
+import threading
+from typing import Dict, List
+
+
+class _Counter:
+    __slots__ = ("next_id", "last_id", "lock", "refill")
+
+    def __init__(self):
+        self.next_id = 1
+        self.last_id = 0  # Empty block
+        self.lock = threading.Lock()  # Guards the block; never held across DynamoDB calls
+        self.refill = threading.Lock()  # One table round trip per counter at a time
+
+    def take(self, count: int) -> List[int]:
+        """Up to ``count`` IDs from the in-memory block; caller holds ``lock``"""
+        n = max(0, min(count, self.last_id - self.next_id + 1))
+        ids = list(range(self.next_id, self.next_id + n))
+        self.next_id += n
+        return ids
+
+
+class IdAllocator:
+    def __init__(self, dynamo_client, counter_table: str = None, block_size: int = None):
+        """
+        Hands out unique, increasing integer IDs backed by one atomic counter item per name
+
+        Each trip to DynamoDB reserves a block of ``block_size`` IDs with a single
+        ``ADD`` update; the block is then served from memory. IDs are unique across
+        processes, but a block left unused when a process exits is skipped.
+
+        Args:
+            dynamo_client (DynamoDBClient): Client used to read and update the counter table
+            counter_table (str): Table holding the counters, keyed by ``counter_name`` (S)
+            block_size (int): Number of IDs reserved per round trip
+        """
+        self.dynamo = dynamo_client
+        self.counter_table = counter_table or os.getenv("ID_COUNTER_TABLE", "id_counters")
+        self.block_size = max(1, block_size or int(os.getenv("ID_BLOCK_SIZE", "10")))
+        self._counters: Dict[str, _Counter] = {}
+        self._seeded = set()
+        self._lock = threading.Lock()  # Guards ``_counters`` only
+
+    def _counter(self, name: str) -> _Counter:
+        with self._lock:
+            counter = self._counters.get(name)
+            if counter is None:
+                counter = self._counters[name] = _Counter()
+            return counter
+
+    def allocate(self, name: str) -> int:
+        """Return the next ID for the counter ``name``"""
+        return self.reserve(name, 1)[0]
+
+    def reserve(self, name: str, count: int) -> List[int]:
+        """
+        Return ``count`` unique IDs for the counter ``name``
+
+        IDs come from the in-memory block first; a shortfall is reserved from the table
+        in one update of at least ``block_size`` IDs. Only callers of the same counter
+        wait for that round trip, and a caller that waited takes from the block the
+        previous refill left before going to the table itself.
+        """
+        counter = self._counter(name)
+        with counter.lock:
+            ids = counter.take(count)
+        if len(ids) == count:
+            return ids
+
+        with counter.refill:
+            with counter.lock:
+                ids += counter.take(count - len(ids))
+            missing = count - len(ids)
+            if missing:
+                reserve = max(missing, self.block_size)
+                last_id = self._increment(name, reserve)
+                first_id = last_id - reserve + 1
+                ids.extend(range(first_id, first_id + missing))
+                with counter.lock:
+                    # The block was empty and only refills (serialized here) add to it
+                    counter.next_id, counter.last_id = first_id + missing, last_id
+        return ids
+
+    def _increment(self, name: str, amount: int) -> int:
+        if name not in self._seeded:
+            self._seed(name)
+        return self.dynamo.increment_counter(
+            self.counter_table, {"counter_name": {"S": name}}, "last_id", amount
+        )
+
+    def _seed(self, name: str) -> None:
+        """Start a new counter after the highest ID already stored in the table it numbers"""
+        key = {"counter_name": {"S": name}}
+        if not self.dynamo.get_item(self.counter_table, key):
+            item = dict(key, last_id={"N": str(self.dynamo.get_max_id(name))})
+            try:
+                self.dynamo.add_item(self.counter_table, item, condition="attribute_not_exists(counter_name)")
+            except ValueError:
+                pass  # Another process seeded it first
+        self._seeded.add(name)
@@ -0,0 +1,117 @@
+"""
+Request deduplication with idempotency keys
+
+A client sends the same ``Idempotency-Key`` on every retry of one logical request.
+The first attempt claims the key in a DynamoDB table; when it finishes, its response
+is stored under the key, and retries get that response back instead of doing the
+work again. A retry that arrives while the first attempt is still running is told
+to back off, and a key reused with a different request body is rejected.
+
+Records carry ``expires_at`` (epoch seconds), which should be the table's TTL
+attribute; an expired record is also treated as absent, so TTL deletion lag is harmless.
+
+Environment:
+    IDEMPOTENCY_TABLE         Table keyed by ``idempotency_key`` (S), default idempotency_keys
+    IDEMPOTENCY_TTL           Seconds a response is replayed for, default 86400
+    IDEMPOTENCY_LOCK_TIMEOUT  Seconds before an unfinished claim (e.g. a crashed worker)
+                              can be taken over, default 120
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Any, NamedTuple, Optional
+
+from .logs import get_logger
+
+log = get_logger(__name__)
+
+ACQUIRED = "acquired"
+REPLAY = "replay"
+IN_PROGRESS = "in_progress"
+MISMATCH = "mismatch"
+
+# Free, expired, or an unfinished claim whose worker gave up
+_CLAIMABLE = ("attribute_not_exists(idempotency_key) OR expires_at < :now"
+              " OR (#state = :pending AND locked_until < :now)")
+
+
+class Claim(NamedTuple):
+    state: str
+    status: Optional[int] = None
+    body: Optional[str] = None
+
+
+def fingerprint(payload: Any) -> str:
+    """Stable hash of a JSON request body"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, dynamo_client, table_name: str = None, ttl: float = None, lock_timeout: float = None):
+        """
+        Args:
+            dynamo_client (DynamoDBClient): Client used for the conditional writes
+            table_name (str): Dedup table, keyed by ``idempotency_key`` (S)
+            ttl (float): Seconds a finished response is replayed for
+            lock_timeout (float): Seconds an unfinished claim blocks retries
+        """
+        self.dynamo = dynamo_client
+        self.table_name = table_name or os.getenv("IDEMPOTENCY_TABLE", "idempotency_keys")
+        self.ttl = int(ttl or float(os.getenv("IDEMPOTENCY_TTL", "86400")))
+        self.lock_timeout = int(lock_timeout or float(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "120")))
+
+    @staticmethod
+    def record_key(scope: str, key: str) -> str:
+        """Table key for a client key, scoped (e.g. by endpoint and API key) and hashed so no secret is stored"""
+        return hashlib.sha256(f"{scope}\0{key}".encode()).hexdigest()
+
+    def claim(self, record_key: str, request_fingerprint: str) -> Claim:
+        """
+        Claim a key for a new attempt, or report what an earlier attempt left
+
+        Returns:
+            Claim: ``acquired`` (go ahead, then ``complete`` or ``release``), ``replay`` with the
+            stored status and body, ``in_progress``, or ``mismatch`` (different request body)
+        """
+        now = int(time.time())
+        item = {
+            "idempotency_key": {"S": record_key},
+            "state": {"S": "pending"},
+            "fingerprint": {"S": request_fingerprint},
+            "locked_until": {"N": str(now + self.lock_timeout)},
+            "expires_at": {"N": str(now + self.ttl)},
+        }
+        try:
+            self.dynamo.add_item(self.table_name, item, condition=_CLAIMABLE, names={"#state": "state"},
+                                 values={":now": {"N": str(now)}, ":pending": {"S": "pending"}})
+            return Claim(ACQUIRED)
+        except ValueError:
+            pass  # Claimed by an earlier attempt
+
+        # A read of its own: a coalesced one may have started before the claim it must see
+        existing = self.dynamo.get_item(self.table_name, {"idempotency_key": {"S": record_key}}, coalesce=False)
+        if not existing:
+            return Claim(IN_PROGRESS)  # Not visible to this read yet
+        if existing["fingerprint"]["S"] != request_fingerprint:
+            return Claim(MISMATCH)
+        if existing["state"]["S"] == "done":
+            return Claim(REPLAY, int(existing["status"]["N"]), existing["body"]["S"])
+        return Claim(IN_PROGRESS)
+
+    def complete(self, record_key: str, request_fingerprint: str, status: int, body: str) -> None:
+        """Store the response of a claimed attempt for its retries to replay"""
+        item = {
+            "idempotency_key": {"S": record_key},
+            "state": {"S": "done"},
+            "fingerprint": {"S": request_fingerprint},
+            "status": {"N": str(status)},
+            "body": {"S": body},
+            "expires_at": {"N": str(int(time.time()) + self.ttl)},
+        }
+        self.dynamo.add_item(self.table_name, item, condition=None)
+
+    def release(self, record_key: str) -> None:
+        """Drop a claim whose attempt failed, so a retry runs again"""
+        self.dynamo.delete_item(self.table_name, {"idempotency_key": {"S": record_key}})
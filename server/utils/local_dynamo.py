@@ -0,0 +1,457 @@
+"""
+In-memory stand-in for the boto3 DynamoDB client
+
+Implements the subset of the low-level client API the server uses (get/put/update
+item, query, scan, batch and transactional writes, paginators) with the same wire format, key
+schemas, GSIs, condition/update expressions and page-by-page pagination, so the
+app can run and be load-tested without AWS. Selected with STORAGE_BACKEND=memory.
+"""
+import copy
+import os
+import re
+import threading
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from .access_paths import ACCESS_PATHS
+
+
+class TableSpec(NamedTuple):
+    hash_key: str
+    range_key: Optional[str] = None
+    indexes: Optional[Dict[str, Tuple[str, Optional[str]]]] = None
+
+
+_TABLE_DEFAULTS = {"API_TABLE": "api_keys", "AGENT_TABLE": "agents"}
+
+
+def default_tables() -> Dict[str, TableSpec]:
+    """Key schemas of the tables the server uses, with GSIs taken from the declared access paths"""
+    names = {env: os.getenv(env, default) for env, default in _TABLE_DEFAULTS.items()}
+    tables = {
+        names["API_TABLE"]: TableSpec("id", indexes={}),
+        names["AGENT_TABLE"]: TableSpec("id", indexes={}),
+        "agent_tool_id": TableSpec("multi_agent_main_name"),
+        os.getenv("HISTORY_TABLE", "agent_history"): TableSpec("multi_agent_main_name", "seq"),
+        os.getenv("ID_COUNTER_TABLE", "id_counters"): TableSpec("counter_name"),
+        os.getenv("IDEMPOTENCY_TABLE", "idempotency_keys"): TableSpec("idempotency_key"),
+        os.getenv("RATE_LIMIT_TABLE", "rate_limits"): TableSpec("bucket_key"),
+        os.getenv("PROMPT_SUMMARY_TABLE", "prompt_summaries"): TableSpec("multi_agent_main_name"),
+    }
+    for path in ACCESS_PATHS:
+        tables[names[path.table_env]].indexes[path.index_name] = (path.attribute, None)
+    return tables
+
+
+def _error(code: str, message: str, operation: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+def _python(value: Dict[str, Any]) -> Any:
+    """Comparable Python value of a DynamoDB attribute value"""
+    if "S" in value:
+        return value["S"]
+    if "N" in value:
+        return Decimal(value["N"])
+    if "BOOL" in value:
+        return value["BOOL"]
+    if "NULL" in value:
+        return None
+    return repr(value)
+
+
+_COMPARISON = re.compile(r"^\s*([#\w.]+)\s*(=|<>|<=|>=|<|>)\s*(:\w+)\s*$")
+_FUNCTION = re.compile(r"^\s*(attribute_exists|attribute_not_exists|begins_with)\s*\(\s*([#\w.]+)\s*(?:,\s*(:\w+)\s*)?\)\s*$")
+_BETWEEN = re.compile(r"^\s*([#\w.]+)\s+BETWEEN\s+(:\w+)\s+AND\s+(:\w+)\s*$", re.IGNORECASE)
+
+
+def _unwrap(clause: str) -> str:
+    """Drop parentheses wrapping a whole clause"""
+    clause = clause.strip()
+    while clause.startswith("(") and clause.endswith(")"):
+        depth = 0
+        for i, ch in enumerate(clause):
+            depth += {"(": 1, ")": -1}.get(ch, 0)
+            if depth == 0 and i < len(clause) - 1:
+                return clause
+        clause = clause[1:-1].strip()
+    return clause
+
+
+class _Expression:
+    def __init__(self, names: Optional[Dict[str, str]], values: Optional[Dict[str, Any]]):
+        self.names = names or {}
+        self.values = values or {}
+
+    def name(self, token: str) -> str:
+        return self.names.get(token, token)
+
+    def value(self, token: str) -> Dict[str, Any]:
+        return self.values[token]
+
+    def alternatives(self, expression: str) -> List[str]:
+        """Split on OR outside parentheses"""
+        parts, depth, start = [], 0, 0
+        for m in re.finditer(r"[()]|\s+OR\s+", expression, flags=re.IGNORECASE):
+            token = m.group(0)
+            if token == "(":
+                depth += 1
+            elif token == ")":
+                depth -= 1
+            elif depth == 0:
+                parts.append(expression[start:m.start()])
+                start = m.end()
+        parts.append(expression[start:])
+        return [_unwrap(p) for p in parts if p.strip()]
+
+    def clauses(self, expression: str) -> List[str]:
+        """Split on top-level AND, keeping ``BETWEEN x AND y`` together"""
+        parts, current = [], []
+        tokens = re.split(r"(\s+AND\s+)", expression, flags=re.IGNORECASE)
+        for token in tokens:
+            if re.fullmatch(r"\s+AND\s+", token, flags=re.IGNORECASE):
+                if current and re.search(r"\bBETWEEN\s+:\w+\s*$", "".join(current), re.IGNORECASE):
+                    current.append(token)
+                else:
+                    parts.append("".join(current))
+                    current = []
+            else:
+                current.append(token)
+        parts.append("".join(current))
+        return [_unwrap(p) for p in parts if p.strip()]
+
+    def matches(self, expression: Optional[str], item: Optional[Dict[str, Any]]) -> bool:
+        if not expression:
+            return True
+        item = item or {}
+        return any(all(self._clause(clause, item) for clause in self.clauses(alternative))
+                   for alternative in self.alternatives(expression))
+
+    def _clause(self, clause: str, item: Dict[str, Any]) -> bool:
+        if len(self.alternatives(clause)) > 1:
+            return self.matches(clause, item)
+        m = _FUNCTION.match(clause)
+        if m:
+            func, attr, operand = m.group(1), self.name(m.group(2)), m.group(3)
+            if func == "attribute_exists":
+                return attr in item
+            if func == "attribute_not_exists":
+                return attr not in item
+            return attr in item and str(_python(item[attr])).startswith(str(_python(self.value(operand))))
+        m = _BETWEEN.match(clause)
+        if m:
+            attr = self.name(m.group(1))
+            if attr not in item:
+                return False
+            low, high = _python(self.value(m.group(2))), _python(self.value(m.group(3)))
+            return low <= _python(item[attr]) <= high
+        m = _COMPARISON.match(clause)
+        if not m:
+            raise _error("ValidationException", f"Unsupported expression: {clause}", "Expression")
+        attr, op, operand = self.name(m.group(1)), m.group(2), _python(self.value(m.group(3)))
+        if attr not in item:
+            return op == "<>"
+        current = _python(item[attr])
+        try:
+            return {
+                "=": current == operand, "<>": current != operand,
+                "<": current < operand, "<=": current <= operand,
+                ">": current > operand, ">=": current >= operand,
+            }[op]
+        except TypeError:
+            return False
+
+    def key_condition(self, expression: str) -> Tuple[str, Any, Optional[str]]:
+        """Return (hash attribute, hash value, remaining sort-key clause) of a KeyConditionExpression"""
+        clauses = self.clauses(expression)
+        m = _COMPARISON.match(clauses[0])
+        if not m or m.group(2) != "=":
+            raise _error("ValidationException", "Query key condition not supported", "Query")
+        rest = " AND ".join(clauses[1:]) or None
+        return self.name(m.group(1)), _python(self.value(m.group(3))), rest
+
+    def apply_update(self, expression: str, item: Dict[str, Any]) -> None:
+        for action, body in re.findall(r"\b(SET|ADD|REMOVE)\b\s+(.*?)(?=\s+\b(?:SET|ADD|REMOVE)\b|$)",
+                                       expression, flags=re.IGNORECASE | re.DOTALL):
+            action = action.upper()
+            for part in [p.strip() for p in body.split(",") if p.strip()]:
+                if action == "SET":
+                    attr, operand = [x.strip() for x in part.split("=", 1)]
+                    attr = self.name(attr)
+                    m = re.fullmatch(r"if_not_exists\(\s*([#\w]+)\s*,\s*(:\w+)\s*\)", operand)
+                    if m:
+                        if attr not in item:
+                            item[attr] = copy.deepcopy(self.value(m.group(2)))
+                    else:
+                        item[attr] = copy.deepcopy(self.value(operand))
+                elif action == "ADD":
+                    attr, operand = part.split()
+                    attr, delta = self.name(attr), self.value(operand)
+                    current = Decimal(item.get(attr, {"N": "0"})["N"])
+                    item[attr] = {"N": str(current + Decimal(delta["N"]))}
+                else:
+                    item.pop(self.name(part), None)
+
+
+def _project(item: Dict[str, Any], projection: Optional[str], names: Optional[Dict[str, str]],
+             attributes: Optional[List[str]] = None) -> Dict[str, Any]:
+    if attributes:
+        return {k: v for k, v in item.items() if k in attributes}
+    if not projection:
+        return item
+    wanted = {(names or {}).get(p.strip(), p.strip()) for p in projection.split(",")}
+    return {k: v for k, v in item.items() if k in wanted}
+
+
+class _Paginator:
+    def __init__(self, client: "InMemoryDynamoDB", operation: str):
+        self.client = client
+        self.operation = operation
+
+    def paginate(self, **kwargs) -> Iterator[Dict[str, Any]]:
+        config = kwargs.pop("PaginationConfig", {}) or {}
+        max_items, page_size = config.get("MaxItems"), config.get("PageSize")
+        if page_size:
+            kwargs["Limit"] = page_size
+        returned = 0
+        while True:
+            page = getattr(self.client, self.operation)(**kwargs)
+            if max_items is not None and returned + len(page["Items"]) >= max_items:
+                page["Items"] = page["Items"][:max_items - returned]
+                page["Count"] = len(page["Items"])
+                page.pop("LastEvaluatedKey", None)
+            returned += len(page["Items"])
+            yield page
+            if "LastEvaluatedKey" not in page:
+                return
+            kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+
+class InMemoryDynamoDB:
+    def __init__(self, tables: Optional[Dict[str, TableSpec]] = None, page_items: Optional[int] = None):
+        """
+        Args:
+            tables (Optional[Dict[str, TableSpec]]): Table name -> key schema; defaults to ``default_tables()``
+            page_items (Optional[int]): Items per scan/query page, standing in for DynamoDB's 1 MB
+                page limit so callers that ignore pagination are caught
+        """
+        self.tables: Dict[str, Dict[str, Any]] = {}
+        self.page_items = page_items or int(os.getenv("LOCAL_DYNAMO_PAGE_ITEMS", "100"))
+        self._lock = threading.RLock()
+        for name, spec in (tables if tables is not None else default_tables()).items():
+            self.create_table(name, spec)
+
+    # -- table management -------------------------------------------------
+
+    def create_table(self, name: str, spec: TableSpec) -> None:
+        with self._lock:
+            self.tables[name] = {"spec": spec, "items": {}}
+
+    def _table(self, name: str, operation: str) -> Dict[str, Any]:
+        table = self.tables.get(name)
+        if table is None:
+            raise _error("ResourceNotFoundException", f"Requested resource not found: Table: {name} not found", operation)
+        return table
+
+    @staticmethod
+    def _key(spec: TableSpec, item: Dict[str, Any], operation: str) -> Tuple:
+        try:
+            key = (_python(item[spec.hash_key]),)
+            if spec.range_key:
+                key += (_python(item[spec.range_key]),)
+            return key
+        except KeyError as e:
+            raise _error("ValidationException", f"Missing key attribute {e}", operation)
+
+    def describe_table(self, TableName: str, **_) -> Dict[str, Any]:
+        spec = self._table(TableName, "DescribeTable")["spec"]
+        schema = [{"AttributeName": spec.hash_key, "KeyType": "HASH"}]
+        if spec.range_key:
+            schema.append({"AttributeName": spec.range_key, "KeyType": "RANGE"})
+        return {"Table": {
+            "TableName": TableName,
+            "KeySchema": schema,
+            "AttributeDefinitions": [{"AttributeName": s["AttributeName"], "AttributeType": "S"} for s in schema],
+            "ItemCount": len(self.tables[TableName]["items"]),
+        }}
+
+    # -- single item operations -------------------------------------------
+
+    def get_item(self, TableName: str, Key: Dict[str, Any], AttributesToGet: Optional[List[str]] = None,
+                 ProjectionExpression: Optional[str] = None, ExpressionAttributeNames=None, **_) -> Dict[str, Any]:
+        with self._lock:
+            table = self._table(TableName, "GetItem")
+            item = table["items"].get(self._key(table["spec"], Key, "GetItem"))
+            if item is None:
+                return {}
+            return {"Item": copy.deepcopy(_project(item, ProjectionExpression, ExpressionAttributeNames, AttributesToGet))}
+
+    def put_item(self, TableName: str, Item: Dict[str, Any], ConditionExpression: Optional[str] = None,
+                 ExpressionAttributeNames=None, ExpressionAttributeValues=None, **_) -> Dict[str, Any]:
+        with self._lock:
+            table = self._table(TableName, "PutItem")
+            key = self._key(table["spec"], Item, "PutItem")
+            expr = _Expression(ExpressionAttributeNames, ExpressionAttributeValues)
+            if not expr.matches(ConditionExpression, table["items"].get(key)):
+                raise _error("ConditionalCheckFailedException", "The conditional request failed", "PutItem")
+            table["items"][key] = copy.deepcopy(Item)
+            return {}
+
+    def update_item(self, TableName: str, Key: Dict[str, Any], AttributeUpdates=None, UpdateExpression=None,
+                    ConditionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+                    ReturnValues: str = "NONE", **_) -> Dict[str, Any]:
+        with self._lock:
+            table = self._table(TableName, "UpdateItem")
+            key = self._key(table["spec"], Key, "UpdateItem")
+            existing = table["items"].get(key)
+            expr = _Expression(ExpressionAttributeNames, ExpressionAttributeValues)
+            if not expr.matches(ConditionExpression, existing):
+                raise _error("ConditionalCheckFailedException", "The conditional request failed", "UpdateItem")
+            item = copy.deepcopy(existing) if existing else copy.deepcopy(Key)
+            before = copy.deepcopy(item)
+            if UpdateExpression:
+                expr.apply_update(UpdateExpression, item)
+            for attr, update in (AttributeUpdates or {}).items():
+                if update.get("Action", "PUT") == "DELETE":
+                    item.pop(attr, None)
+                else:
+                    item[attr] = copy.deepcopy(update["Value"])
+            table["items"][key] = item
+
+            if ReturnValues == "ALL_NEW":
+                return {"Attributes": copy.deepcopy(item)}
+            if ReturnValues == "UPDATED_NEW":
+                return {"Attributes": {k: copy.deepcopy(v) for k, v in item.items() if before.get(k) != v}}
+            if ReturnValues == "ALL_OLD" and existing:
+                return {"Attributes": copy.deepcopy(existing)}
+            return {}
+
+    def delete_item(self, TableName: str, Key: Dict[str, Any], **_) -> Dict[str, Any]:
+        with self._lock:
+            table = self._table(TableName, "DeleteItem")
+            table["items"].pop(self._key(table["spec"], Key, "DeleteItem"), None)
+            return {}
+
+    # -- multi item operations --------------------------------------------
+
+    def _page(self, rows: List[Tuple[Tuple, Dict[str, Any]]], key_attrs: List[str], limit: Optional[int],
+              start_key: Optional[Dict[str, Any]], filter_fn, projection, names,
+              index_attrs: Tuple[str, ...] = ()) -> Dict[str, Any]:
+        """One page of ``rows``; LastEvaluatedKey carries the table key plus any index key, as a GSI query's does"""
+        if start_key:
+            start = tuple(_python(start_key[a]) for a in key_attrs if a in start_key)
+            for i, (sort_key, _) in enumerate(rows):
+                if sort_key == start:
+                    rows = rows[i + 1:]
+                    break
+        page_size = min(limit or self.page_items, self.page_items)
+        page, evaluated = rows[:page_size], rows[:page_size]
+        result = {
+            "Items": [copy.deepcopy(_project(item, projection, names)) for _, item in page if filter_fn(item)],
+            "ScannedCount": len(evaluated),
+        }
+        result["Count"] = len(result["Items"])
+        if len(rows) > page_size:
+            last = evaluated[-1][1]
+            result["LastEvaluatedKey"] = {a: copy.deepcopy(last[a]) for a in (*index_attrs, *key_attrs) if a in last}
+        return result
+
+    def scan(self, TableName: str, FilterExpression: Optional[str] = None, ProjectionExpression: Optional[str] = None,
+             ExpressionAttributeNames=None, ExpressionAttributeValues=None, Limit: Optional[int] = None,
+             ExclusiveStartKey=None, **_) -> Dict[str, Any]:
+        with self._lock:
+            table = self._table(TableName, "Scan")
+            spec = table["spec"]
+            key_attrs = [spec.hash_key] + ([spec.range_key] if spec.range_key else [])
+            rows = list(table["items"].items())
+            expr = _Expression(ExpressionAttributeNames, ExpressionAttributeValues)
+            return self._page(rows, key_attrs, Limit, ExclusiveStartKey,
+                              lambda item: expr.matches(FilterExpression, item),
+                              ProjectionExpression, ExpressionAttributeNames)
+
+    def query(self, TableName: str, KeyConditionExpression: str, IndexName: Optional[str] = None,
+              FilterExpression: Optional[str] = None, ProjectionExpression: Optional[str] = None,
+              ExpressionAttributeNames=None, ExpressionAttributeValues=None, ScanIndexForward: bool = True,
+              Limit: Optional[int] = None, ExclusiveStartKey=None, **_) -> Dict[str, Any]:
+        with self._lock:
+            table = self._table(TableName, "Query")
+            spec = table["spec"]
+            if IndexName:
+                if IndexName not in (spec.indexes or {}):
+                    raise _error("ValidationException", f"The table does not have the specified index: {IndexName}", "Query")
+                hash_key, range_key = spec.indexes[IndexName]
+            else:
+                hash_key, range_key = spec.hash_key, spec.range_key
+
+            expr = _Expression(ExpressionAttributeNames, ExpressionAttributeValues)
+            attr, value, sort_condition = expr.key_condition(KeyConditionExpression)
+            if attr != hash_key:
+                raise _error("ValidationException", "Query condition missed key schema element", "Query")
+
+            rows = [(key, item) for key, item in table["items"].items()
+                    if hash_key in item and _python(item[hash_key]) == value
+                    and expr.matches(sort_condition, item)]
+            if range_key:
+                rows.sort(key=lambda row: _python(row[1].get(range_key, {"S": ""})), reverse=not ScanIndexForward)
+            elif not ScanIndexForward:
+                rows.reverse()
+
+            key_attrs = [spec.hash_key] + ([spec.range_key] if spec.range_key else [])
+            index_attrs = tuple(a for a in (hash_key, range_key) if a and IndexName)
+            return self._page(rows, key_attrs, Limit, ExclusiveStartKey,
+                              lambda item: expr.matches(FilterExpression, item),
+                              ProjectionExpression, ExpressionAttributeNames, index_attrs)
+
+    def batch_write_item(self, RequestItems: Dict[str, List[Dict[str, Any]]], **_) -> Dict[str, Any]:
+        with self._lock:
+            if sum(len(reqs) for reqs in RequestItems.values()) > 25:
+                raise _error("ValidationException", "Too many items requested for the BatchWriteItem call", "BatchWriteItem")
+            for table_name, requests in RequestItems.items():
+                for request in requests:
+                    if "PutRequest" in request:
+                        self.put_item(TableName=table_name, Item=request["PutRequest"]["Item"])
+                    else:
+                        self.delete_item(TableName=table_name, Key=request["DeleteRequest"]["Key"])
+            return {"UnprocessedItems": {}}
+
+    def transact_write_items(self, TransactItems: List[Dict[str, Any]], **_) -> Dict[str, Any]:
+        """All-or-nothing: every condition is checked before any write is applied"""
+        with self._lock:
+            if len(TransactItems) > 100:
+                raise _error("ValidationException", "Too many items in the TransactWriteItems call", "TransactWriteItems")
+            reasons, failed = [], False
+            for op in TransactItems:
+                (action, params), = op.items()
+                table = self._table(params["TableName"], "TransactWriteItems")
+                key = self._key(table["spec"], params["Item"] if action == "Put" else params["Key"], "TransactWriteItems")
+                expr = _Expression(params.get("ExpressionAttributeNames"), params.get("ExpressionAttributeValues"))
+                if expr.matches(params.get("ConditionExpression"), table["items"].get(key)):
+                    reasons.append({"Code": "None"})
+                else:
+                    reasons.append({"Code": "ConditionalCheckFailed", "Message": "The conditional request failed"})
+                    failed = True
+            if failed:
+                codes = ", ".join(r["Code"] for r in reasons)
+                error = _error("TransactionCanceledException",
+                               f"Transaction cancelled, please refer cancellation reasons for specific reasons [{codes}]",
+                               "TransactWriteItems")
+                error.response["CancellationReasons"] = reasons
+                raise error
+
+            for op in TransactItems:
+                (action, params), = op.items()
+                params = {k: v for k, v in params.items() if k != "ConditionExpression"}
+                if action == "Put":
+                    self.put_item(**params)
+                elif action == "Update":
+                    self.update_item(**params)
+                elif action == "Delete":
+                    self.delete_item(**params)
+            return {}
+
+    def get_paginator(self, operation: str) -> _Paginator:
+        if operation not in ("scan", "query"):
+            raise NotImplementedError(f"No paginator for {operation}")
+        return _Paginator(self, operation)
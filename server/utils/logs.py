@@ -0,0 +1,215 @@
+"""
+Structured, non-blocking logging
+
+    log = get_logger(__name__)
+    log.info("api_key_created", user_id=user_id, api_key=key)
+    log.debug("create_session_request", payload=data)      # sampled
+
+Records are queued by the calling thread and rendered and written by one listener
+thread, so a slow stdout pipe never blocks a request; when the queue is full the
+record is dropped and counted. Field values are size-capped and secrets are redacted.
+
+Environment:
+    LOG_LEVEL          Minimum level, default INFO
+    LOG_FORMAT         json (default) or text
+    LOG_DEBUG_SAMPLE   Fraction of debug events kept, default 0.01
+    LOG_FIELD_MAX      Characters kept per rendered field, default 512
+    LOG_QUEUE_SIZE     Records buffered before dropping, default 10000
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+ROOT = "server"
+REDACTED_FIELDS = frozenset({"api_key", "api_keys", "env_json", "authorization", "password", "secret", "token"})
+
+_lock = threading.Lock()
+_listener: Optional[QueueListener] = None
+_handler: Optional["DroppingQueueHandler"] = None
+
+
+def _cap(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}...(+{len(text) - limit} chars)"
+
+
+def redact(key: str, value: Any) -> Any:
+    """Mask secrets: API keys keep their last four characters, anything else is hidden"""
+    if key.lower() not in REDACTED_FIELDS or value is None:
+        if isinstance(value, dict):
+            return {k: redact(str(k), v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            # e.g. the sessions of a batch, each holding its own api_key
+            return [redact("", v) for v in value]
+        return value
+    if key.lower() in ("api_key", "api_keys") and isinstance(value, str) and len(value) > 8:
+        return f"...{value[-4:]}"
+    return "[redacted]"
+
+
+def render_field(key: str, value: Any, limit: int) -> Any:
+    value = redact(key, value)
+    if isinstance(value, (bool, int, float)) or value is None:
+        return value
+    if not isinstance(value, str):
+        try:
+            value = json.dumps(value, default=str, separators=(",", ":"))
+        except (TypeError, ValueError):
+            value = repr(value)
+    return _cap(value, limit)
+
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, fmt: str = "json", field_max: int = 512):
+        """
+        Render a record and its ``fields`` as one JSON object per line, or as
+        ``event key=value ...`` text
+        """
+        super().__init__()
+        self.fmt = fmt
+        self.field_max = field_max
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {k: render_field(k, v, self.field_max) for k, v in getattr(record, "fields", {}).items()}
+        if record.exc_info:
+            fields["exc"] = self.formatException(record.exc_info)
+        if self.fmt == "text":
+            rendered = " ".join(f"{k}={v}" for k, v in fields.items())
+            return f"{self.formatTime(record)} {record.levelname} {record.name} {record.getMessage()} {rendered}".rstrip()
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(fields)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue records without blocking; when the queue is full, drop and count them"""
+
+    def __init__(self, q: "queue.Queue"):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Rendering is left to the listener thread; only the message template is resolved here
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class StructuredLogger:
+    __slots__ = ("_logger",)
+
+    def __init__(self, logger: logging.Logger):
+        """Log an event name plus keyword fields; disabled levels cost one level check"""
+        self._logger = logger
+
+    def _log(self, level: int, event: str, fields: Dict[str, Any], exc_info: bool = False) -> None:
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+    def debug(self, event: str, sample: Optional[float] = None, **fields: Any) -> None:
+        """High-volume event; only a ``sample`` fraction (LOG_DEBUG_SAMPLE by default) is kept"""
+        if not self._logger.isEnabledFor(logging.DEBUG):
+            return
+        rate = _debug_sample() if sample is None else sample
+        if rate < 1.0 and random.random() >= rate:
+            return
+        fields["sample_rate"] = rate
+        self._logger.log(logging.DEBUG, event, extra={"fields": fields})
+
+    def info(self, event: str, **fields: Any) -> None:
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields: Any) -> None:
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event: str, **fields: Any) -> None:
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event: str, **fields: Any) -> None:
+        """Error with the active exception's traceback"""
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+
+_sample_rate: Optional[float] = None
+
+
+def _debug_sample() -> float:
+    global _sample_rate
+    if _sample_rate is None:
+        _sample_rate = float(os.getenv("LOG_DEBUG_SAMPLE", "0.01"))
+    return _sample_rate
+
+
+def configure_logging(force: bool = False) -> None:
+    """
+    Route the ``server`` loggers through a bounded queue to a listener thread writing
+    to stdout. Idempotent; ``force`` rebuilds the handler and listener in a freshly
+    forked worker, abandoning the master's (its thread does not exist after a fork).
+    """
+    global _listener, _handler, _sample_rate
+    with _lock:
+        if _listener is not None and not force:
+            return
+        _listener = None
+
+        root = logging.getLogger(ROOT)
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        root.propagate = False
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(StructuredFormatter(os.getenv("LOG_FORMAT", "json").lower(),
+                                                int(os.getenv("LOG_FIELD_MAX", "512"))))
+        _handler = DroppingQueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+        root.addHandler(_handler)
+        _listener = QueueListener(_handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        _sample_rate = None
+
+
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except Exception:
+            pass
+        _listener = None
+
+
+def shutdown_logging() -> None:
+    """Write out every queued record and stop the listener thread"""
+    with _lock:
+        _stop_listener()
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
+
+
+def get_logger(name: str) -> StructuredLogger:
+    configure_logging()
+    return StructuredLogger(logging.getLogger(name))
+
+
+atexit.register(shutdown_logging)
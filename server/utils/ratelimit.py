@@ -0,0 +1,278 @@
+"""
+Admission control: per-tenant token buckets, concurrency caps and load shedding
+
+Admission control is opt-in (RATE_LIMIT_ENABLED=1); with it unset every request is
+admitted. Every request is charged to a policy (e.g. ``query``) and a tenant identity
+(its verified API key, user or agent). It is admitted only if the tenant's bucket for that policy has a
+token, the tenant has fewer than the policy's cap of requests in flight, and, for
+policies that call the agent backends, those backends are not slow enough to shed.
+A request carrying an API key is first charged to its client address under
+``api_key_check``, so made-up keys cannot make it look up keys faster than that allows.
+
+    limiter = create_rate_limiter(dynamo)
+    decision = limiter.admit("query", "agent:support-bot")
+    if not decision.allowed:
+        ...  # 429 (or 503 when shed) with Retry-After: decision.retry_after
+    ...
+    limiter.release("query", "agent:support-bot")
+
+Buckets live in process memory by default; RATE_LIMIT_BACKEND=dynamodb keeps them in
+a DynamoDB table so all workers and hosts share one budget per tenant. Concurrency
+caps are always per process.
+
+Environment:
+    RATE_LIMIT_ENABLED        Set to 1 to enable limiting and shedding, default 0 (admit everything)
+    RATE_LIMIT_BACKEND        memory (default) or dynamodb
+    RATE_LIMIT_TABLE          Shared bucket table keyed by ``bucket_key`` (S), default rate_limits
+    RATE_LIMIT_<POLICY>       "rate,burst,concurrency" overriding a policy in DEFAULT_LIMITS,
+                              e.g. RATE_LIMIT_QUERY=5,20,8
+    SHED_LATENCY_MS           Backend moving-average latency above which requests are shed, default 5000
+    SHED_MAX_FRACTION         Most requests shed however slow the backends are, default 0.9
+    SHED_RETRY_AFTER          Retry-After seconds sent with a shed request, default 5
+"""
+import math
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from .logs import get_logger
+
+log = get_logger(__name__)
+
+
+class Limit(NamedTuple):
+    rate: float        # Tokens added per second
+    burst: float       # Bucket size
+    concurrency: int   # Requests in flight per tenant and process
+    backends: Tuple[str, ...] = ()  # Downstream backends whose latency can shed this policy
+
+
+DEFAULT_LIMITS = {
+    "query": Limit(5.0, 20.0, 8, ("ELIZA_QUERY", "TOOLS_QUERY")),
+    "create_session": Limit(1.0, 5.0, 2, ("ELIZA_CREATE", "TOOLS_SET")),
+    "create_sessions_batch": Limit(0.1, 2.0, 1, ("ELIZA_CREATE", "TOOLS_SET")),
+    "create_api_key": Limit(1.0, 5.0, 2),
+    "agent_info": Limit(10.0, 20.0, 4),
+    # Per client address, charged before an API key is looked up
+    "api_key_check": Limit(20.0, 50.0, 16),
+}
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    retry_after: float = 0.0
+    reason: str = "allowed"  # allowed, rate_limited, concurrency or shed
+
+
+def limits_from_env(defaults: Dict[str, Limit] = DEFAULT_LIMITS) -> Dict[str, Limit]:
+    limits = {}
+    for policy, limit in defaults.items():
+        override = os.getenv(f"RATE_LIMIT_{policy.upper()}")
+        if override:
+            rate, burst, concurrency = override.split(",")
+            limit = limit._replace(rate=float(rate), burst=float(burst), concurrency=int(concurrency))
+        limits[policy] = limit
+    return limits
+
+
+class MemoryBuckets:
+    def __init__(self, maxsize: int = 100000):
+        """
+        Token buckets in process memory, least recently used evicted beyond ``maxsize``
+        (an evicted tenant simply starts again with a full bucket)
+        """
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, updated]
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """
+        Take ``cost`` tokens from the bucket ``key``; a negative cost puts tokens back, up to ``burst``
+
+        Returns:
+            float: 0 if the tokens were taken, else seconds until enough will have refilled
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now]
+                if len(self._buckets) > self.maxsize:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] = min(burst, bucket[0] - cost)
+                return 0.0
+            return (cost - bucket[0]) / rate
+
+
+class DynamoBuckets:
+    def __init__(self, dynamo_client, table_name: str = None, attempts: int = 3):
+        """
+        Token buckets shared through a DynamoDB table, updated with optimistic
+        conditional writes (read, refill, write if unchanged since the read)
+
+        Args:
+            dynamo_client (DynamoDBClient): Client for the bucket table
+            table_name (str): Table keyed by ``bucket_key`` (S); ``expires_at`` can be its TTL attribute
+            attempts (int): Conditional writes tried before a contended take is refused
+        """
+        self.dynamo = dynamo_client
+        self.table_name = table_name or os.getenv("RATE_LIMIT_TABLE", "rate_limits")
+        self.attempts = attempts
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        primary_key = {"bucket_key": {"S": key}}
+        for _ in range(self.attempts):
+            now = time.time()
+            item = self.dynamo.get_item(self.table_name, primary_key, coalesce=False)
+            if item:
+                previous = item["updated_at"]["N"]
+                tokens = min(burst, float(item["tokens"]["N"]) + (now - float(previous)) * rate)
+            else:
+                previous, tokens = None, burst
+            if tokens < cost:
+                return (cost - tokens) / rate
+
+            new_item = dict(primary_key,
+                            tokens={"N": f"{min(burst, tokens - cost):.6f}"},
+                            updated_at={"N": f"{now:.6f}"},
+                            expires_at={"N": str(int(now + burst / rate) + 60)})
+            if previous is None:
+                condition, values = "attribute_not_exists(bucket_key)", None
+            else:
+                condition, values = "updated_at = :previous", {":previous": {"N": previous}}
+            try:
+                self.dynamo.add_item(self.table_name, new_item, condition=condition, values=values)
+                return 0.0
+            except ValueError:
+                continue  # Another request took from the bucket since our read
+        return cost / rate
+
+
+class ConcurrencyLimiter:
+    def __init__(self):
+        """Counts requests in flight per key and refuses those beyond a cap"""
+        self._in_flight: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, limit: int) -> bool:
+        with self._lock:
+            count = self._in_flight.get(key, 0)
+            if count >= limit:
+                return False
+            self._in_flight[key] = count + 1
+            return True
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            count = self._in_flight.get(key, 0) - 1
+            if count > 0:
+                self._in_flight[key] = count
+            else:
+                self._in_flight.pop(key, None)
+
+
+class LoadShedder:
+    def __init__(self, latency_threshold: float, max_fraction: float = 0.9, retry_after: float = 5.0):
+        """
+        Sheds a share of requests that ramps from 0 at ``latency_threshold`` seconds of
+        backend latency to ``max_fraction`` at twice that; never shedding everything
+        keeps some traffic probing the backend so recovery is noticed
+        """
+        self.latency_threshold = latency_threshold
+        self.max_fraction = max_fraction
+        self.retry_after = retry_after
+
+    def fraction(self, latency: Optional[float]) -> float:
+        if latency is None or latency <= self.latency_threshold:
+            return 0.0
+        return min(self.max_fraction, (latency - self.latency_threshold) / self.latency_threshold)
+
+    def should_shed(self, latency: Optional[float]) -> bool:
+        fraction = self.fraction(latency)
+        return fraction > 0 and random.random() < fraction
+
+
+class RateLimiter:
+    def __init__(self, buckets=None, limits: Optional[Dict[str, Limit]] = None,
+                 shedder: Optional[LoadShedder] = None,
+                 backend_latency: Optional[Callable[[Iterable[str]], Optional[float]]] = None):
+        """
+        Args:
+            buckets (MemoryBuckets | DynamoBuckets): Token bucket store
+            limits (Optional[Dict[str, Limit]]): Policy name -> limit; unknown policies are not limited
+            shedder (Optional[LoadShedder]): Shedding rule for policies with ``backends``
+            backend_latency (Callable): Highest current latency, in seconds, of the named
+                backends, or None when unknown
+        """
+        self.buckets = buckets or MemoryBuckets()
+        self.limits = limits if limits is not None else limits_from_env()
+        self.shedder = shedder
+        self.backend_latency = backend_latency
+        self.concurrency = ConcurrencyLimiter()
+
+    def admit(self, policy: str, identity: str) -> Decision:
+        """
+        Decide whether a request may run; an allowed request must be ``release``d when it ends
+        """
+        limit = self.limits.get(policy)
+        if limit is None:
+            return Decision(True)
+
+        if limit.backends and self.shedder is not None and self.backend_latency is not None:
+            if self.shedder.should_shed(self.backend_latency(limit.backends)):
+                return Decision(False, self.shedder.retry_after, "shed")
+
+        try:
+            wait = self.buckets.take(f"{policy}:{identity}", limit.rate, limit.burst)
+        except Exception as e:
+            # A shared store outage must not take the API down with it
+            log.warning("rate_limit_store_failed", policy=policy, error=str(e))
+            wait = 0.0
+        if wait > 0:
+            return Decision(False, wait, "rate_limited")
+
+        if not self.concurrency.acquire(f"{policy}:{identity}", limit.concurrency):
+            # Give the token back: a request refused here never ran
+            try:
+                self.buckets.take(f"{policy}:{identity}", limit.rate, limit.burst, cost=-1.0)
+            except Exception as e:
+                log.warning("rate_limit_store_failed", policy=policy, error=str(e))
+            return Decision(False, 1.0, "concurrency")
+        return Decision(True)
+
+    def release(self, policy: str, identity: str) -> None:
+        if policy in self.limits:
+            self.concurrency.release(f"{policy}:{identity}")
+
+
+def retry_after_header(seconds: float) -> str:
+    """Retry-After takes whole seconds; round up so a retry never arrives early"""
+    return str(max(1, math.ceil(seconds)))
+
+
+def create_rate_limiter(dynamo_client=None, backend_latency=None) -> Optional[RateLimiter]:
+    """
+    Build the limiter selected by RATE_LIMIT_BACKEND, or None unless RATE_LIMIT_ENABLED=1
+
+    Args:
+        dynamo_client (DynamoDBClient): Needed for the dynamodb backend
+        backend_latency (Callable): See ``RateLimiter``
+    """
+    if os.getenv("RATE_LIMIT_ENABLED", "0") != "1":
+        return None
+    if os.getenv("RATE_LIMIT_BACKEND", "memory").lower() == "dynamodb":
+        buckets = DynamoBuckets(dynamo_client)
+    else:
+        buckets = MemoryBuckets()
+    shedder = LoadShedder(float(os.getenv("SHED_LATENCY_MS", "5000")) / 1000,
+                          float(os.getenv("SHED_MAX_FRACTION", "0.9")),
+                          float(os.getenv("SHED_RETRY_AFTER", "5")))
+    return RateLimiter(buckets, limits_from_env(), shedder, backend_latency)
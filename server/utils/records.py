@@ -0,0 +1,175 @@
+"""
+Typed records for the DynamoDB items the server reads and writes
+
+Each record class declares its attributes once in ``FIELDS``; ``@record`` compiles a
+straight-line ``from_item`` / ``to_item`` pair for it, so converting an item is a few
+dict lookups with no per-attribute type dispatch. Records use ``__slots__`` and
+attribute names match the DynamoDB attribute names.
+
+    agent = AgentRecord.from_item(item)
+    agents = AgentRecord.from_items(page["Items"])
+    dynamo.add_item(table, agent.to_item())
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Attribute types: S (str), N (int), BOOL (bool), SL (list of str stored as an L of S)
+_DECODE = {
+    "S": "{v}['S']",
+    "N": "int({v}['N'])",
+    "BOOL": "{v}['BOOL']",
+    "SL": "[e.get('S', '') for e in {v}['L']]",
+}
+_ENCODE = {
+    "S": "{{'S': {v}}}",
+    "N": "{{'N': str({v})}}",
+    "BOOL": "{{'BOOL': {v}}}",
+    "SL": "{{'L': [{{'S': e}} for e in {v}]}}",
+}
+
+
+def record(cls):
+    """
+    Compile ``from_item``, ``to_item`` and bulk ``from_items`` / ``iter_items`` for a class
+    whose ``FIELDS`` is a tuple of (name, type, required)
+
+    Required attributes raise KeyError when missing from an item; optional ones (e.g. left
+    out by a projection) decode to None. ``to_item`` omits attributes that are None.
+    """
+    fields: Tuple[Tuple[str, str, bool], ...] = cls.FIELDS
+    names = [name for name, _, _ in fields]
+
+    decode = ["def from_item(cls, item):", "    self = _new(cls)"]
+    for name, kind, required in fields:
+        if required:
+            decode.append(f"    self.{name} = {_DECODE[kind].format(v=f'item[{name!r}]')}")
+        else:
+            decode.append(f"    v = item.get({name!r})")
+            decode.append(f"    self.{name} = None if v is None else {_DECODE[kind].format(v='v')}")
+    decode.append("    return self")
+
+    encode = ["def to_item(self):", "    item = {}"]
+    for name, kind, _ in fields:
+        encode.append(f"    v = self.{name}")
+        encode.append(f"    if v is not None: item[{name!r}] = {_ENCODE[kind].format(v='v')}")
+    encode.append("    return item")
+
+    init = [f"def __init__(self, {', '.join(f'{n}=None' for n in names)}):"]
+    init += [f"    self.{n} = {n}" for n in names] or ["    pass"]
+
+    namespace: Dict[str, Any] = {"_new": object.__new__}
+    exec("\n".join(decode + encode + init), namespace)
+    cls.from_item = classmethod(namespace["from_item"])
+    cls.to_item = namespace["to_item"]
+    cls.__init__ = namespace["__init__"]
+    return cls
+
+
+class Record:
+    __slots__ = ()
+    FIELDS: Tuple[Tuple[str, str, bool], ...] = ()
+
+    @classmethod
+    def from_item(cls, item: Dict[str, Any]) -> "Record":
+        raise NotImplementedError  # compiled by @record
+
+    def to_item(self) -> Dict[str, Any]:
+        raise NotImplementedError  # compiled by @record
+
+    @classmethod
+    def from_items(cls, items: Iterable[Dict[str, Any]]) -> List["Record"]:
+        """Convert a whole page of items"""
+        from_item = cls.from_item
+        return [from_item(item) for item in items]
+
+    @classmethod
+    def iter_items(cls, items: Iterable[Dict[str, Any]]) -> Iterator["Record"]:
+        """Convert items lazily, e.g. while streaming pages"""
+        from_item = cls.from_item
+        for item in items:
+            yield from_item(item)
+
+    @classmethod
+    def to_items(cls, records: Iterable["Record"]) -> List[Dict[str, Any]]:
+        return [r.to_item() for r in records]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name, _, _ in self.FIELDS}
+
+    def __eq__(self, other: Any) -> bool:
+        return type(other) is type(self) and self.as_dict() == other.as_dict()
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{k}={v!r}" for k, v in self.as_dict().items() if v is not None)
+        return f"{type(self).__name__}({fields})"
+
+
+@record
+class ApiKeyRecord(Record):
+    __slots__ = ("id", "user_id", "api_key", "date_created", "expiration_date", "is_active")
+    FIELDS = (
+        ("id", "N", False),
+        ("user_id", "N", False),
+        ("api_key", "S", False),
+        ("date_created", "S", False),
+        ("expiration_date", "S", False),
+        ("is_active", "BOOL", False),
+    )
+
+
+@record
+class AgentRecord(Record):
+    __slots__ = ("id", "user_id", "agent_main_name", "agent_list", "date_created", "is_active")
+    FIELDS = (
+        ("id", "N", True),
+        ("user_id", "N", False),
+        ("agent_main_name", "S", True),
+        ("agent_list", "S", False),
+        ("date_created", "S", False),
+        ("is_active", "BOOL", False),
+    )
+
+
+@record
+class AgentToolMapping(Record):
+    __slots__ = ("multi_agent_main_name", "agent_id", "tools_agent_id", "history")
+    FIELDS = (
+        ("multi_agent_main_name", "S", False),
+        ("agent_id", "S", False),
+        ("tools_agent_id", "S", False),
+        ("history", "SL", False),  # legacy inline history, superseded by HistoryTurn items
+    )
+
+
+@record
+class HistoryTurn(Record):
+    __slots__ = ("multi_agent_main_name", "seq", "turn", "expires_at")
+    FIELDS = (
+        ("multi_agent_main_name", "S", True),
+        ("seq", "N", True),
+        ("turn", "S", True),
+        ("expires_at", "N", False),
+    )
+
+
+@record
+class PromptSummary(Record):
+    __slots__ = ("multi_agent_main_name", "lines", "seen", "version")
+    FIELDS = (
+        ("multi_agent_main_name", "S", True),
+        ("lines", "S", True),  # JSON list of [turn digest, summary line], oldest first
+        ("seen", "SL", False),  # digests of turns already folded in
+        ("version", "N", True),  # bumped on every write, for conditional updates
+    )
+
+
+def decode_value(value: Dict[str, Any]) -> Optional[Any]:
+    """Plain Python value of a single attribute in DynamoDB format"""
+    if "S" in value:
+        return value["S"]
+    if "N" in value:
+        return int(value["N"])
+    if "BOOL" in value:
+        return value["BOOL"]
+    if "L" in value:
+        return [decode_value(v) for v in value["L"]]
+    return None
@@ -0,0 +1,67 @@
+import threading
+from typing import Any, Callable, Dict, Optional
+
+
+class Registry:
+    def __init__(self):
+        """
+        Lazily built, process-wide singletons
+
+        Each component is created by its factory on first use and shared by every caller in
+        the process. ``reset`` forgets all instances, e.g. in a worker forked from a master
+        that already built some.
+        """
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        with self._lock:
+            self._factories[name] = factory
+            self._instances.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._instances:
+                if name not in self._factories:
+                    raise KeyError(f"No component registered as {name!r}")
+                self._instances[name] = self._factories[name]()
+            return self._instances[name]
+
+    def peek(self, name: str) -> Optional[Any]:
+        """Return the instance if it has been built, without building it"""
+        return self._instances.get(name)
+
+    def set(self, name: str, instance: Any) -> None:
+        """Install a ready-made instance, e.g. a stand-in for tests or benchmarks"""
+        with self._lock:
+            self._instances[name] = instance
+
+    def reset(self) -> None:
+        with self._lock:
+            self._instances.clear()
+
+    def proxy(self, name: str) -> "LazyComponent":
+        return LazyComponent(self, name)
+
+
+class LazyComponent:
+    __slots__ = ("_registry", "_name")
+
+    def __init__(self, registry: Registry, name: str):
+        """Stand-in that builds the named component on first attribute access"""
+        self._registry = registry
+        self._name = name
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._registry.get(self._name), attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy component {self._name!r}>"
+
+
+components = Registry()
@@ -0,0 +1,28 @@
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Hashable, Optional
+
+
+_memo: ContextVar[Optional[dict]] = ContextVar("request_memo", default=None)
+
+
+def begin_request() -> Token:
+    """Open a fresh memo for the current request; pass the returned token to ``end_request``"""
+    return _memo.set({})
+
+
+def end_request(token: Token) -> None:
+    _memo.reset(token)
+
+
+def memoized(key: Hashable, loader: Callable[[], Any]) -> Any:
+    """
+    Return the value memoized for ``key`` in the current request, calling ``loader`` once
+
+    Outside a request scope the loader is simply called every time.
+    """
+    memo = _memo.get()
+    if memo is None:
+        return loader()
+    if key not in memo:
+        memo[key] = loader()
+    return memo[key]
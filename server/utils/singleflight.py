@@ -0,0 +1,81 @@
+"""
+Single-flight call coalescing
+
+Concurrent callers asking for the same key share one execution: the first caller
+runs the function, the others wait for it and get its result (or its exception).
+Nothing is cached; a call that starts after the shared one has finished runs again.
+
+    flight = SingleFlight("route")
+    route = flight.do(("agent_tool_id", name), lambda: load_route(name))
+
+Works under the gthread workers and under the gevent/eventlet workers: those
+monkey-patch ``threading`` before handling requests, and each waiter blocks on an
+Event created at call time, so it yields to other greenlets instead of blocking the
+worker.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from .tracing import metrics, span
+
+
+class _Call:
+    __slots__ = ("done", "value", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        """
+        Args:
+            name (str): Label for the ``singleflight`` wait spans and the shared-call counter
+        """
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any], clone: Optional[Callable[[Any], Any]] = None) -> Any:
+        """
+        Return ``fn()``, sharing one execution among concurrent callers with the same key
+
+        Args:
+            key (Hashable): Identifies calls that would return the same result
+            fn (Callable[[], Any]): The call to run
+            clone (Optional[Callable[[Any], Any]]): Applied to the result handed to waiting
+                callers, e.g. ``copy.deepcopy`` when callers may mutate it
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.followers += 1
+
+        if not leader:
+            with span("singleflight", self.name):
+                call.done.wait()
+            metrics.inc("agent_server_singleflight_shared_total", flight=self.name)
+            if call.error is not None:
+                raise call.error
+            return clone(call.value) if clone is not None else call.value
+
+        try:
+            call.value = fn()
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                # Forget the call before waking its followers, so later callers start afresh
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,79 @@
+from typing import Any, Dict, Iterator
+
+from .tracing import metrics, span
+
+# Operations that accept ReturnConsumedCapacity
+_CAPACITY_OPERATIONS = frozenset({
+    "get_item", "put_item", "update_item", "delete_item", "query", "scan",
+    "batch_get_item", "batch_write_item", "transact_get_items", "transact_write_items",
+})
+
+
+def _table(kwargs: Dict[str, Any]) -> str:
+    if "TableName" in kwargs:
+        return kwargs["TableName"]
+    tables = list(kwargs.get("RequestItems") or {})
+    if not tables and "TransactItems" in kwargs:
+        tables = sorted({next(iter(op.values())).get("TableName", "") for op in kwargs["TransactItems"]})
+    return tables[0] if len(tables) == 1 else "multi"
+
+
+def _record_capacity(operation: str, response: Dict[str, Any], s) -> None:
+    consumed = response.get("ConsumedCapacity")
+    if not consumed:
+        return
+    total = 0.0
+    for entry in consumed if isinstance(consumed, list) else [consumed]:
+        units = float(entry.get("CapacityUnits", 0.0))
+        total += units
+        metrics.inc("agent_server_dynamo_consumed_capacity_total", units,
+                    operation=operation, table=entry.get("TableName", ""))
+    s.set("consumed_capacity", total)
+
+
+class TracedDynamoClient:
+    def __init__(self, client: Any):
+        """
+        Wrap a low-level DynamoDB client so every call, and every page a paginator
+        fetches, is timed as a ``dynamo`` span labelled with its table and reports
+        the capacity it consumed
+        """
+        self._client = client
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._client, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+
+        def call(*args, **kwargs):
+            if name in _CAPACITY_OPERATIONS:
+                kwargs.setdefault("ReturnConsumedCapacity", "TOTAL")
+            with span("dynamo", name, table=_table(kwargs)) as s:
+                response = attr(*args, **kwargs)
+                if isinstance(response, dict):
+                    _record_capacity(name, response, s)
+                return response
+        return call
+
+    def get_paginator(self, operation: str) -> "_TracedPaginator":
+        return _TracedPaginator(self._client.get_paginator(operation), operation)
+
+
+class _TracedPaginator:
+    def __init__(self, paginator: Any, operation: str):
+        self._paginator = paginator
+        self._operation = operation
+
+    def paginate(self, **kwargs) -> Iterator[Dict[str, Any]]:
+        kwargs.setdefault("ReturnConsumedCapacity", "TOTAL")
+        pages = iter(self._paginator.paginate(**kwargs))
+        while True:
+            # Each page is its own request; the span covers fetching it, not the caller's work
+            with span("dynamo", self._operation, table=_table(kwargs)) as s:
+                try:
+                    page = next(pages)
+                except StopIteration:
+                    s.discard()
+                    return
+                _record_capacity(self._operation, page, s)
+            yield page
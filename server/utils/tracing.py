@@ -0,0 +1,183 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+# Seconds; spans range from sub-millisecond cache hits to multi-second backend calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Span:
+    __slots__ = ("kind", "operation", "labels", "start", "duration", "attributes", "discarded")
+
+    def __init__(self, kind: str, operation: str, labels: Dict[str, str]):
+        self.kind = kind
+        self.operation = operation
+        self.labels = labels
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.attributes: Dict[str, Any] = {}
+        self.discarded = False
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def discard(self) -> None:
+        """Drop this span instead of recording it, e.g. when the timed work turned out not to happen"""
+        self.discarded = True
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """
+        Process-wide histograms and counters, rendered in the Prometheus text format
+
+        Each worker process keeps its own; scrape every worker (or run one) for totals.
+        """
+        self.buckets = buckets
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, text: str) -> None:
+        self._help[name] = text
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    @staticmethod
+    def _labels(key: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = key + extra
+        if not pairs:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(h.buckets, h.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._labels(key, (('le', repr(bound)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{self._labels(key, (('le', '+Inf'),))} {h.count}")
+                    lines.append(f"{name}_sum{self._labels(key)} {h.total}")
+                    lines.append(f"{name}_count{self._labels(key)} {h.count}")
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{self._labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe("agent_server_span_seconds", "Duration of DynamoDB, HTTP, embedding and retrieval spans")
+metrics.describe("agent_server_request_seconds", "Duration of HTTP requests served, by endpoint and status")
+metrics.describe("agent_server_dynamo_consumed_capacity_total", "DynamoDB capacity units consumed")
+metrics.describe("agent_server_idempotency_total", "Requests carrying an idempotency key, by outcome")
+metrics.describe("agent_server_admission_total", "Admission decisions by policy and outcome")
+metrics.describe("agent_server_response_cache_total", "/query response cache lookups by outcome")
+metrics.describe("agent_server_singleflight_shared_total", "Calls answered by joining an identical call already in flight")
+metrics.describe("agent_server_prompt_tokens_total", "Estimated tokens of /query prompts by section")
+metrics.describe("agent_server_prompt_turns_dropped_total", "Retrieved turns left out of a prompt for lack of budget")
+metrics.describe("agent_server_archive_segments_total", "Memory archive segments sealed and loaded")
+metrics.describe("agent_server_background_dropped_total", "Background tasks dropped because their queue was full")
+
+_trace: ContextVar[Optional[List[Span]]] = ContextVar("trace", default=None)
+
+
+def begin_trace() -> Token:
+    """Start collecting spans for the current request; pass the returned token to ``end_trace``"""
+    return _trace.set([])
+
+
+def end_trace(token: Token) -> None:
+    _trace.reset(token)
+
+
+def current_spans() -> List[Span]:
+    return list(_trace.get() or ())
+
+
+@contextmanager
+def span(kind: str, operation: str, **labels: str) -> Iterator[Span]:
+    """
+    Time a block as one span
+
+    The duration is recorded in the ``agent_server_span_seconds`` histogram under
+    ``kind``, ``operation`` and ``labels`` and, inside a traced request, added to the
+    request's spans for its Server-Timing header.
+    """
+    s = Span(kind, operation, labels)
+    try:
+        yield s
+    except BaseException:
+        s.set("error", True)
+        raise
+    finally:
+        s.duration = time.perf_counter() - s.start
+        if not s.discarded:
+            metrics.observe("agent_server_span_seconds", s.duration, kind=kind, operation=operation, **labels)
+            trace = _trace.get()
+            if trace is not None:
+                trace.append(s)
+
+
+def server_timing(spans: List[Span]) -> str:
+    """
+    Server-Timing header value summing spans per kind and operation,
+    e.g. ``dynamo-query;dur=3.1;desc="x2"``
+    """
+    totals: Dict[str, List[float]] = {}
+    for s in spans:
+        entry = totals.setdefault(f"{s.kind}-{s.operation}", [0.0, 0])
+        entry[0] += s.duration
+        entry[1] += 1
+    return ", ".join(f'{name};dur={total * 1000:.1f};desc="x{count}"' for name, (total, count) in totals.items())
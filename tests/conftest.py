@@ -0,0 +1,61 @@
+import os
+import tempfile
+
+# Settings are read when the server modules are imported, so these come first
+os.environ.update({
+    "STORAGE_BACKEND": "memory",
+    "EMBEDDING_BACKEND": "local",
+    "EMBEDDING_CACHE_PATH": "",
+    "VECTOR_INDEX_DIR": tempfile.mkdtemp(prefix="tests-index-"),
+    "API_TABLE": "api_keys",
+    "AGENT_TABLE": "agents",
+    "RATE_LIMIT_ENABLED": "0",
+})
+
+import pytest
+
+from benchmarks.stub_backends import StubBackends
+from server.utils.db_utils import DynamoDBClient
+from server.utils.local_dynamo import InMemoryDynamoDB
+from server.utils.registry import components
+
+
+@pytest.fixture(scope="session")
+def stubs():
+    """Stub Eliza and tools backends, shared by every test; see ``backends`` to change replies"""
+    backends = StubBackends().start()
+    os.environ.update(backends.env())
+    yield backends
+    backends.stop()
+
+
+@pytest.fixture
+def backends(stubs):
+    """The stubs, restored to their default replies after the test"""
+    eliza, tools = stubs.eliza.respond, stubs.tools.respond
+    yield stubs
+    stubs.eliza.respond, stubs.tools.respond = eliza, tools
+
+
+@pytest.fixture
+def dynamo():
+    """An empty in-memory store installed as the app's client; every component is rebuilt afterwards"""
+    client = DynamoDBClient(client=InMemoryDynamoDB())
+    components.set("dynamo", client)
+    yield client
+    components.reset()
+
+
+@pytest.fixture
+def client(backends, dynamo):
+    from server.core.session_app import app
+
+    app.testing = True
+    return app.test_client()
+
+
+@pytest.fixture
+def api_key(client):
+    response = client.post("/create_api_key", json={"user_id": 7})
+    assert response.status_code == 201
+    return response.get_json()["api_key"]
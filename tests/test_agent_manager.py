@@ -0,0 +1,206 @@
+import json
+
+from server.core.response_cache import ResponseCache
+from server.core.session_app import app, _tenant
+from server.utils.ratelimit import Limit, MemoryBuckets, RateLimiter
+from server.utils.registry import components
+
+
+def _session(api_key, name, character_file="{}"):
+    return {"api_key": api_key, "character_file": character_file, "multi_agent_main_name": name,
+            "multiple_agents_name": ["helper"]}
+
+
+def _agent_names(dynamo):
+    return sorted(item["agent_main_name"]["S"] for item in dynamo.scan_table("agents").get("Items", []))
+
+
+def _failing(path, body):
+    return 500, {"error": "backend down"}
+
+
+def test_create_session_retry_is_replayed(client, dynamo, backends, api_key):
+    created = []
+    respond = backends.eliza.respond
+
+    def counting(path, body):
+        created.append(path)
+        return respond(path, body)
+    backends.eliza.respond = counting
+
+    headers = {"Idempotency-Key": "create-1"}
+    first = client.post("/create_session", json=_session(api_key, "support"), headers=headers)
+    retry = client.post("/create_session", json=_session(api_key, "support"), headers=headers)
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.headers.get("Idempotent-Replayed") == "true"
+    assert retry.get_json() == first.get_json()
+    assert len(created) == 1
+    assert _agent_names(dynamo) == ["support"]
+
+
+def test_create_session_key_reused_with_other_body_is_rejected(client, api_key):
+    headers = {"Idempotency-Key": "create-2"}
+    assert client.post("/create_session", json=_session(api_key, "one"), headers=headers).status_code == 201
+    assert client.post("/create_session", json=_session(api_key, "two"), headers=headers).status_code == 422
+
+
+def test_create_session_failure_is_not_replayed(client, dynamo, backends, api_key):
+    headers = {"Idempotency-Key": "create-3"}
+    eliza, tools = backends.eliza.respond, backends.tools.respond
+    backends.eliza.respond = backends.tools.respond = _failing
+    failed = client.post("/create_session", json=_session(api_key, "sales"), headers=headers)
+    assert failed.status_code == 400
+    assert _agent_names(dynamo) == []
+
+    # Nothing was created, so the retry runs instead of replaying the failure
+    backends.eliza.respond, backends.tools.respond = eliza, tools
+    retry = client.post("/create_session", json=_session(api_key, "sales"), headers=headers)
+    assert retry.status_code == 201
+    assert "Idempotent-Replayed" not in retry.headers
+    assert _agent_names(dynamo) == ["sales"]
+
+
+def test_batch_create_reports_each_session(client, dynamo, backends, api_key):
+    respond = backends.eliza.respond
+    backends.eliza.respond = lambda path, body: (
+        _failing(path, body) if body.get("characterJson") == "broken" else respond(path, body))
+    client.post("/create_session", json=_session(api_key, "existing"))
+
+    response = client.post("/create_sessions:batch", json={"api_key": api_key, "sessions": [
+        _session(api_key, "alpha"),
+        _session(api_key, "beta", character_file="broken"),
+        _session(api_key, "alpha"),
+        _session(api_key, "existing"),
+        {"multi_agent_main_name": "no-character"},
+    ]})
+
+    assert response.status_code == 207
+    body = response.get_json()
+    statuses = [(r["multi_agent_name"], r["status"]) for r in body["results"]]
+    assert statuses == [("alpha", "created"), ("beta", "failed"), ("alpha", "duplicate"),
+                        ("existing", "exists"), ("no-character", "invalid")]
+    assert body["counts"] == {"created": 1, "failed": 1, "duplicate": 1, "exists": 1, "invalid": 1}
+    assert _agent_names(dynamo) == ["alpha", "existing"]
+
+
+def test_batch_create_looks_up_the_api_key_once(client, dynamo, backends, api_key):
+    lookups, lookup = [], dynamo.get_api_key_item
+    dynamo.get_api_key_item = lambda table, key: lookups.append(key) or lookup(table, key)
+
+    response = client.post("/create_sessions:batch", json={"api_key": api_key, "sessions": [
+        _session(api_key, "alpha")]})
+
+    assert response.status_code == 201
+    assert lookups == [api_key]
+    assert dynamo.scan_table("agents")["Items"][0]["user_id"] == {"N": "7"}
+
+
+def test_batch_create_keeps_saved_agent_when_mapping_write_fails(client, dynamo, api_key):
+    write = dynamo.batch_write_items
+
+    def drop_mapping_of_beta(table_name, items):
+        dropped = [i for i in items if table_name == "agent_tool_id"
+                   and i["multi_agent_main_name"]["S"] == "beta"]
+        return write(table_name, [i for i in items if i not in dropped]) + dropped
+    dynamo.batch_write_items = drop_mapping_of_beta
+
+    response = client.post("/create_sessions:batch", json={"api_key": api_key, "sessions": [
+        _session(api_key, "alpha"), _session(api_key, "beta")]})
+
+    results = {r["multi_agent_name"]: r for r in response.get_json()["results"]}
+    assert results["alpha"]["status"] == "created"
+    # The row exists, so a retry must not be invited to create it again
+    assert results["beta"]["status"] == "partial"
+    assert "id" in results["beta"]
+    assert _agent_names(dynamo) == ["alpha", "beta"]
+
+
+def test_create_session_clears_cached_responses(client, api_key):
+    cache = ResponseCache(lambda text: [1.0, 0.0], similarity=0)
+    components.set("response_cache", cache)
+    cache.put(("support", "tools-key"), "What is my order status?", {"answer": "shipped"})
+    assert cache.get(("support", "tools-key"), "what is my order status")[0] == {"answer": "shipped"}
+
+    assert client.post("/create_session", json=_session(api_key, "support")).status_code == 201
+
+    assert cache.get(("support", "tools-key"), "What is my order status?")[0] is None
+
+
+def test_batch_create_clears_cached_responses(client, api_key):
+    cache = ResponseCache(lambda text: [1.0, 0.0], similarity=0)
+    components.set("response_cache", cache)
+    cache.put(("alpha", None), "hello", {"answer": "old"})
+    cache.put(("other", None), "hello", {"answer": "kept"})
+
+    client.post("/create_sessions:batch", json={"api_key": api_key, "sessions": [_session(api_key, "alpha")]})
+
+    assert cache.get(("alpha", None), "hello")[0] is None
+    assert cache.get(("other", None), "hello")[0] == {"answer": "kept"}
+
+
+def test_rate_limit_is_per_verified_api_key(client, api_key):
+    components.set("rate_limiter", RateLimiter(MemoryBuckets(), {"agent_info": Limit(0.001, 2.0, 4)}))
+
+    statuses = [client.post("/agent_info", json={"api_key": api_key, "user_id": 7}).status_code
+                for _ in range(3)]
+    assert statuses == [404, 404, 429]
+    limited = client.post("/agent_info", json={"api_key": api_key, "user_id": 7})
+    assert int(limited.headers["Retry-After"]) >= 1
+    assert limited.get_json()["reason"] == "rate_limited"
+
+
+def test_rate_limit_ignores_unverified_api_keys(client, api_key):
+    components.set("rate_limiter", RateLimiter(MemoryBuckets(), {"agent_info": Limit(0.001, 2.0, 4)}))
+
+    # Made-up keys share the client's bucket instead of getting fresh ones
+    forged = [client.post("/agent_info", json={"api_key": f"made-up-{i}", "user_id": 7}).status_code
+              for i in range(3)]
+    assert forged == [403, 403, 429]
+    # ...and do not spend the real key's budget
+    assert client.post("/agent_info", json={"api_key": api_key, "user_id": 7}).status_code == 404
+
+
+def test_made_up_keys_are_charged_to_the_address_before_lookup(client, api_key, dynamo):
+    components.set("rate_limiter", RateLimiter(MemoryBuckets(), {"api_key_check": Limit(0.001, 2.0, 4)}))
+    lookups, lookup = [], dynamo.get_api_key_item
+    dynamo.get_api_key_item = lambda table, key: lookups.append(key) or lookup(table, key)
+
+    statuses = [client.post("/agent_info", json={"api_key": f"guessed-{i}", "user_id": 7}).status_code
+                for i in range(4)]
+    assert statuses == [403, 403, 429, 429]
+    assert lookups == ["guessed-0", "guessed-1"]
+
+
+def test_queries_are_charged_to_their_agent(dynamo):
+    with app.test_request_context("/query", environ_base={"REMOTE_ADDR": "10.0.0.1"}):
+        assert _tenant("query", {"agent_name": "support", "api_key": "anything"}) == "agent:support"
+        assert _tenant("query", {"api_key": "anything"}) == "ip:10.0.0.1"
+        assert _tenant("create_session", {"api_key": "made-up", "user_id": 7}) == "ip:10.0.0.1"
+        assert _tenant("create_api_key", {"user_id": 7}) == "user:7"
+
+
+def test_agent_info_rejects_non_positive_limit(client, api_key):
+    for limit in (0, -1, "many"):
+        response = client.post("/agent_info", json={"api_key": api_key, "user_id": 7, "limit": limit})
+        assert response.status_code == 400
+
+
+def test_agent_info_pages_through_agents(client, api_key):
+    for name in ("a", "b", "c"):
+        client.post("/create_session", json=_session(api_key, name))
+
+    names, cursor = [], None
+    while True:
+        body = client.post("/agent_info", json={"api_key": api_key, "user_id": 7, "limit": 2,
+                                                "cursor": cursor}).get_json()["data"]
+        names += body["agents"].values()
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert sorted(names) == ["a", "b", "c"]
+
+    streamed = client.post("/agent_info", json={"api_key": api_key, "user_id": 7, "stream": True})
+    lines = [json.loads(line) for line in streamed.get_data(as_text=True).splitlines()]
+    assert sorted(line["agent_main_name"] for line in lines[:-1]) == ["a", "b", "c"]
+    assert lines[-1] == {"next_cursor": None}
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from server.core.archive import (LocalObjectStore, MemoryArchive, MemoryObjectStore, create_archive,
+                                 decode_segment, encode_segment)
+
+
+def _archive(store=None, **kwargs):
+    kwargs.setdefault("hot_turns", 4)
+    return MemoryArchive(store or MemoryObjectStore(), **kwargs)
+
+
+def _axis(i, dim=4):
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[i] = 1.0
+    return vector
+
+
+def test_segments_round_trip_at_half_precision():
+    unit = np.array([[0.6, 0.8], [1.0, 0.0]], dtype=np.float32)
+    texts, decoded = decode_segment(encode_segment(["a", "b"], unit))
+    assert texts == ["a", "b"]
+    np.testing.assert_allclose(decoded, unit, atol=1e-3)
+
+
+def test_search_returns_the_closest_archived_turns():
+    archive = _archive()
+    archive.seal("support", ["refund", "shipping"], np.stack([_axis(0), _axis(1)]))
+    archive.seal("support", ["password", "login"], np.stack([_axis(2), _axis(3)]))
+
+    hits = archive.search("support", _axis(2) + 0.1 * _axis(3), k=2)
+    assert [text for _, text in hits] == ["password", "login"]
+    assert hits[0][0] > hits[1][0]
+    assert archive.search("other", _axis(2), k=2) == []
+
+
+def test_only_the_nearest_segments_are_opened():
+    store = MemoryObjectStore()
+    archive = _archive(store, probe_segments=1)
+    archive.seal("support", ["refund"], np.stack([_axis(0)]))
+    archive.seal("support", ["password"], np.stack([_axis(2)]))
+    opened, get = [], store.get
+    store.get = lambda key: opened.append(key) or get(key)
+
+    assert [text for _, text in archive.search("support", _axis(2), k=5)] == ["password"]
+    assert len(opened) == 1 and opened[0].endswith(".seg")
+
+
+def test_sealing_the_same_turns_twice_writes_one_segment():
+    store = MemoryObjectStore()
+    first = _archive(store).seal("support", ["a", "b"], np.stack([_axis(0), _axis(1)]))
+    second = _archive(store).seal("support", ["a", "b"], np.stack([_axis(0), _axis(1)]))
+    assert first == second
+    assert len(store.list(MemoryArchive._prefix("support"))) == 2  # One .seg and one .meta
+
+
+def test_segments_sealed_by_another_worker_are_found(tmp_path):
+    _archive(LocalObjectStore(str(tmp_path))).seal("support", ["refund"], np.stack([_axis(0)]))
+
+    reader = _archive(LocalObjectStore(str(tmp_path)), refresh=0)
+    assert reader.search("support", _axis(0), k=1)[0][1] == "refund"
+
+
+def test_unreadable_segments_are_skipped():
+    store = MemoryObjectStore()
+    archive = _archive(store)
+    segment_id = archive.seal("support", ["refund"], np.stack([_axis(0)]))
+    archive.seal("support", ["shipping"], np.stack([_axis(1)]))
+    store.put(MemoryArchive._prefix("support") + segment_id + ".seg", b"not zlib")
+
+    assert [text for _, text in _archive(store, refresh=0).search("support", _axis(0), k=2)] == ["shipping"]
+
+
+def test_archive_is_opt_in(monkeypatch):
+    monkeypatch.delenv("ARCHIVE_BACKEND", raising=False)
+    assert create_archive(hot_turns=20) is None
+    monkeypatch.setenv("ARCHIVE_BACKEND", "memory")
+    assert create_archive(hot_turns=20).hot_turns == 20
+    monkeypatch.setenv("ARCHIVE_BACKEND", "s3")
+    with pytest.raises(ValueError):
+        create_archive(hot_turns=20)
+
+
+def test_turns_leaving_the_hot_tier_stay_retrievable(dynamo):
+    from server.core.memory import remember, retrieve_turns
+    from server.utils.registry import components
+
+    archive = _archive(hot_turns=2, segment_turns=2)
+    components.set("archive", archive)
+    turns = ["User: where is my refund\nAI: issued today", "User: reset my password\nAI: link sent",
+             "User: shipping to Oslo\nAI: three days", "User: change my email\nAI: done"]
+    for turn in turns:
+        remember("archive-agent", turn)
+
+    index = components.get("vector_indexes").get("archive-agent")
+    assert index.texts == turns[2:]
+    assert turns[0] in retrieve_turns("where is my refund", turns[2:], "archive-agent")
@@ -0,0 +1,31 @@
+import base64
+import json
+
+import pytest
+
+from server.utils.cursor import decode_cursor, encode_cursor
+
+
+def test_round_trip():
+    key = {"id": {"N": "42"}, "user_id": {"N": "7"}}
+    token = encode_cursor(key)
+    assert "=" not in token and "/" not in token and "+" not in token
+    assert decode_cursor(token) == key
+
+
+def test_nothing_left_is_no_cursor():
+    assert encode_cursor(None) is None and encode_cursor({}) is None
+    assert decode_cursor(None) is None and decode_cursor("") is None
+
+
+@pytest.mark.parametrize("token", [
+    "not base64 at all!",
+    "é",
+    12,
+    base64.urlsafe_b64encode(b"[1, 2]").decode(),
+    base64.urlsafe_b64encode(json.dumps({"id": "42"}).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps({"id": {"N": "1", "S": "x"}}).encode()).decode(),
+])
+def test_malformed_tokens_are_rejected(token):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(token)
@@ -0,0 +1,100 @@
+import time
+
+import pytest
+import requests
+
+from server.utils.downstream import CircuitBreaker, CircuitOpenError, DownstreamClient
+
+
+class _Reply:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def _client(replies, threshold=2, reset=0.05):
+    """A client whose TOOLS_QUERY session returns (or raises) ``replies`` in order"""
+    client = DownstreamClient(backoff_base=0.001, backoff_cap=0.001)
+    backend = client.backends["TOOLS_QUERY"]
+    backend.breaker = CircuitBreaker(failure_threshold=threshold, reset_timeout=reset)
+    calls = []
+
+    def post(url, **kwargs):
+        calls.append(kwargs["timeout"])
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return _Reply(reply)
+    backend.session.post = post
+    return client, backend, calls
+
+
+def test_breaker_opens_after_consecutive_failures():
+    client, backend, calls = _client([500, 500, 200])
+    for _ in range(2):
+        assert client.post("TOOLS_QUERY", "http://tools/query").status_code == 500
+    with pytest.raises(CircuitOpenError):
+        client.post("TOOLS_QUERY", "http://tools/query")
+    assert len(calls) == 2
+    assert backend.breaker.stats() == {"state": "open", "consecutive_failures": 2, "trips": 1}
+
+
+def test_half_open_lets_one_trial_through_and_closes_on_success():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()  # One trial at a time
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+@pytest.mark.parametrize("error", [requests.exceptions.ChunkedEncodingError("cut off"),
+                                   requests.exceptions.ContentDecodingError("bad gzip"),
+                                   RuntimeError("bug")])
+def test_failed_trial_reopens_the_breaker(error):
+    client, backend, _ = _client([500, error, 200], threshold=1)
+    client.post("TOOLS_QUERY", "http://tools/query")
+    time.sleep(0.06)
+
+    with pytest.raises(type(error)):
+        client.post("TOOLS_QUERY", "http://tools/query")
+    assert backend.breaker.state == "open"
+    # The trial was settled, so the next one is let through once the timeout passes again
+    time.sleep(0.06)
+    assert client.post("TOOLS_QUERY", "http://tools/query").status_code == 200
+    assert backend.breaker.state == "closed"
+
+
+def test_unexpected_errors_count_as_failures_when_closed():
+    client, backend, _ = _client([requests.exceptions.ChunkedEncodingError("cut off")], threshold=5)
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        client.post("TOOLS_QUERY", "http://tools/query")
+    assert backend.breaker.failures == 1
+    assert client.stats()["TOOLS_QUERY"]["failures"] == 1
+
+
+def test_connect_failures_are_retried():
+    client, backend, calls = _client([requests.ConnectTimeout("no route"), 200], threshold=5)
+    assert client.post("TOOLS_QUERY", "http://tools/query").status_code == 200
+    assert len(calls) == 2 and backend.retried == 1
+
+
+@pytest.mark.parametrize("reply", [requests.ReadTimeout("slow"), 503])
+def test_message_posts_are_not_retried_once_sent(reply):
+    client, backend, calls = _client([reply, 200], threshold=5)
+    if isinstance(reply, Exception):
+        with pytest.raises(requests.ReadTimeout):
+            client.post("TOOLS_QUERY", "http://tools/query")
+    else:
+        assert client.post("TOOLS_QUERY", "http://tools/query").status_code == 503
+    assert len(calls) == 1
+
+
+def test_attempts_stop_at_the_deadline():
+    client, backend, calls = _client([requests.ConnectTimeout("no route")] * 3, threshold=5)
+    backend.retries = 2
+    with pytest.raises(requests.ConnectTimeout):
+        client.post("TOOLS_QUERY", "http://tools/query", deadline=time.monotonic() + 0.5)
+    # Every attempt's timeout is cut to what is left of the deadline
+    assert all(connect <= 0.5 and read <= 0.5 for connect, read in calls)
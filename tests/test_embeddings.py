@@ -0,0 +1,67 @@
+import sqlite3
+
+from server.core.embeddings import CachedEmbeddings, HashEmbeddings
+
+
+class _Locked:
+    """A connection whose every statement fails the way a busy shared file does"""
+
+    def execute(self, *args):
+        raise sqlite3.OperationalError("database is locked")
+
+    executemany = execute
+
+    def rollback(self):
+        pass
+
+
+def test_misses_are_embedded_in_one_batch_and_hit_afterwards():
+    model = HashEmbeddings(dim=16)
+    cache = CachedEmbeddings(model)
+    first = cache.embed_documents(["a", "b", "a"])
+    assert model.calls == 1 and first[0] == first[2]
+    assert cache.embed_documents(["b", "a"]) == [first[1], first[0]]
+    assert model.calls == 1 and cache.stats["memory_hits"] == 2
+
+
+def test_disk_tier_is_shared_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    vector = CachedEmbeddings(HashEmbeddings(dim=16), path=path).embed_query("hello")
+
+    model = HashEmbeddings(dim=16)
+    cache = CachedEmbeddings(model, path=path)
+    assert cache.embed_query("hello") == vector
+    assert model.calls == 0 and cache.stats["disk_hits"] == 1
+
+
+def test_disk_errors_fall_back_to_the_model(tmp_path):
+    model = HashEmbeddings(dim=16)
+    cache = CachedEmbeddings(model, path=str(tmp_path / "cache.sqlite3"))
+    cache._db = _Locked()
+
+    vectors = cache.embed_documents(["a", "b"])
+    assert vectors == model.embed_documents(["a", "b"])
+    assert cache.stats["disk_errors"] == 2  # The read and the write
+    # The memory tier still works
+    assert cache.embed_query("a") == vectors[0] and cache.stats["memory_hits"] == 1
+
+
+def test_unopenable_file_keeps_the_cache_in_memory(tmp_path):
+    cache = CachedEmbeddings(HashEmbeddings(dim=16), path=str(tmp_path))  # A directory, not a file
+    assert cache._db is None
+    assert len(cache.embed_query("hello")) == 16
+
+
+def test_oldest_rows_are_pruned_past_the_cap(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = CachedEmbeddings(HashEmbeddings(dim=16), path=path, max_rows=3)
+    for text in ["one", "two", "three", "four", "five"]:
+        cache.embed_query(text)
+
+    model = HashEmbeddings(dim=16)
+    reopened = CachedEmbeddings(model, path=path, max_rows=3)
+    assert reopened._rows == 3
+    reopened.embed_documents(["three", "four", "five"])
+    assert model.calls == 0
+    reopened.embed_documents(["one"])
+    assert model.calls == 1
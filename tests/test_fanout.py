@@ -0,0 +1,56 @@
+import threading
+import time
+
+from server.utils.fanout import as_completed, bounded, fan_out, submit
+
+
+def _after(seconds, value=None, error=None):
+    def call():
+        time.sleep(seconds)
+        if error is not None:
+            raise error
+        return value
+    return call
+
+
+def test_calls_run_concurrently():
+    started = time.monotonic()
+    results = fan_out({"a": _after(0.2, 1), "b": _after(0.2, 2)})
+    assert time.monotonic() - started < 0.35
+    assert {name: r.value for name, r in results.items()} == {"a": 1, "b": 2}
+
+
+def test_slow_and_failing_calls_do_not_hold_up_the_rest():
+    started = time.monotonic()
+    results = fan_out({"fast": _after(0, "ok"), "slow": _after(1.0), "broken": _after(0, error=ValueError("no"))},
+                      timeouts={"slow": 0.1})
+    assert time.monotonic() - started < 0.5
+    assert results["fast"].ok and results["fast"].value == "ok"
+    assert results["slow"].timed_out and not results["slow"].ok
+    assert isinstance(results["broken"].error, ValueError)
+
+
+def test_results_are_yielded_in_completion_order():
+    names = [r.name for r in as_completed({"slow": _after(0.2), "fast": _after(0)})]
+    assert names == ["fast", "slow"]
+
+
+def test_bounded_keeps_at_most_limit_in_flight():
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def call():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return True
+
+    results = list(bounded({i: call for i in range(10)}, limit=3))
+    assert len(results) == 10 and all(r.ok for r in results)
+    assert peak[0] <= 3
+
+
+def test_submit_runs_in_the_background():
+    assert submit(lambda x: x * 2, 21).result(timeout=1) == 42
@@ -0,0 +1,91 @@
+from server.core.history import HistoryStore
+from server.utils.records import AgentToolMapping
+
+
+def _store(dynamo, **kwargs):
+    store = HistoryStore(dynamo, window=3, **kwargs)
+    store.writer.backoff_base = store.writer.backoff_cap = 0.001
+    return store
+
+
+def _stored(dynamo, agent_name):
+    items = dynamo.query_partition("agent_history", "multi_agent_main_name", {"S": agent_name}, limit=100)
+    return [item["turn"]["S"] for item in items]
+
+
+def test_recent_returns_the_window_oldest_first(dynamo):
+    store = _store(dynamo)
+    for i in range(5):
+        store.append("support", f"turn {i}")
+    assert store.writer.flush()
+    assert store.recent("support") == ["turn 2", "turn 3", "turn 4"]
+    assert sorted(_stored(dynamo, "support")) == [f"turn {i}" for i in range(5)]
+
+
+def test_queued_turns_are_read_back_before_they_are_written(dynamo):
+    store = _store(dynamo)
+    store.writer.linger = 0.5  # Hold the batch open
+    store.append("support", "just said")
+    assert store.recent("support") == ["just said"]
+    assert store.writer.flush()
+
+
+def test_unprocessed_items_are_written_on_retry(dynamo):
+    store = _store(dynamo)
+    write, attempts = dynamo.batch_write_items, []
+
+    def throttled_once(table_name, items):
+        attempts.append(len(items))
+        if len(attempts) == 1:
+            return write(table_name, items[:1]) + items[1:]
+        return write(table_name, items)
+    dynamo.batch_write_items = throttled_once
+
+    store.writer.linger = 0.2
+    for i in range(3):
+        store.append("support", f"turn {i}")
+    assert store.writer.flush()
+
+    assert attempts == [3, 2]
+    assert sorted(_stored(dynamo, "support")) == ["turn 0", "turn 1", "turn 2"]
+    assert store.writer.written == 3 and store.writer.failed == 0
+    assert store._pending == {}
+
+
+def test_failed_batches_are_retried(dynamo):
+    store = _store(dynamo)
+    write, calls = dynamo.batch_write_items, []
+
+    def down_once(table_name, items):
+        calls.append(items)
+        if len(calls) == 1:
+            raise Exception("ProvisionedThroughputExceededException")
+        return write(table_name, items)
+    dynamo.batch_write_items = down_once
+
+    store.append("support", "hello")
+    assert store.writer.flush()
+    assert _stored(dynamo, "support") == ["hello"]
+
+
+def test_turns_that_cannot_be_written_stay_readable(dynamo):
+    store = _store(dynamo)
+    store.writer.max_attempts = 2
+    dynamo.batch_write_items = lambda table_name, items: list(items)
+
+    store.append("support", "kept in memory")
+    assert store.writer.flush()
+
+    assert store.writer.failed == 1 and store.writer.written == 0
+    assert store.recent("support") == ["kept in memory"]
+
+
+def test_legacy_history_is_imported_once(dynamo):
+    dynamo.add_item("agent_tool_id", AgentToolMapping(multi_agent_main_name="old", history=["a", "b"]).to_item(),
+                    condition=None)
+    store = _store(dynamo)
+    assert store.recent("old") == ["a", "b"]
+    assert store.writer.flush()
+    store.append("old", "c")
+    assert store.writer.flush()
+    assert store.recent("old") == ["a", "b", "c"]
@@ -0,0 +1,51 @@
+import threading
+
+from server.utils.id_allocator import IdAllocator
+
+
+def test_ids_are_increasing_and_reserved_in_blocks(dynamo):
+    calls = []
+    increment = dynamo.increment_counter
+
+    def counting(*args, **kwargs):
+        calls.append(args)
+        return increment(*args, **kwargs)
+    dynamo.increment_counter = counting
+
+    allocator = IdAllocator(dynamo, block_size=5)
+    ids = [allocator.allocate("agents") for _ in range(12)]
+
+    assert ids == list(range(1, 13))
+    assert len(calls) == 3
+
+
+def test_reserve_returns_the_requested_count(dynamo):
+    allocator = IdAllocator(dynamo, block_size=4)
+    first = allocator.reserve("agents", 3)
+    more = allocator.reserve("agents", 10)
+
+    assert len(first) == 3 and len(more) == 10
+    assert len(set(first + more)) == 13
+
+
+def test_ids_are_unique_across_threads_and_allocators(dynamo):
+    allocators = [IdAllocator(dynamo, block_size=7), IdAllocator(dynamo, block_size=3)]
+    ids, lock = [], threading.Lock()
+
+    def work(allocator):
+        taken = [allocator.allocate("agents") for _ in range(100)]
+        with lock:
+            ids.extend(taken)
+
+    threads = [threading.Thread(target=work, args=(allocators[i % 2],)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(ids) == len(set(ids)) == 800
+
+
+def test_new_counter_starts_after_existing_ids(dynamo):
+    dynamo.add_item("agents", {"id": {"N": "41"}, "agent_main_name": {"S": "legacy"}})
+    assert IdAllocator(dynamo).allocate("agents") == 42
@@ -0,0 +1,49 @@
+import json
+import logging
+import queue
+
+from server.utils.logs import DroppingQueueHandler, StructuredFormatter, redact, render_field
+
+
+def _record(event, **fields):
+    record = logging.LogRecord("server.test", logging.INFO, __file__, 1, event, None, None)
+    record.fields = fields
+    return record
+
+
+def test_api_keys_keep_only_their_last_four_characters():
+    assert redact("api_key", "sk-0123456789abcdef") == "...cdef"
+    assert redact("API_KEY", "short") == "[redacted]"
+    assert redact("password", "hunter2") == "[redacted]"
+    assert redact("user_id", 7) == 7
+
+
+def test_secrets_nested_in_payloads_are_redacted():
+    payload = {"api_key": "sk-0123456789abcdef", "env_json": {"OPENAI_API_KEY": "x"},
+               "sessions": [{"api_key": "sk-fedcba9876543210", "name": "a"}]}
+    assert redact("payload", payload) == {"api_key": "...cdef", "env_json": "[redacted]",
+                                          "sessions": [{"api_key": "...3210", "name": "a"}]}
+
+
+def test_long_fields_are_capped():
+    assert render_field("text", "x" * 20, 8) == "xxxxxxxx...(+12 chars)"
+    assert render_field("payload", {"a": 1}, 512) == '{"a":1}'
+
+
+def test_json_lines_carry_the_event_and_redacted_fields():
+    line = StructuredFormatter("json").format(_record("api_key_created", user_id=7, api_key="sk-0123456789abcdef"))
+    entry = json.loads(line)
+    assert entry["event"] == "api_key_created" and entry["level"] == "INFO"
+    assert entry["user_id"] == 7 and entry["api_key"] == "...cdef"
+
+
+def test_text_format_renders_key_value_pairs():
+    line = StructuredFormatter("text").format(_record("agent_saved", agent="support", id=3))
+    assert line.endswith("INFO server.test agent_saved agent=support id=3")
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    for _ in range(3):
+        handler.emit(_record("event"))
+    assert handler.dropped == 2
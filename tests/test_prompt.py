@@ -0,0 +1,84 @@
+from server.core.prompt import (PromptBuilder, SummaryStore, compress_turn, create_prompt_builder,
+                                estimate_tokens, legacy_prompt, truncate)
+
+
+def _turn(i, words=60):
+    return f"User: question {i} about the order\nAI: " + " ".join(f"answer{i}-{w}" for w in range(words)) + "."
+
+
+def test_truncate_marks_the_cut():
+    text = "one two three four five six seven eight nine ten " * 10
+    cut = truncate(text, 10)
+    assert cut.endswith(" ...")
+    assert estimate_tokens(cut) <= 10
+    assert truncate("short", 10) == "short"
+
+
+def test_compress_turn_keeps_the_question():
+    turn = _turn(1, words=200)
+    compressed = compress_turn(turn, 60)
+    assert compressed.startswith("User: question 1 about the order\nAI: answer1-0")
+    assert estimate_tokens(compressed) <= 60
+
+
+def test_prompt_fits_the_budget(dynamo):
+    builder = PromptBuilder(SummaryStore(dynamo), budget=300, turn_tokens=120, summary_tokens=60)
+    retrieved = [_turn(i) for i in range(10)]
+    prompt = builder.build("agent", "Where is my order?", retrieved)
+
+    assert estimate_tokens(prompt) <= 300
+    assert "current query from user : Where is my order?" in prompt
+    # Most relevant first; the rest were dropped, not squeezed to nothing
+    assert "question 0 " in prompt
+    assert "question 9 " not in prompt
+
+
+def test_query_is_never_cut(dynamo):
+    query = "word " * 500
+    prompt = PromptBuilder(None, budget=100, turn_tokens=50, summary_tokens=0).build("agent", query, [_turn(1)])
+    assert query in prompt
+    assert "question 1" not in prompt
+
+
+def test_summary_covers_turns_not_sent_in_full(dynamo):
+    builder = PromptBuilder(SummaryStore(dynamo), budget=2000, turn_tokens=400, summary_tokens=300)
+    history = [_turn(i, words=5) for i in range(4)]
+    builder.remember("agent", history)
+    prompt = builder.build("agent", "hi", history[3:])
+
+    summary = prompt.split("CONVERSATION SUMMARY:\n", 1)[1].split("PAST INTERACTIONS:", 1)[0]
+    assert [line.split(" about")[0] for line in summary.strip().splitlines()] == [
+        "- Q: question 0", "- Q: question 1", "- Q: question 2"]
+
+
+def test_build_does_not_write_the_summary(dynamo):
+    builder = PromptBuilder(SummaryStore(dynamo), budget=2000, turn_tokens=400, summary_tokens=300)
+    builder.remember("agent", [_turn(1, words=5)])
+    writes = []
+    dynamo.add_item = lambda *args, **kwargs: writes.append(args)
+
+    prompt = builder.build("agent", "hi", [_turn(2, words=5)])
+    assert "- Q: question 1" in prompt
+    assert writes == []
+
+
+def test_summaries_from_two_workers_are_merged(dynamo):
+    first, second = SummaryStore(dynamo), SummaryStore(dynamo)
+    first.fold("agent", [_turn(1, words=3)])
+    second.get("agent")  # Read before the next write, so its copy is stale
+    first.fold("agent", [_turn(2, words=3)])
+    second.fold("agent", [_turn(3, words=3)])
+
+    stored = SummaryStore(dynamo).get("agent")
+    assert [line.split(" about")[0] for _, line in stored.lines] == [
+        "- Q: question 1", "- Q: question 2", "- Q: question 3"]
+
+
+def test_legacy_prompt_is_the_default(monkeypatch, dynamo):
+    monkeypatch.delenv("PROMPT_TOKEN_BUDGET", raising=False)
+    assert create_prompt_builder(dynamo) is None
+    monkeypatch.setenv("PROMPT_TOKEN_BUDGET", "500")
+    assert create_prompt_builder(dynamo).budget == 500
+
+    prompt = legacy_prompt("hi", ["first", "second"])
+    assert prompt.endswith("PAST INTERACTIONS:\nfirst\n\n\nsecond")
@@ -0,0 +1,122 @@
+import json
+import time
+
+from server.utils.registry import components
+
+
+def _create_agent(client, api_key, name="support"):
+    response = client.post("/create_session", json={"api_key": api_key, "character_file": "{}",
+                                                    "multi_agent_main_name": name,
+                                                    "multiple_agents_name": ["helper"]})
+    assert response.status_code == 201
+
+
+def _failing(path, body):
+    return 500, {"error": "backend down"}
+
+
+def _query(client, text="Where is my order?", name="support"):
+    return client.post("/query", json={"agent_name": name, "query": text, "extra_tool_key": "k"})
+
+
+def test_query_answers_from_both_backends_and_saves_the_turn(client, api_key):
+    _create_agent(client, api_key)
+    response = _query(client)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["data1"][0]["text"].startswith("eliza reply to:")
+    assert body["extra_tool_response"]["result"].startswith("tools result for:")
+    assert "partial" not in body
+
+    history = components.get("history")
+    assert history.writer.flush()
+    [turn] = history.recent("support")
+    assert turn.startswith("User: Where is my order?\nAI: eliza reply to:")
+
+
+def test_backends_are_called_concurrently(client, backends, api_key):
+    _create_agent(client, api_key)
+    eliza, tools = backends.eliza.respond, backends.tools.respond
+    backends.eliza.respond = lambda path, body: (time.sleep(0.3), eliza(path, body))[1]
+    backends.tools.respond = lambda path, body: (time.sleep(0.3), tools(path, body))[1]
+
+    started = time.monotonic()
+    assert _query(client).status_code == 200
+    assert time.monotonic() - started < 0.55
+
+
+def test_one_failed_backend_gives_a_partial_answer(client, backends, api_key):
+    _create_agent(client, api_key)
+    backends.tools.respond = _failing
+
+    response = _query(client)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["partial"] is True and list(body["unavailable"]) == ["tools"]
+    assert body["data1"] and body["extra_tool_response"] is None
+
+
+def test_both_backends_failing_is_a_bad_gateway(client, backends, api_key):
+    _create_agent(client, api_key)
+    backends.eliza.respond = backends.tools.respond = _failing
+
+    response = _query(client)
+    assert response.status_code == 502
+    assert components.get("history").recent("support") == []
+
+
+def test_unknown_agent_is_not_found(client):
+    assert _query(client, name="nobody").status_code == 404
+
+
+def _events(response):
+    events = []
+    for block in response.get_data(as_text=True).strip().split("\n\n"):
+        event, data = block.split("\n", 1)
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def _stream(client, text="Where is my order?", name="support"):
+    return client.post("/query/stream", json={"agent_name": name, "query": text, "extra_tool_key": "k"})
+
+
+def test_stream_sends_each_backend_as_it_answers(client, backends, api_key):
+    _create_agent(client, api_key)
+    tools = backends.tools.respond
+    backends.tools.respond = lambda path, body: (time.sleep(0.2), tools(path, body))[1]
+
+    response = _stream(client)
+    assert response.mimetype == "text/event-stream"
+    events = _events(response)
+
+    assert [name for name, _ in events] == ["eliza", "tools", "done"]
+    assert events[0][1]["data1"][0]["text"].startswith("eliza reply to:")
+    assert events[1][1]["extra_tool_response"]["result"].startswith("tools result for:")
+    assert events[2][1] == {"status": "success", "partial": False}
+    assert components.get("history").recent("support")
+
+
+def test_stream_reports_a_failed_backend_and_finishes(client, backends, api_key):
+    _create_agent(client, api_key)
+    backends.eliza.respond = _failing
+
+    events = dict(_events(_stream(client)))
+    assert events["eliza"]["status"] == "error"
+    assert events["tools"]["status"] == "success"
+    assert events["done"] == {"status": "success", "partial": True}
+
+
+def test_stream_ends_with_an_error_when_no_backend_answers(client, backends, api_key):
+    _create_agent(client, api_key)
+    backends.eliza.respond = backends.tools.respond = _failing
+
+    events = _events(_stream(client))
+    assert events[-1] == ("error", {"status": "error", "message": "No response from either API"})
+    assert "done" not in dict(events)
+
+
+def test_stream_of_an_unknown_agent_is_a_plain_404(client):
+    response = _stream(client, name="nobody")
+    assert response.status_code == 404 and response.mimetype == "application/json"
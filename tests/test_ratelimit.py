@@ -0,0 +1,28 @@
+from server.utils.ratelimit import Limit, MemoryBuckets, RateLimiter
+
+
+def test_bucket_refills_over_time():
+    buckets = MemoryBuckets()
+    assert buckets.take("k", rate=1000.0, burst=1.0) == 0.0
+    assert buckets.take("k", rate=1000.0, burst=1.0) > 0
+    assert buckets.take("k", rate=1000.0, burst=1.0, cost=-5.0) == 0.0
+    # Refunds never overfill the bucket
+    assert buckets.take("k", rate=0.001, burst=1.0) == 0.0
+    assert buckets.take("k", rate=0.001, burst=1.0) > 0
+
+
+def test_concurrency_rejects_do_not_spend_tokens():
+    limiter = RateLimiter(MemoryBuckets(), {"query": Limit(0.001, 2.0, 1)})
+    assert limiter.admit("query", "agent:a").allowed
+    for _ in range(3):
+        assert limiter.admit("query", "agent:a").reason == "concurrency"
+    limiter.release("query", "agent:a")
+    # One token is left for the next request
+    assert limiter.admit("query", "agent:a").allowed
+    limiter.release("query", "agent:a")
+    assert limiter.admit("query", "agent:a").reason == "rate_limited"
+
+
+def test_unknown_policies_are_not_limited():
+    limiter = RateLimiter(MemoryBuckets(), {})
+    assert all(limiter.admit("other", "ip:1").allowed for _ in range(10))
@@ -0,0 +1,44 @@
+import pytest
+
+from server.utils.records import AgentRecord, AgentToolMapping, HistoryTurn, decode_value
+
+
+def test_items_round_trip():
+    item = {"id": {"N": "3"}, "user_id": {"N": "7"}, "agent_main_name": {"S": "support"},
+            "agent_list": {"S": '["helper"]'}, "date_created": {"S": "2024-01-01"}, "is_active": {"BOOL": True}}
+    agent = AgentRecord.from_item(item)
+    assert agent.id == 3 and agent.user_id == 7 and agent.is_active is True
+    assert agent.to_item() == item
+
+    mapping = AgentToolMapping(multi_agent_main_name="support", history=["a", "b"])
+    assert mapping.to_item()["history"] == {"L": [{"S": "a"}, {"S": "b"}]}
+    assert AgentToolMapping.from_item(mapping.to_item()) == mapping
+
+
+def test_projected_items_leave_optional_fields_unset():
+    agent = AgentRecord.from_item({"id": {"N": "3"}, "agent_main_name": {"S": "support"}})
+    assert agent.user_id is None and agent.agent_list is None
+    # None is left out rather than written as an attribute
+    assert agent.to_item() == {"id": {"N": "3"}, "agent_main_name": {"S": "support"}}
+
+
+def test_missing_required_fields_raise():
+    with pytest.raises(KeyError):
+        HistoryTurn.from_item({"multi_agent_main_name": {"S": "support"}, "turn": {"S": "hi"}})
+
+
+def test_bulk_conversion():
+    items = [{"id": {"N": str(i)}, "agent_main_name": {"S": f"a{i}"}} for i in range(3)]
+    assert [a.id for a in AgentRecord.from_items(items)] == [0, 1, 2]
+    assert [a.agent_main_name for a in AgentRecord.iter_items(items)] == ["a0", "a1", "a2"]
+    assert AgentRecord.to_items(AgentRecord.from_items(items)) == items
+
+
+def test_records_are_slotted():
+    with pytest.raises(AttributeError):
+        AgentRecord(id=1).extra = True
+
+
+def test_decode_value():
+    assert decode_value({"L": [{"S": "a"}, {"N": "2"}, {"BOOL": False}]}) == ["a", 2, False]
+    assert decode_value({"NULL": True}) is None
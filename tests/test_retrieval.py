@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from server.core.retrieval import RetrievalEngine
+
+
+def _engine(texts, vectors, **kwargs):
+    engine = RetrievalEngine(**kwargs)
+    engine.sync(texts, vectors)
+    return engine
+
+
+def _exact(vectors, query, k):
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return list(np.argsort(-(unit @ (query / np.linalg.norm(query))), kind="stable")[:k])
+
+
+@pytest.fixture
+def corpus():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 32)).astype(np.float32)
+    return [f"turn {i}" for i in range(500)], vectors, rng.standard_normal(32).astype(np.float32)
+
+
+def test_ranks_by_cosine_similarity(corpus):
+    texts, vectors, query = corpus
+    engine = _engine(texts, vectors, faiss_threshold=10 ** 6, prefilter_min=0)
+    assert engine.search(query, 5) == _exact(vectors, query, 5)
+
+
+def test_ranking_ignores_vector_length():
+    vectors = np.array([[1.0, 0.0], [10.0, 10.0], [0.0, 3.0]], dtype=np.float32)
+    engine = _engine(["x", "diagonal", "y"], vectors, faiss_threshold=10 ** 6, prefilter_min=0)
+    assert engine.search([1.0, 0.2], 3) == [0, 1, 2]
+    assert engine.similarity([1.0, 0.0], [0, 2]) == pytest.approx([1.0, 0.0])
+
+
+def test_appended_turns_are_searched(corpus):
+    texts, vectors, query = corpus
+    engine = _engine(texts[:100], vectors[:100], faiss_threshold=10 ** 6, prefilter_min=0)
+    engine.search(query, 4)
+    engine.sync(texts, vectors)
+    assert engine.search(query, 4) == _exact(vectors, query, 4)
+
+
+def test_faiss_agrees_with_numpy(corpus):
+    pytest.importorskip("faiss")
+    texts, vectors, query = corpus
+    exact = _engine(texts, vectors, faiss_threshold=10 ** 6, prefilter_min=0)
+    indexed = _engine(texts, vectors, faiss_threshold=1, prefilter_min=0)
+    assert indexed.search(query, 5) == exact.search(query, 5)
+
+
+def test_lexical_prefilter_keeps_keyword_matches():
+    texts = ["refund for order 17", "shipping delay", "password reset", "refund policy"]
+    vectors = np.eye(4, dtype=np.float32)
+    engine = _engine(texts, vectors, faiss_threshold=10 ** 6, prefilter_min=1, prefilter_candidates=2)
+    # The vector prefers "password reset", but only the refund turns mention the query's words
+    assert sorted(engine.search([0.1, 0.0, 1.0, 0.2], 2, "refund")) == [0, 3]
+
+
+def test_mmr_prefers_diverse_turns():
+    vectors = np.array([[1.0, 0.0], [0.99, 0.01], [0.6, 0.8]], dtype=np.float32)
+    plain = _engine(["a", "a again", "b"], vectors, faiss_threshold=10 ** 6, prefilter_min=0)
+    diverse = _engine(["a", "a again", "b"], vectors, faiss_threshold=10 ** 6, prefilter_min=0, mmr_lambda=0.5)
+    assert plain.search([1.0, 0.3], 2) == [1, 0]
+    # The near-copy of the best turn adds little; the next distinct one is picked instead
+    assert diverse.search([1.0, 0.3], 2) == [1, 2]
+
+
+def test_empty_index_returns_nothing():
+    engine = _engine([], np.zeros((0, 4), dtype=np.float32))
+    assert engine.search([1.0, 0.0, 0.0, 0.0], 3) == []
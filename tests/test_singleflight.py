@@ -0,0 +1,71 @@
+import copy
+import threading
+import time
+
+import pytest
+
+from server.utils.singleflight import SingleFlight
+
+
+def _concurrent(flight, key, fn, callers, **kwargs):
+    """Run ``callers`` calls of ``key`` that all join the first one; returns their results or errors"""
+    results, release = [], threading.Event()
+
+    def leader_fn():
+        release.wait(2)
+        return fn()
+
+    def call(run):
+        try:
+            results.append(flight.do(key, run, **kwargs))
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=call, args=(leader_fn,))]
+    threads[0].start()
+    while not flight.in_flight():
+        time.sleep(0.001)
+    threads += [threading.Thread(target=call, args=(fn,)) for _ in range(callers - 1)]
+    for thread in threads[1:]:
+        thread.start()
+    while flight._calls[key].followers < callers - 1:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_callers_share_one_call():
+    calls = []
+    flight = SingleFlight("test")
+    results = _concurrent(flight, "k", lambda: calls.append(1) or len(calls), callers=5)
+    assert results == [1] * 5 and calls == [1]
+    assert flight.in_flight() == 0
+
+
+def test_errors_are_shared_too():
+    def fail():
+        raise LookupError("gone")
+    results = _concurrent(SingleFlight("test"), "k", fail, callers=3)
+    assert len(results) == 3 and all(isinstance(r, LookupError) for r in results)
+
+
+def test_followers_get_clones():
+    value = {"items": [1]}
+    results = _concurrent(SingleFlight("test"), "k", lambda: value, callers=3, clone=copy.deepcopy)
+    assert sum(r is value for r in results) == 1
+    assert all(r == value for r in results)
+
+
+def test_nothing_is_cached_between_calls():
+    calls = []
+    flight = SingleFlight("test")
+    assert flight.do("k", lambda: calls.append(1) or len(calls)) == 1
+    assert flight.do("k", lambda: calls.append(1) or len(calls)) == 2
+    assert flight.do("other", lambda: "other") == "other"
+
+
+def test_leader_error_reaches_the_leader():
+    with pytest.raises(ZeroDivisionError):
+        SingleFlight("test").do("k", lambda: 1 / 0)
@@ -0,0 +1,72 @@
+import json
+import os
+
+import numpy as np
+
+from server.core.vector_index import VectorIndexStore
+
+
+def _vectors(rows, dim=4, start=0):
+    return np.arange(start, start + rows * dim, dtype=np.float32).reshape(rows, dim)
+
+
+def _save(store, agent_name, texts, vectors):
+    index = store.get(agent_name)
+    with index.lock:
+        index.add(texts, vectors)
+        store.save(index)
+    return index
+
+
+def test_saved_index_is_loaded_back_memory_mapped(tmp_path):
+    _save(VectorIndexStore(str(tmp_path)), "support", ["a", "b"], _vectors(2))
+
+    loaded = VectorIndexStore(str(tmp_path)).get("support")
+    assert loaded.texts == ["a", "b"]
+    assert isinstance(loaded.vectors, np.memmap)
+    np.testing.assert_array_equal(loaded.vectors, _vectors(2))
+    assert loaded.missing(["b", "c", "c"]) == ["c"]
+
+
+def test_saves_write_new_vector_files_and_keep_one_previous(tmp_path):
+    store = VectorIndexStore(str(tmp_path))
+    index = _save(store, "support", ["a"], _vectors(1))
+    for i, text in enumerate(["b", "c", "d"]):
+        with index.lock:
+            index.add([text], _vectors(1, start=10 * (i + 1)))
+            store.save(index)
+
+    vector_files = sorted(f for f in os.listdir(tmp_path) if f.endswith(".f32"))
+    assert len(vector_files) == 2 and len(index.files) == 2
+    with open(store._path("support") + ".json") as f:
+        meta = json.load(f)
+    assert meta["vectors"] == os.path.basename(index.files[0])
+    assert meta["rows"] == 4 and meta["dim"] == 4
+
+
+def test_only_the_newest_turns_are_kept(tmp_path):
+    store = VectorIndexStore(str(tmp_path), max_entries=2)
+    _save(store, "support", ["a", "b", "c"], _vectors(3))
+
+    loaded = VectorIndexStore(str(tmp_path)).get("support")
+    assert loaded.texts == ["b", "c"]
+    np.testing.assert_array_equal(loaded.vectors, _vectors(3)[1:])
+
+
+def test_sidecar_that_does_not_match_its_vectors_is_discarded(tmp_path):
+    store = VectorIndexStore(str(tmp_path))
+    index = _save(store, "support", ["a", "b"], _vectors(2))
+    with open(index.files[0], "r+b") as f:
+        f.truncate(8)
+
+    assert len(VectorIndexStore(str(tmp_path)).get("support")) == 0
+
+
+def test_emptied_index_removes_its_sidecar(tmp_path):
+    store = VectorIndexStore(str(tmp_path))
+    index = _save(store, "support", ["a"], _vectors(1))
+    with index.lock:
+        index.retain([])
+        store.save(index)
+
+    assert len(VectorIndexStore(str(tmp_path)).get("support")) == 0
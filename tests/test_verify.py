@@ -0,0 +1,24 @@
+from server.core.verify import ApiVerify
+from server.utils.records import ApiKeyRecord
+
+
+def _counting(dynamo):
+    lookups, lookup = [], dynamo.get_api_key_item
+    dynamo.get_api_key_item = lambda table, key: lookups.append(key) or lookup(table, key)
+    return lookups
+
+
+def test_valid_keys_are_cached(dynamo, api_key):
+    lookups = _counting(dynamo)
+    verifier = ApiVerify(dynamo, "api_keys")
+    assert verifier.verify(api_key) and verifier.verify(api_key)
+    assert verifier.lookup(api_key).user_id == 7
+    assert lookups == [api_key]
+
+
+def test_a_key_that_shows_up_late_is_accepted_at_once(dynamo):
+    verifier = ApiVerify(dynamo, "api_keys")
+    assert not verifier.verify("late-key")
+    # The index catches up without the key being invalidated through ApiVerify
+    dynamo.add_item("api_keys", ApiKeyRecord(id=99, user_id=3, api_key="late-key", is_active=True).to_item())
+    assert verifier.verify("late-key")